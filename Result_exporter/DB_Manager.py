@@ -0,0 +1,98 @@
+import psycopg2
+
+# columns of experimentation_config that are not input parameters of the model, as listed by the SEA
+NON_PARAMETER_COLUMNS = ['simulation_id', 'timestamp_init', 'timestamp_end', 'state', 'label', 'failure_count',
+                         'lease_expires_at', 'predicted_runtime']
+
+# data types of the input parameters. The SGA stores them as double precision, but experimentations created by
+# other tools may use any numeric type
+PARAMETER_DATA_TYPES = ('double precision', 'real', 'numeric', 'bigint', 'integer', 'smallint')
+
+# columns of simulation_results that are not output variables
+NON_OUTPUT_COLUMNS = ['simulation_id', 'sea_id', 'execution_time', 'label']
+
+
+def get_table_columns(db_config_params, table_name):
+    """ Gets the names and data types of the columns of a table of the experimentation
+
+        Args:
+            db_config_params (dict): contains the connection parameters of the database
+            table_name (str): name of the table
+
+        Returns:
+            list: contains the name and the data type of each column, sorted by name
+    """
+    conn = psycopg2.connect(**db_config_params)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT column_name, data_type FROM information_schema.columns "
+                    "WHERE table_name = %s AND table_schema = current_schema() ORDER BY column_name", (table_name,))
+        columns = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+
+    return columns
+
+
+def get_parameter_columns(db_config_params):
+    """ Gets the parameters of the model stored in experimentation_config, which are its numeric columns other than
+        the bookkeeping columns of the simulations
+
+        Args:
+            db_config_params (dict): contains the connection parameters of the database
+
+        Returns:
+            list: contains the name and the data type of each parameter
+    """
+    return [(name, data_type) for name, data_type in get_table_columns(db_config_params, 'experimentation_config')
+            if name not in NON_PARAMETER_COLUMNS and data_type in PARAMETER_DATA_TYPES]
+
+
+def get_output_params_names(db_config_params):
+    """ Gets the names of the output variables stored in simulation_results
+
+        Args:
+            db_config_params (dict): contains the connection parameters of the database
+
+        Returns:
+            list: contains the name of the output variables
+    """
+    return [name for name, data_type in get_table_columns(db_config_params, 'simulation_results')
+            if name not in NON_OUTPUT_COLUMNS]
+
+
+def stream_simulation_results(db_config_params, parameter_names, output_params_names, batch_size=1000):
+    """ Streams the results of the simulations joined with their parameters through a server-side cursor, so only one
+        batch is held in memory at a time
+
+        Args:
+            db_config_params (dict): contains the connection parameters of the database
+            parameter_names (list): names of the parameters to be read from experimentation_config
+            output_params_names (list): names of the output variables to be read from simulation_results
+            batch_size (int): number of simulations fetched at once
+
+        Yields:
+            list: contains a tuple per simulation with its id, label, execution time, SEA id, parameters and the
+                  content of the bytea column of each output variable
+    """
+    select_sql = 'SELECT r.simulation_id, r.label, r.execution_time, r.sea_id' \
+                 + ''.join(', c."{0}"'.format(name) for name in parameter_names) \
+                 + ''.join(', r."{0}"'.format(name) for name in output_params_names) \
+                 + ' FROM simulation_results r JOIN experimentation_config c USING (simulation_id) ' \
+                   'ORDER BY r.simulation_id'
+
+    conn = psycopg2.connect(**db_config_params)
+    try:
+        # a named cursor keeps the result set in the server
+        cur = conn.cursor(name='export_simulation_results')
+        cur.itersize = batch_size
+        cur.execute(select_sql)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+        cur.close()
+    finally:
+        conn.close()
@@ -0,0 +1,252 @@
+import os
+import sys
+import time
+import collections
+import multiprocessing
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from argparse import ArgumentParser
+from Config_Loader import load_environment_variables
+from DB_Manager import get_parameter_columns, get_output_params_names, stream_simulation_results
+
+# the trajectories are decoded with the codec of the SEA. It is appended, so the local modules take precedence
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Simulation_Executor_Agent'))
+
+from Result_codec import decode_trajectory
+
+# Arrow types of the PostgreSQL types of the parameters. Other types are exported as strings
+ARROW_TYPES = {'double precision': pa.float64(), 'numeric': pa.float64(), 'real': pa.float32(),
+               'bigint': pa.int64(), 'integer': pa.int32(), 'smallint': pa.int16(), 'boolean': pa.bool_()}
+
+
+def get_argument_parser():
+    """ Defines the arguments to be read by the application
+
+        Returns:
+            ArgumentParser: parser containing the input arguments of the application
+
+    """
+    parser = ArgumentParser(description="Exports the results of the simulations, joined with their parameters and "
+                                        "label, to Parquet (or Arrow) files with a column per output variable. The "
+                                        "results are streamed in batches, so the memory used does not depend on the "
+                                        "size of the experimentation.")
+    parser.add_argument("-o", "--output_dir", default='export', help="directory where the files are written")
+    parser.add_argument("--format", choices=['parquet', 'arrow'], default='parquet',
+                        help="format of the files (default: parquet)")
+    parser.add_argument("--variables", nargs='+', default=None,
+                        help="output variables to be exported (default: all of them)")
+    parser.add_argument("--batch_size", type=int, default=1000,
+                        help="simulations fetched and decoded at once (default: 1000)")
+    parser.add_argument("--rows_per_file", type=int, default=100000,
+                        help="maximum number of simulations per file (default: 100000)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="processes decoding the batches in parallel, 0 to decode them in the main process "
+                             "(default: number of CPUs)")
+    parser.add_argument("--dtype", choices=['float64', 'float32'], default='float64',
+                        help="data type of the exported samples (default: float64)")
+    parser.add_argument("--fixed_size", action="store_true",
+                        help="export the trajectories as fixed size lists. All of them must have the same number of "
+                             "samples")
+    parser.add_argument("--compression", default='zstd', help="compression of the Parquet files (default: zstd)")
+
+    return parser
+
+
+def get_base_schema(parameter_columns):
+    """ Defines the columns of the exported files besides the output variables
+
+        Args:
+            parameter_columns (list): contains the name and the PostgreSQL data type of each parameter
+
+        Returns:
+            Schema: id, label, execution time and SEA id of the simulations, followed by their parameters
+    """
+    fields = [pa.field('simulation_id', pa.int64()), pa.field('label', pa.int32()),
+              pa.field('execution_time', pa.float32()), pa.field('sea_id', pa.string())]
+    fields += [pa.field(name, ARROW_TYPES.get(data_type, pa.string())) for name, data_type in parameter_columns]
+
+    return pa.schema(fields)
+
+
+def to_arrow(values, arrow_type):
+    """ Converts the values of a column read from the database to an Arrow array
+
+        Args:
+            values (tuple): values of the column
+            arrow_type (DataType): type of the array
+
+        Returns:
+            Array: values of the column
+    """
+    if pa.types.is_floating(arrow_type):
+        # numeric columns are read as decimals
+        values = [None if value is None else float(value) for value in values]
+    elif pa.types.is_string(arrow_type):
+        values = [None if value is None else str(value) for value in values]
+
+    return pa.array(values, type=arrow_type)
+
+
+def decode_batch(rows, base_schema, output_params_names, dtype='float64', fixed_size=False):
+    """ Decodes a batch of simulations into an Arrow record batch. Each output variable becomes a list column whose
+        values are the concatenated samples of the batch
+
+        Args:
+            rows (list): contains a tuple per simulation with the columns of the base schema followed by the encoded
+                         trajectory of each output variable
+            base_schema (Schema): columns of the simulations besides the output variables
+            output_params_names (list): names of the output variables
+            dtype (str): data type of the exported samples
+            fixed_size (bool): whether the trajectories are exported as fixed size lists
+
+        Returns:
+            RecordBatch: decoded simulations
+    """
+    columns = list(zip(*rows))
+    arrays = [to_arrow(values, field.type) for values, field in zip(columns, base_schema)]
+
+    for name, values in zip(output_params_names, columns[len(base_schema):]):
+        trajectories = [decode_trajectory(data) if data is not None else np.empty(0) for data in values]
+        lengths = np.fromiter((len(trajectory) for trajectory in trajectories), dtype=np.int64,
+                              count=len(trajectories))
+        samples = pa.array(np.concatenate(trajectories).astype(dtype, copy=False))
+        if fixed_size:
+            if np.any(lengths != lengths[0]):
+                raise ValueError('The trajectories of {0} have different lengths, so they can not be exported as '
+                                 'fixed size lists'.format(name))
+            arrays.append(pa.FixedSizeListArray.from_arrays(samples, int(lengths[0])))
+        else:
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int32)
+            np.cumsum(lengths, out=offsets[1:])
+            arrays.append(pa.ListArray.from_arrays(pa.array(offsets), samples))
+
+    return pa.RecordBatch.from_arrays(arrays, names=base_schema.names + list(output_params_names))
+
+
+def to_picklable(rows):
+    """ Copies the bytea columns, read as memoryviews, into bytes so the rows can be sent to the decode workers
+
+        Args:
+            rows (list): rows read from the database
+
+        Returns:
+            list: rows with the bytea columns as bytes
+    """
+    return [tuple(bytes(value) if isinstance(value, memoryview) else value for value in row) for row in rows]
+
+
+class PartitionedWriter:
+    """ Writes record batches to a sequence of files (part-00000, part-00001, ...) of at most a given number of rows
+    """
+
+    def __init__(self, output_dir, file_format='parquet', rows_per_file=100000, compression='zstd'):
+        """
+            Args:
+                output_dir (str): directory where the files are written
+                file_format (str): format of the files ('parquet' or 'arrow')
+                rows_per_file (int): maximum number of rows per file
+                compression (str): compression of the Parquet files
+        """
+        self.output_dir = output_dir
+        self.file_format = file_format
+        self.rows_per_file = rows_per_file
+        self.compression = compression
+        self.schema = None
+        self.writer = None
+        self.n_files = 0
+        self.rows_in_file = 0
+        self.n_rows = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write(self, record_batch):
+        """ Writes a record batch, splitting it between files if needed
+
+            Args:
+                record_batch (RecordBatch): rows to be written
+        """
+        if self.schema is None:
+            self.schema = record_batch.schema
+        elif not record_batch.schema.equals(self.schema):
+            raise ValueError('The schema of the batch does not match the schema of the export:\n{0}'.format(
+                record_batch.schema))
+
+        offset = 0
+        while offset < record_batch.num_rows:
+            if self.writer is None:
+                self.open()
+            length = min(record_batch.num_rows - offset, self.rows_per_file - self.rows_in_file)
+            self.writer.write_batch(record_batch.slice(offset, length))
+            offset += length
+            self.rows_in_file += length
+            self.n_rows += length
+            if self.rows_in_file >= self.rows_per_file:
+                self.close()
+
+    def open(self):
+        """ Opens the next file
+        """
+        path = os.path.join(self.output_dir, 'part-{0:05d}.{1}'.format(self.n_files, self.file_format))
+        if self.file_format == 'parquet':
+            self.writer = pq.ParquetWriter(path, self.schema, compression=self.compression)
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema)
+        self.n_files += 1
+        self.rows_in_file = 0
+
+    def close(self):
+        """ Closes the current file
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            print('\t{0} simulations exported to {1} files'.format(self.n_rows, self.n_files))
+
+
+def main():
+    args = get_argument_parser().parse_args()
+    db_config_params = load_environment_variables()
+
+    parameter_columns = get_parameter_columns(db_config_params)
+    output_params_names = get_output_params_names(db_config_params)
+    if args.variables is not None:
+        unknown_variables = set(args.variables) - set(output_params_names)
+        if unknown_variables:
+            raise SystemExit('Unknown output variables: {0}'.format(', '.join(sorted(unknown_variables))))
+        output_params_names = [name for name in output_params_names if name in args.variables]
+
+    base_schema = get_base_schema(parameter_columns)
+    writer = PartitionedWriter(args.output_dir, args.format, args.rows_per_file, args.compression)
+    batches = stream_simulation_results(db_config_params, [name for name, data_type in parameter_columns],
+                                        output_params_names, args.batch_size)
+    decode_args = (base_schema, output_params_names, args.dtype, args.fixed_size)
+
+    start_time = time.time()
+    try:
+        if args.workers > 0:
+            # the batches are decoded in order by the workers while the next ones are fetched. The number of pending
+            # batches is bounded, so the memory used stays constant
+            pool = multiprocessing.get_context('spawn').Pool(args.workers)
+            pending_batches = collections.deque()
+            try:
+                for rows in batches:
+                    pending_batches.append(pool.apply_async(decode_batch, (to_picklable(rows),) + decode_args))
+                    if len(pending_batches) >= 2 * args.workers:
+                        writer.write(pending_batches.popleft().get())
+                while pending_batches:
+                    writer.write(pending_batches.popleft().get())
+            finally:
+                pool.terminate()
+        else:
+            for rows in batches:
+                writer.write(decode_batch(rows, *decode_args))
+    finally:
+        writer.close()
+
+    elapsed_time = time.time() - start_time
+    print('{0} simulations exported to {1} in {2:.1f} seconds ({3:.0f} simulations/s)'.format(
+        writer.n_rows, args.output_dir, elapsed_time, writer.n_rows / elapsed_time if elapsed_time else 0.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -21,5 +21,18 @@ def load_environment_variables_aws():
         return db_config_params
 
 
+def load_environment_variables_local():
+    """ Reads the connection parameters of the local database used by the local benchmark. Unset parameters take the
+        defaults of a local PostgreSQL server
 
+        Returns:
+            dict: contains the connection parameters of the database
+    """
+    db_config_params = {}
+    db_config_params['host'] = os.environ.get('POSTGRESQL_IP', 'localhost')
+    db_config_params['port'] = os.environ.get('POSTGRESQL_PORT', '5432')
+    db_config_params['database'] = os.environ.get('POSTGRESQL_DB_NAME', 'experimentation')
+    db_config_params['user'] = os.environ.get('POSTGRESQL_DB_USER', 'postgres')
+    db_config_params['password'] = os.environ.get('POSTGRESQL_DB_PASS', '')
 
+    return db_config_params
@@ -1,5 +1,6 @@
 import psycopg2
 import psycopg2.extras
+import psycopg2.sql
 
 
 def get_output_params_names(db_config_params):
@@ -23,6 +24,7 @@ def get_output_params_names(db_config_params):
         # select only the columns corresponding to the output parameters
         get_columns_name_sql = "SELECT column_name FROM information_schema.columns " \
                                "WHERE table_name = 'simulation_results' " \
+                               "and table_schema = current_schema() " \
                                "and column_name != 'simulation_id'" \
                                "and column_name != 'sea_id'" \
                                "and column_name != 'execution_time'" \
@@ -49,50 +51,161 @@ def get_output_params_names(db_config_params):
 
 
 
-def execute_vacuum(db_config_params, query):
-    """ Executes a given query in the database
+def create_run_schema(db_config_params, template_schema, run_schema):
+    """ Creates a schema for a new run of the experimentation stored in the template schema, replacing the schema of
+        a previous run with the same name. The tables are created empty from the template and only the configuration
+        of the simulations is copied (in implicit mode only the parameter grids), along with the solver settings and
+        the stop conditions. The type and the stored procedures are not copied: they are found in the template schema
+        through the search path of the agents (see get_run_db_config_params)
+
+        LIKE ... INCLUDING ALL does not copy foreign keys, so the references of the results and the failure registry
+        to experimentation_config are created again on the tables of the run
 
         Args:
             db_config_params (dict): contains the connection parameters of the database
-            query (str): SQL statement to be executed
+            template_schema (str): schema where the SGA stored the experimentation
+            run_schema (str): schema of the run
     """
+    tables = ['experimentation_config', 'experimentation_grid', 'simulation_results', 'simulation_failure_registry',
+              'simulation_timings', 'simulation_stops', 'solver_config', 'stop_conditions']
+    copied_tables = ('experimentation_config', 'experimentation_grid', 'solver_config', 'stop_conditions')
+    referencing_tables = ('simulation_results', 'simulation_failure_registry')
+
     conn = None
     try:
         # connect to the PostgreSQL server
         conn = psycopg2.connect(**db_config_params)
-        conn.set_isolation_level(0)
 
         # create a cursor
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur = conn.cursor()
+
+        run = psycopg2.sql.Identifier(run_schema)
+        cur.execute(psycopg2.sql.SQL('DROP SCHEMA IF EXISTS {0} CASCADE').format(run))
+        cur.execute(psycopg2.sql.SQL('CREATE SCHEMA {0}').format(run))
+
+        for table in tables:
+            cur.execute('SELECT to_regclass(%s) IS NOT NULL', ('"{0}".{1}'.format(template_schema, table),))
+            if not cur.fetchone()[0]:
+                continue
+
+            template_table = psycopg2.sql.Identifier(template_schema, table)
+            run_table = psycopg2.sql.Identifier(run_schema, table)
+            cur.execute(psycopg2.sql.SQL('CREATE TABLE {0} (LIKE {1} INCLUDING ALL)').format(run_table,
+                                                                                           template_table))
+            if table in copied_tables:
+                cur.execute(psycopg2.sql.SQL('INSERT INTO {0} SELECT * FROM {1}').format(run_table, template_table))
+            if table in referencing_tables:
+                cur.execute(psycopg2.sql.SQL('ALTER TABLE {0} ADD FOREIGN KEY (simulation_id) '
+                                             'REFERENCES {1}(simulation_id)')
+                            .format(run_table, psycopg2.sql.Identifier(run_schema, 'experimentation_config')))
+
+        # the run starts from scratch even if the template was already executed
+        cur.execute(psycopg2.sql.SQL("UPDATE {0} SET state='Not executed', timestamp_init=NULL, timestamp_end=NULL, "
+                                     "lease_expires_at=NULL, failure_count=0 WHERE state <> 'Not executed'")
+                    .format(psycopg2.sql.Identifier(run_schema, 'experimentation_config')))
+        cur.execute('SELECT to_regclass(%s) IS NOT NULL', ('"{0}".experimentation_grid'.format(run_schema),))
+        if cur.fetchone()[0]:
+            cur.execute(psycopg2.sql.SQL('UPDATE {0} SET next_offset = 0')
+                        .format(psycopg2.sql.Identifier(run_schema, 'experimentation_grid')))
+
+        # close the communication with the PostgreSQL
+        cur.close()
+        conn.commit()
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def drop_run_schema(db_config_params, run_schema):
+    """ Removes a run of the experimentation together with its results. Its cost does not depend on the number of
+        results and, unlike removing the columns of the results and running VACUUM FULL, it does not block the rest
+        of the database
+
+        Args:
+            db_config_params (dict): contains the connection parameters of the database
+            run_schema (str): schema of the run
+    """
+    conn = None
+    try:
+        # connect to the PostgreSQL server
+        conn = psycopg2.connect(**db_config_params)
 
-        # execute query
-        cur.execute(query)
+        # create a cursor
+        cur = conn.cursor()
+        cur.execute(psycopg2.sql.SQL('DROP SCHEMA IF EXISTS {0} CASCADE').format(psycopg2.sql.Identifier(run_schema)))
 
         # close the communication with the PostgreSQL
         cur.close()
-    except psycopg2.ProgrammingError as err:
-        print(err)
-        pass
+        conn.commit()
     finally:
         if conn is not None:
-            conn.commit()
             conn.close()
 
 
-def generate_remove_columns_query(output_params):
-    initial_query = 'ALTER TABLE simulation_results '
+def get_run_search_path(template_schema, run_schema):
+    """ Gets the search path used by the agents executing a run: the tables are found in the schema of the run and the
+        type and the stored procedures in the template schema
+
+        Args:
+            template_schema (str): schema where the SGA stored the experimentation
+            run_schema (str): schema of the run
+
+        Returns:
+            str: search path (value of POSTGRESQL_SCHEMA)
+    """
+    return '{0},{1}'.format(run_schema, template_schema)
+
+
+def get_run_db_config_params(db_config_params, template_schema, run_schema):
+    """ Gets the connection parameters used to query a run
+
+        Args:
+            db_config_params (dict): contains the connection parameters of the database
+            template_schema (str): schema where the SGA stored the experimentation
+            run_schema (str): schema of the run
+
+        Returns:
+            dict: contains the connection parameters of the database with the search path of the run
+    """
+    return dict(db_config_params, options='-c search_path={0}'.format(get_run_search_path(template_schema,
+                                                                                          run_schema)))
+
+
+def get_benchmark_statistics(db_config_params):
+    """ Gets the number of executed simulations and the distribution of the claim latency of the last execution of
+        the experimentation
+
+        Args:
+            db_config_params (dict): contains the connection parameters of the database
 
-    # the dynamic part of the query depends on the output parameters specified by the user
-    dynamic_query = ",".join('DROP COLUMN "' + variable_name + '"' for variable_name in output_params)
+        Returns:
+            dict: contains the number of executed simulations ('executed') and the percentiles of the claim latency in
+                  seconds ('claim_p50', 'claim_p90', 'claim_p99'), which are None if no timings are stored
+    """
+    conn = None
+    try:
+        # connect to the PostgreSQL server
+        conn = psycopg2.connect(**db_config_params)
 
-    final_create_table_sql = initial_query + dynamic_query
+        # create a cursor
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-    return final_create_table_sql
+        cur.execute("SELECT count(*) AS executed FROM experimentation_config WHERE state = 'Executed'")
+        statistics = dict(cur.fetchone())
+        statistics.update(claim_p50=None, claim_p90=None, claim_p99=None)
 
+        cur.execute("SELECT to_regclass('simulation_timings') IS NOT NULL AS has_timings")
+        if cur.fetchone()['has_timings']:
+            cur.execute("SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY claim_time) AS claim_p50, "
+                        "percentile_cont(0.9) WITHIN GROUP (ORDER BY claim_time) AS claim_p90, "
+                        "percentile_cont(0.99) WITHIN GROUP (ORDER BY claim_time) AS claim_p99 "
+                        "FROM simulation_timings")
+            statistics.update(cur.fetchone())
 
-def truncate_database(db_config_params):
-    output_params = get_output_params_names(db_config_params)
-    query = generate_remove_columns_query(output_params)
-    execute_query(db_config_params, query)
-    execute_vacuum(db_config_params, "VACUUM FULL")
+        # close the communication with the PostgreSQL
+        cur.close()
+    finally:
+        if conn is not None:
+            conn.close()
 
+    return statistics
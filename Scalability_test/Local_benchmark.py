@@ -0,0 +1,171 @@
+import os
+import sys
+import csv
+import time
+import yaml
+import statistics
+import subprocess
+from argparse import ArgumentParser
+from DB_Manager import create_run_schema, drop_run_schema, get_run_search_path, get_run_db_config_params, \
+    get_benchmark_statistics
+from Config_Loader import load_environment_variables_local
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SEA_DIR = os.path.join(ROOT_DIR, 'Simulation_Executor_Agent')
+
+
+def get_argument_parser():
+    """ Defines the arguments to be read by the application
+
+        Returns:
+            ArgumentParser: parser containing the input arguments of the application
+
+    """
+    parser = ArgumentParser(description="Runs the scalability test on a single machine against a local PostgreSQL "
+                                        "database, without Kubernetes. The experimentation must have been stored in "
+                                        "the database by the SGA beforehand: each run is executed on a copy of it in "
+                                        "its own schema.")
+    parser.add_argument("-m", "--model_path", default=os.path.join(SEA_DIR, 'model', 'Academic_model.fmu'),
+                        help="FMU executed by the SEAs (default: the bundled Academic_model.fmu)")
+    parser.add_argument("--synthetic_runtime", type=float, default=None,
+                        help="run synthetic agents whose simulations last the given time (in seconds) instead of the "
+                             "SEA. They use the same database layer but do not require PyFMI")
+    parser.add_argument("--agents", type=int, nargs='+', default=[32, 16, 8, 4, 2, 1],
+                        help="numbers of agents to be tested (default: 32 16 8 4 2 1)")
+    parser.add_argument("--iterations", type=int, default=3, help="runs of each number of agents (default: 3)")
+    parser.add_argument("--job_file", default='data/simulation_executor-agent-job.yaml',
+                        help="Kubernetes job whose environment variables are passed to the agents")
+    parser.add_argument("--template_schema", default='public',
+                        help="schema where the SGA stored the experimentation (default: public)")
+    parser.add_argument("--keep_runs", action="store_true",
+                        help="keep the schema of each run (with its results) instead of removing it")
+    parser.add_argument("--output", default='logs/local_benchmark.csv', help="CSV file where the results are stored")
+
+    return parser
+
+
+def get_agent_environment(job_file, db_config_params):
+    """ Builds the environment of the agents from the environment variables of the Kubernetes job, replacing the
+        connection parameters with those of the local database
+
+        Args:
+            job_file (str): path of the Kubernetes job
+            db_config_params (dict): contains the connection parameters of the local database
+
+        Returns:
+            dict: environment of the agents
+    """
+    with open(job_file) as f:
+        job = yaml.safe_load(f)
+
+    environment = dict(os.environ)
+    for variable in job['spec']['template']['spec']['containers'][0]['env']:
+        environment[variable['name']] = str(variable['value'])
+
+    environment['POSTGRESQL_IP'] = db_config_params['host']
+    environment['POSTGRESQL_PORT'] = str(db_config_params['port'])
+    environment['POSTGRESQL_DB_NAME'] = db_config_params['database']
+    environment['POSTGRESQL_DB_USER'] = db_config_params['user']
+    environment['POSTGRESQL_DB_PASS'] = db_config_params['password']
+    # the FMU cache of the job is a node volume, so a local directory is used instead
+    environment['FMU_CACHE_DIR'] = os.path.join(SEA_DIR, 'model', 'cache')
+
+    return environment
+
+
+def run_agents(agents_number, command, environment, log_dir):
+    """ Starts the agents and waits until all of them finish
+
+        Args:
+            agents_number (int): number of agents
+            command (list): command that starts an agent
+            environment (dict): environment of the agents
+            log_dir (str): directory where the output of each agent is stored
+
+        Returns:
+            float: time (in seconds) since the agents are started until the last one finishes
+    """
+    os.makedirs(log_dir, exist_ok=True)
+
+    start_time = time.time()
+    agents = []
+    for agent in range(agents_number):
+        log_file = open(os.path.join(log_dir, 'agent-{0}.out'.format(agent)), 'w')
+        agents.append((subprocess.Popen(command, cwd=SEA_DIR, env=environment, stdout=log_file,
+                                        stderr=subprocess.STDOUT), log_file))
+
+    for process, log_file in agents:
+        process.wait()
+        log_file.close()
+        if process.returncode != 0:
+            print('\tAgent {0} finished with exit code {1}'.format(process.pid, process.returncode))
+
+    return time.time() - start_time
+
+
+def main():
+    args = get_argument_parser().parse_args()
+    db_config_params = load_environment_variables_local()
+    environment = get_agent_environment(args.job_file, db_config_params)
+
+    if args.synthetic_runtime is not None:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Synthetic_agent.py'),
+                   '--runtime', str(args.synthetic_runtime)]
+    else:
+        command = [sys.executable, 'Simulation_Executor_Agent.py', '--model_path', os.path.abspath(args.model_path)]
+
+    results = []
+    for agents_number in args.agents:
+        for iteration in range(1, args.iterations + 1):
+            print('{0} agents on iteration {1}'.format(agents_number, iteration))
+
+            # the same simulations are executed in every run, each one in its own schema
+            run_schema = 'run_agents_{0}_iteration_{1}'.format(agents_number, iteration)
+            create_run_schema(db_config_params, args.template_schema, run_schema)
+            environment['POSTGRESQL_SCHEMA'] = get_run_search_path(args.template_schema, run_schema)
+
+            log_dir = os.path.join(os.path.dirname(args.output), 'agents-{0}'.format(agents_number),
+                                   'iteration-{0}'.format(iteration))
+            wall_time = run_agents(agents_number, command, environment, log_dir)
+
+            result = get_benchmark_statistics(get_run_db_config_params(db_config_params, args.template_schema,
+                                                                       run_schema))
+            if not args.keep_runs:
+                drop_run_schema(db_config_params, run_schema)
+            result.update(agents=agents_number, iteration=iteration, wall_time=wall_time,
+                          throughput=result['executed'] / wall_time)
+            results.append(result)
+            print('\t{0} simulations in {1:.2f} seconds ({2:.2f} simulations/s)'.format(
+                result['executed'], wall_time, result['throughput']))
+
+    # speedup and efficiency are relative to the mean throughput of the smallest number of agents
+    mean_throughput = {agents_number: statistics.mean(result['throughput'] for result in results
+                                                      if result['agents'] == agents_number)
+                       for agents_number in args.agents}
+    baseline_agents = min(args.agents)
+    for result in results:
+        result['speedup'] = mean_throughput[result['agents']] / mean_throughput[baseline_agents] * baseline_agents
+        result['efficiency'] = result['speedup'] / result['agents']
+
+    columns = ['agents', 'iteration', 'executed', 'wall_time', 'throughput', 'speedup', 'efficiency',
+               'claim_p50', 'claim_p90', 'claim_p99']
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+
+    print('\n{0:>8}{1:>14}{2:>10}{3:>12}{4:>14}'.format('agents', 'throughput', 'speedup', 'efficiency',
+                                                      'claim p99 (s)'))
+    for agents_number in args.agents:
+        agents_results = [result for result in results if result['agents'] == agents_number]
+        claims_p99 = [result['claim_p99'] for result in agents_results if result['claim_p99'] is not None]
+        claim_p99 = statistics.mean(claims_p99) if claims_p99 else float('nan')
+        result = agents_results[-1]
+        print('{0:>8}{1:>14.2f}{2:>10.2f}{3:>12.2f}{4:>14.4f}'.format(
+            agents_number, mean_throughput[agents_number], result['speedup'], result['efficiency'], claim_p99))
+    print('Results stored in {0}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
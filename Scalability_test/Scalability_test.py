@@ -1,5 +1,5 @@
 from kubernetes import client, config
-from DB_Manager import truncate_database, execute_vacuum
+from DB_Manager import create_run_schema, drop_run_schema, get_run_search_path
 from Config_Loader import load_environment_variables_aws
 import yaml
 import time
@@ -9,6 +9,8 @@ from pprint import pprint
 def main():
     config_file_path = 'data/simulation_executor-agent-job.yaml'
     root_db_name = 'experimentation'
+    # schema where the SGA stored the experimentation. Each run is executed on a copy of it in its own schema
+    template_schema = 'public'
     agents_scalability_test = [32, 16, 8, 4, 2, 1]
     status_check_interval = 5
     max_iterations = 10
@@ -35,25 +37,21 @@ def main():
                 k8s_client = client.BatchV1Api()
                 k8s_log_client = client.CoreV1Api()
 
-                # modify the configuration file according to the current scenario
-                index = None
-
-                for i in range(len(env_list)):
-                    if env_list[i]['name'] == 'POSTGRESQL_DB_NAME':
-                        index = i
-                        break
-
-                # we use a different database for each experiment
-                db_name = '{0}_agents_{1}_iteration_{2}'.format(root_db_name, agents_number, iteration)
+                # we use a different schema for each experiment, created from the template schema
+                run_schema = '{0}_agents_{1}_iteration_{2}'.format(root_db_name, agents_number, iteration)
                 job_name = 'experimentation-agents-{0}-iteration-{1}'.format(agents_number, iteration)
                 namespace = 'default'
 
-                config_file_dict['spec']['template']['spec']['containers'][0]['env'][index]['value'] = db_name
+                print('Creating schema {0}...'.format(run_schema))
+                create_run_schema(db_config_params, template_schema, run_schema)
+
+                # modify the configuration file according to the current scenario
+                env_list[:] = [env for env in env_list if env['name'] != 'POSTGRESQL_SCHEMA']
+                env_list.append({'name': 'POSTGRESQL_SCHEMA',
+                                 'value': get_run_search_path(template_schema, run_schema)})
                 config_file_dict['metadata']['name'] = job_name
                 config_file_dict['spec']['parallelism'] = agents_number
 
-                db_config_params['database'] = db_name
-
                 # launch the job in Kubernetes
                 response = k8s_client.create_namespaced_job(namespace, config_file_dict)
                 print('Job launched:{0}'.format(job_name))
@@ -103,9 +101,9 @@ def main():
 
                 # remove all the results as we are executing the same simulations repeatedly. In this experimentation,
                 # the results of the simulations are not important. We only care about execution time
-                print('Truncating database {0} to remove simulation results...'.format(db_config_params['database']))
-                truncate_database(db_config_params)
-                print('Database truncated')
+                print('Dropping schema {0} to remove simulation results...'.format(run_schema))
+                drop_run_schema(db_config_params, run_schema)
+                print('Schema dropped')
                 print('\n\n')
 
     except Exception as error:
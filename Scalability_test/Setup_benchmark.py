@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import json
+import statistics
+import numpy as np
+from argparse import ArgumentParser
+
+# the benchmark uses the model executor of the SEA, so it measures the same code path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Simulation_Executor_Agent'))
+
+from FMU_cache import load_cached_fmu
+from Model_executor import simulate_model, ModelSnapshot
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def get_argument_parser():
+    """ Defines the arguments to be read by the application
+
+        Returns:
+            ArgumentParser: parser containing the input arguments of the application
+
+    """
+    parser = ArgumentParser(description="Measures the per-simulation overhead of setting up and initializing the FMU "
+                                        "when it is reset before every simulation and when a snapshot of its state "
+                                        "is restored instead")
+    parser.add_argument("-m", "--model_path",
+                        default=os.path.join(ROOT_DIR, 'Simulation_Executor_Agent', 'model', 'Academic_model.fmu'),
+                        help="FMU to be simulated (default: the bundled Academic_model.fmu)")
+    parser.add_argument("--input_params",
+                        default=os.path.join(ROOT_DIR, 'Simulation_Generator_Agent', 'data', 'input_params.json'),
+                        help="input params file whose values are sampled for each simulation")
+    parser.add_argument("--output_params",
+                        default=os.path.join(ROOT_DIR, 'Simulation_Generator_Agent', 'data', 'output_params.json'),
+                        help="output params file with the variables to be recorded")
+    parser.add_argument("--simulations", type=int, default=200, help="simulations of each mode (default: 200)")
+    parser.add_argument("--final_time", type=float, default=0.1,
+                        help="final time of the simulations. Short simulations make the overhead visible "
+                             "(default: 0.1)")
+    parser.add_argument("--cache_dir", default=os.path.join(ROOT_DIR, 'Simulation_Executor_Agent', 'model', 'cache'),
+                        help="directory where the FMU is extracted")
+
+    return parser
+
+
+def get_parameter_sets(input_params_file, n_simulations):
+    """ Samples the parameter values of the simulations from the input params file
+
+        Args:
+            input_params_file (str): path of the input params file
+            n_simulations (int): number of parameter sets
+
+        Returns:
+            list: contains a dict with the parameters of each simulation
+    """
+    with open(input_params_file) as f:
+        input_params = json.load(f)[0]
+
+    random_state = np.random.RandomState(0)
+    return [{name: float(random_state.choice(values)) for name, values in input_params.items()}
+            for _ in range(n_simulations)]
+
+
+def run(model, snapshot, parameter_sets, output_names, final_time):
+    """ Executes the simulations and collects the duration of their phases
+
+        Args:
+            model (FMUModel): loaded FMU
+            snapshot (ModelSnapshot): snapshot restored before every simulation, or None to reset the FMU
+            parameter_sets (list): contains a dict with the parameters of each simulation
+            output_names (list): names of the variables to be recorded
+            final_time (float): final time of the simulations
+
+        Returns:
+            dict: contains the durations (in seconds) of each phase and of the whole simulation ('total')
+    """
+    durations = {'setup': [], 'initialize': [], 'integrate': [], 'total': []}
+    for user_parameters in parameter_sets:
+        timings = {}
+        start_time = time.time()
+        simulate_model(model, user_parameters=user_parameters, output_names=output_names, final_time=final_time,
+                       snapshot=snapshot, timings=timings)
+        durations['total'].append(time.time() - start_time)
+        for phase in ['setup', 'initialize', 'integrate']:
+            durations[phase].append(timings[phase])
+
+    return durations
+
+
+def main():
+    args = get_argument_parser().parse_args()
+
+    with open(args.output_params) as f:
+        output_names = json.load(f)[0]['params']
+    parameter_sets = get_parameter_sets(args.input_params, args.simulations)
+
+    model, fmu_sha256 = load_cached_fmu(args.model_path, args.cache_dir)
+
+    results = {'reset': run(model, None, parameter_sets, output_names, args.final_time)}
+    snapshot = ModelSnapshot.take(model)
+    if snapshot is None:
+        print('The FMU cannot get and set its state, so only the reset path is measured')
+    else:
+        results['snapshot'] = run(model, snapshot, parameter_sets, output_names, args.final_time)
+
+    print('\nMedian duration per simulation (ms) over {0} simulations'.format(args.simulations))
+    print('{0:>10}{1:>10}{2:>12}{3:>11}{4:>10}{5:>11}'.format('mode', 'setup', 'initialize', 'integrate', 'total',
+                                                              'overhead'))
+    for mode, durations in results.items():
+        medians = {phase: 1000 * statistics.median(values) for phase, values in durations.items()}
+        print('{0:>10}{1:>10.3f}{2:>12.3f}{3:>11.3f}{4:>10.3f}{5:>11.3f}'.format(
+            mode, medians['setup'], medians['initialize'], medians['integrate'], medians['total'],
+            medians['setup'] + medians['initialize']))
+
+    if 'snapshot' in results:
+        overhead = {mode: statistics.median(np.add(durations['setup'], durations['initialize']))
+                    for mode, durations in results.items()}
+        print('\nPer-simulation overhead reduced {0:.2f}x'.format(overhead['reset'] / overhead['snapshot']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import string
+import numpy as np
+from random import choice
+from argparse import ArgumentParser
+
+# the synthetic agent uses the database layer of the SEA, so it exercises the same queries without requiring PyFMI
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Simulation_Executor_Agent'))
+
+from DB_Manager import lease_simulation_configs, has_parameter_grids, has_simulation_timings, \
+    get_output_params_names, insert_simulation_results, update_simulation_state, check_failed_simulations, \
+    release_simulation_configs
+from DB_Session import DBSession
+from Config_Loader import load_environment_variables
+from Timing_recorder import TimingRecorder
+
+
+def get_argument_parser():
+    """ Defines the arguments to be read by the application
+
+        Returns:
+            ArgumentParser: parser containing the input arguments of the application
+
+    """
+    parser = ArgumentParser()
+    parser.add_argument("--runtime", type=float, default=0.1,
+                        help="time (in seconds) each synthetic simulation keeps the CPU busy (default: 0.1)")
+    parser.add_argument("--points", type=int, default=501,
+                        help="number of points of each synthetic output trajectory (default: 501)")
+
+    return parser
+
+
+def simulate(runtime, output_params_names, points):
+    """ Stand-in of a simulation: keeps the CPU busy for the given time and returns random trajectories
+
+        Args:
+            runtime (float): time (in seconds) the simulation lasts
+            output_params_names (list): names of the output variables
+            points (int): number of points of each trajectory
+
+        Returns:
+            dict: contains an array with the results of each output variable
+    """
+    deadline = time.time() + runtime
+    while time.time() < deadline:
+        np.sqrt(np.arange(1000, dtype=np.float64))
+
+    return {name: np.random.random(points) for name in output_params_names}
+
+
+def main():
+    args = get_argument_parser().parse_args()
+    db_config_params, simulation_environment_variables = load_environment_variables()
+
+    db_session = DBSession(db_config_params)
+    output_params_names = get_output_params_names(db_session)
+    sea_id = "".join(choice(string.ascii_letters + string.digits) for x in range(8))
+
+    lease_size = int(simulation_environment_variables['lease_size'])
+    lease_duration = int(simulation_environment_variables['lease_duration'])
+    result_dtype = simulation_environment_variables['result_dtype']
+    result_compression = simulation_environment_variables['result_compression']
+    parameter_grids = dict() if has_parameter_grids(db_session) else None
+    timing_recorder = TimingRecorder(db_session, sea_id) if has_simulation_timings(db_session) else None
+
+    leased_simulation_configs = []
+    try:
+        while True:
+            start_time_claim = time.time()
+            leased_simulation_configs = lease_simulation_configs(db_session, lease_size, parameter_grids,
+                                                                 lease_duration)
+            if not leased_simulation_configs:
+                if check_failed_simulations(db_session, simulation_environment_variables):
+                    continue
+                break
+            claim_time = (time.time() - start_time_claim) / len(leased_simulation_configs)
+
+            while leased_simulation_configs:
+                config = leased_simulation_configs.pop(0)
+                timings = {'claim': claim_time}
+
+                start_time = time.time()
+                simulation_output = simulate(args.runtime, output_params_names, args.points)
+                timings['integrate'] = time.time() - start_time
+
+                insert_simulation_results(db_session, config['simulation_id'], sea_id, round(timings['integrate'], 3),
+                                          output_params_names, simulation_output, config['label'], result_dtype,
+                                          result_compression, timings)
+
+                start_time_update = time.time()
+                update_simulation_state(db_session, config['simulation_id'], 'Executed')
+                timings['state_update'] = time.time() - start_time_update
+
+                if timing_recorder is not None:
+                    timing_recorder.record(config['simulation_id'], timings)
+    finally:
+        if leased_simulation_configs:
+            release_simulation_configs(db_session, [config['simulation_id'] for config in leased_simulation_configs])
+        if timing_recorder is not None:
+            timing_recorder.flush()
+        db_session.print_latency_stats()
+        db_session.close()
+
+
+if __name__ == '__main__':
+    main()
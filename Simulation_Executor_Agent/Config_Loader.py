@@ -18,8 +18,42 @@ def load_environment_variables():
         db_config_params['database'] = os.environ['POSTGRESQL_DB_NAME']
         db_config_params['user'] = os.environ['POSTGRESQL_DB_USER']
         db_config_params['password'] = os.environ['POSTGRESQL_DB_PASS']
+        # optional schemas where the experimentation is stored (comma separated search path, without spaces)
+        if os.environ.get('POSTGRESQL_SCHEMA'):
+            db_config_params['options'] = '-c search_path={0}'.format(os.environ['POSTGRESQL_SCHEMA'])
         simulation_environment_variables['max_failures'] = os.environ['MAX_SIMULATION_FAILURES']
         simulation_environment_variables['time_out'] = os.environ['SIMULATION_TIME_OUT']
+
+        # optional variables
+        simulation_environment_variables['lease_size'] = os.environ.get('SIMULATION_LEASE_SIZE', '1')
+        simulation_environment_variables['fmu_cache_dir'] = os.environ.get('FMU_CACHE_DIR', 'model/')
+        simulation_environment_variables['ncp'] = os.environ.get('SIMULATION_NCP', '0')
+        simulation_environment_variables['output_interval'] = os.environ.get('SIMULATION_OUTPUT_INTERVAL', '0')
+        simulation_environment_variables['result_dtype'] = os.environ.get('RESULT_DTYPE', 'float64')
+        simulation_environment_variables['result_compression'] = os.environ.get('RESULT_COMPRESSION', 'none')
+        simulation_environment_variables['async_result_writer'] = os.environ.get('ASYNC_RESULT_WRITER', 'false')
+        simulation_environment_variables['result_writer_queue_size'] = os.environ.get('RESULT_WRITER_QUEUE_SIZE', '16')
+        simulation_environment_variables['result_writer_batch_size'] = os.environ.get('RESULT_WRITER_BATCH_SIZE', '8')
+        simulation_environment_variables['lease_duration'] = os.environ.get('LEASE_DURATION', '60')
+        simulation_environment_variables['lease_renewal_interval'] = os.environ.get('LEASE_RENEWAL_INTERVAL', '20')
+        simulation_environment_variables['isolation'] = os.environ.get('SIMULATION_ISOLATION', 'none')
+        simulation_environment_variables['worker_max_simulations'] = os.environ.get('WORKER_MAX_SIMULATIONS', '0')
+        simulation_environment_variables['worker_max_rss_mb'] = os.environ.get('WORKER_MAX_RSS_MB', '0')
+        simulation_environment_variables['worker_load_timeout'] = os.environ.get('WORKER_LOAD_TIMEOUT', '600')
+        simulation_environment_variables['metrics_port'] = os.environ.get('METRICS_PORT', '0')
+        simulation_environment_variables['record_timings'] = os.environ.get('RECORD_TIMINGS', 'true')
+        simulation_environment_variables['fmu_snapshot'] = os.environ.get('FMU_SNAPSHOT', 'true')
+        simulation_environment_variables['result_cache'] = os.environ.get('RESULT_CACHE', 'false')
+        simulation_environment_variables['result_cache_max_entries'] = os.environ.get('RESULT_CACHE_MAX_ENTRIES',
+                                                                                      '100000')
+        simulation_environment_variables['backend'] = os.environ.get('SIMULATION_BACKEND', 'pyfmi')
+        simulation_environment_variables['batch_size'] = os.environ.get('SIMULATION_BATCH_SIZE', '256')
+        simulation_environment_variables['ode_max_step'] = os.environ.get('ODE_MAX_STEP', '0.001')
+        simulation_environment_variables['runtime_scheduler'] = os.environ.get('RUNTIME_SCHEDULER', 'false')
+        simulation_environment_variables['runtime_scheduler_interval'] = os.environ.get('RUNTIME_SCHEDULER_INTERVAL',
+                                                                                        '60')
+        simulation_environment_variables['runtime_scheduler_min_results'] = os.environ.get(
+            'RUNTIME_SCHEDULER_MIN_RESULTS', '20')
     except KeyError as error:
         print("One or more environmental variables are not set. Required environmental variables:")
         print("\tPOSTGRESQL_IP")
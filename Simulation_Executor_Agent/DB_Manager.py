@@ -1,250 +1,833 @@
+import time
+import numpy as np
 import psycopg2
 import psycopg2.extras
-from collections import OrderedDict
+import psycopg2.sql
+from Result_codec import encode_trajectory
+from Parameter_space import ParameterGrid
+from Metrics import METRICS
 
+# columns of experimentation_config that are not input parameters of the model
+NON_PARAMETER_COLUMNS = ['simulation_id', 'timestamp_init', 'timestamp_end', 'state', 'label', 'failure_count',
+                         'lease_expires_at', 'predicted_runtime']
 
-def update_simulation_state(db_config_params, simulation_id, status):
+# options of the solver configuration of the experimentation
+SOLVER_CONFIG_OPTIONS = ['solver', 'rtol', 'atol', 'max_step', 'ncp', 'output_interval', 'final_time']
+
+# phases of a simulation whose duration is stored in simulation_timings (as <phase>_time columns)
+TIMING_PHASES = ['claim', 'setup', 'initialize', 'integrate', 'encode', 'insert', 'state_update']
+
+
+def update_simulation_state(db_session, simulation_id, status):
     """ Updates the state of a given simulation in the database
 
         Args:
-            db_config_params (dict): contains the connection parameters of the database
+            db_session (DBSession): persistent session to the database
             simulation_id (int): identifier of the simulation to be updated
             status (str): the new status of the corresponding simulation
     """
-    conn = None
-    try:
-        # connect to the PostgreSQL server
-        conn = psycopg2.connect(**db_config_params)
-
-        # create a cursor
-        cur = conn.cursor()
-
-        # generate the SQL statement
-        if status == 'Executed':
-            update_simulation_state_sql = "UPDATE experimentation_config SET state=%s, " \
-                                          "timestamp_end=to_char(current_timestamp, 'YYYY/MM/DD HH24:MI:SS') " \
-                                          "WHERE simulation_id=%s"
-        else:
-            update_simulation_state_sql = 'UPDATE experimentation_config SET state=%s WHERE simulation_id=%s'
-
+    # generate the SQL statements
+    db_session.prepare('update_simulation_state_executed',
+                       "UPDATE experimentation_config SET state=$1, "
+                       "timestamp_end=current_timestamp "
+                       "WHERE simulation_id=$2")
+    db_session.prepare('update_simulation_state_failed',
+                       'UPDATE experimentation_config SET state=$1, failure_count=failure_count + 1 '
+                       'WHERE simulation_id=$2')
+    db_session.prepare('update_simulation_state',
+                       'UPDATE experimentation_config SET state=$1 WHERE simulation_id=$2')
+
+    def update(cur):
         # execute the SQL statement
         variables = [status, simulation_id]
-        cur.execute(update_simulation_state_sql, variables)
+        if status == 'Executed':
+            db_session.execute_prepared(cur, 'update_simulation_state_executed', variables)
+        elif status == 'Failed':
+            db_session.execute_prepared(cur, 'update_simulation_state_failed', variables)
+        else:
+            db_session.execute_prepared(cur, 'update_simulation_state', variables)
 
-        # close the communication with the PostgreSQL
-        cur.close()
+    try:
+        db_session.run('update_simulation_state', update)
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
     finally:
         print('\tSimulation {0} marked as {1}\n\n'.format(simulation_id, status))
-        if conn is not None:
-            conn.commit()
-            conn.close()
 
 
-def get_output_params_names(db_config_params):
+def get_output_params_names(db_session):
     """ Gets the names of the output parameters from the database
 
         Args:
-            db_config_params (dict): contains the connection parameters of the database
+            db_session (DBSession): persistent session to the database
 
         Returns:
             list: contains the name of the output parameters
     """
-    conn = None
     column_names = list()
-    try:
-        # connect to the PostgreSQL server
-        conn = psycopg2.connect(**db_config_params)
-
-        # create a cursor
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
+    def get_columns_name(cur):
         # select only the columns corresponding to the output parameters
         get_columns_name_sql = "SELECT column_name FROM information_schema.columns " \
                                "WHERE table_name = 'simulation_results' " \
+                               "and table_schema = current_schema() " \
                                "and column_name != 'simulation_id'" \
                                "and column_name != 'sea_id'" \
                                "and column_name != 'execution_time'" \
                                "and column_name != 'label'"
 
         cur.execute(get_columns_name_sql)
-        column_names_result = cur.fetchall()
+        return cur.fetchall()
+
+    try:
+        column_names_result = db_session.run('get_output_params_names', get_columns_name,
+                                             cursor_factory=psycopg2.extras.RealDictCursor, idempotent=True)
 
         for column in column_names_result:
             column_names.append(column['column_name'])
 
         column_names = sorted(column_names)
-
-        # close the communication with the PostgreSQL
-        cur.close()
     except (Exception, psycopg2.DatabaseError) as error:
         raise SystemExit("Failure cause: {0}".format(error))
-    finally:
-        if conn is not None:
-            conn.commit()
-            conn.close()
 
-        return column_names
+    return column_names
+
+
+def lease_simulation_configs(db_session, lease_size, parameter_grids=None, lease_duration=60):
+    """ Leases a batch of simulations to be executed in a single round trip. Simulations locked by other agents are
+        skipped, so concurrent agents do not wait on each other. When no stored simulation is pending and the
+        experimentation has parameter grids (implicit mode), the simulations are claimed from the grids
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            lease_size (int): maximum number of simulations to be leased
+            parameter_grids (dict): parameter grids already loaded (grid id -> ParameterGrid), or None if the
+                                    experimentation has no parameter grids
+            lease_duration (int): seconds the leases last unless they are renewed
+
+        Returns:
+            list: contains the configuration of the leased simulations sorted by simulation id
+    """
+    # lease the next simulations and mark them as executing
+    db_session.prepare('lease_simulation_configs', 'SELECT * from lease_simulation_configs($1, $2)')
+
+    def lease(cur):
+        db_session.execute_prepared(cur, 'lease_simulation_configs', [lease_size, lease_duration])
+        return cur.fetchall()
+
+    leased_simulation_configs = db_session.run('lease_simulation_configs', lease,
+                                               cursor_factory=psycopg2.extras.RealDictCursor)
+
+    if not leased_simulation_configs and parameter_grids is not None:
+        leased_simulation_configs = claim_grid_simulation_configs(db_session, lease_size, parameter_grids,
+                                                                  lease_duration)
+
+    return sorted(leased_simulation_configs, key=lambda config: config['simulation_id'])
+
+
+def has_parameter_grids(db_session):
+    """ Checks whether the experimentation has parameter grids (implicit mode)
+
+        Args:
+            db_session (DBSession): persistent session to the database
+
+        Returns:
+            boolean: True if the experimentation has parameter grids
+    """
+    def check(cur):
+        cur.execute("SELECT to_regclass('experimentation_grid') IS NOT NULL")
+        return cur.fetchone()[0]
+
+    return db_session.run('has_parameter_grids', check, idempotent=True)
+
+
+def get_solver_config(db_session):
+    """ Gets the solver configuration stored with the experimentation by the SGA. The last one stored is used, so it
+        can be changed without regenerating the experimentation
+
+        Args:
+            db_session (DBSession): persistent session to the database
+
+        Returns:
+            dict: contains the options of the solver configuration that are set ('solver', 'rtol', 'atol', 'max_step',
+                  'ncp', 'output_interval' and 'final_time'). Empty if the experimentation has no solver configuration
+    """
+    def get(cur):
+        cur.execute("SELECT to_regclass('solver_config') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return {}
+        # every column is read, as tables created by previous versions lack the newer options
+        cur.execute('SELECT * FROM solver_config ORDER BY solver_config_id DESC LIMIT 1')
+        row = cur.fetchone()
+        if row is None:
+            return {}
+        columns = [column[0] for column in cur.description]
+        return {option: value for option, value in zip(columns, row)
+                if option in SOLVER_CONFIG_OPTIONS and value is not None}
+
+    return db_session.run('get_solver_config', get, idempotent=True)
+
+
+def get_stop_conditions(db_session):
+    """ Gets the stop conditions stored with the experimentation by the SGA. The last ones stored are used
+
+        Args:
+            db_session (DBSession): persistent session to the database
+
+        Returns:
+            list: contains a dict per stop condition. Empty if the experimentation has no stop conditions
+    """
+    def get(cur):
+        cur.execute("SELECT to_regclass('stop_conditions') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return []
+        cur.execute('SELECT conditions FROM stop_conditions ORDER BY stop_conditions_id DESC LIMIT 1')
+        row = cur.fetchone()
+        return row[0] if row is not None else []
+
+    return db_session.run('get_stop_conditions', get, idempotent=True)
+
+
+def has_simulation_stops(db_session):
+    """ Checks whether the database has the table where the simulations stopped by a stop condition are recorded
+
+        Args:
+            db_session (DBSession): persistent session to the database
+
+        Returns:
+            boolean: True if the database has the simulation_stops table
+    """
+    def check(cur):
+        cur.execute("SELECT to_regclass('simulation_stops') IS NOT NULL")
+        return cur.fetchone()[0]
+
+    return db_session.run('has_simulation_stops', check, idempotent=True)
+
 
+def has_simulation_timings(db_session):
+    """ Checks whether the database has the table where the durations of the phases of the simulations are stored
 
-def get_next_simulation_config(db_config_params):
-    """ Gets the configuration of the next simulation to be executed
+        Args:
+            db_session (DBSession): persistent session to the database
+
+        Returns:
+            boolean: True if the database has the simulation_timings table
+    """
+    def check(cur):
+        cur.execute("SELECT to_regclass('simulation_timings') IS NOT NULL")
+        return cur.fetchone()[0]
+
+    return db_session.run('has_simulation_timings', check, idempotent=True)
+
+
+def has_result_cache(db_session):
+    """ Checks whether the database has the result cache shared by the experimentations
+
+        Args:
+            db_session (DBSession): persistent session to the database
+
+        Returns:
+            boolean: True if the database has the result cache
+    """
+    def check(cur):
+        cur.execute("SELECT to_regclass('public.simulation_result_cache') IS NOT NULL")
+        return cur.fetchone()[0]
+
+    return db_session.run('has_result_cache', check, idempotent=True)
+
+
+def get_parameter_grid(cur, grid_id):
+    """ Reads the definition of a parameter grid
 
         Args:
-            db_config_params (dict): contains the connection parameters of the database
+            cur (cursor): cursor of the current transaction
+            grid_id (int): identifier of the grid
+
         Returns:
-            dict: contains the configuration of the next simulation to be executed
+            ParameterGrid: the parameter grid
+    """
+    cur.execute('SELECT grid_id, first_simulation_id, n_simulations, param_names, param_values, anomalous_values '
+                'FROM experimentation_grid WHERE grid_id = %s', (grid_id,))
+    grid = cur.fetchone()
+
+    return ParameterGrid(grid['grid_id'], grid['first_simulation_id'], grid['n_simulations'], grid['param_names'],
+                         grid['param_values'], grid['anomalous_values'])
+
+
+def claim_grid_simulation_configs(db_session, claim_size, parameter_grids, lease_duration=60):
+    """ Claims a block of consecutive simulations of a parameter grid (implicit mode). Their configuration is decoded
+        from their simulation id and they are inserted as 'Executing' in the same transaction, so they are handled as
+        any other simulation from then on
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            claim_size (int): maximum number of simulations to be claimed
+            parameter_grids (dict): parameter grids already loaded (grid id -> ParameterGrid). Grids read from the
+                                    database are added to it
+            lease_duration (int): seconds the leases last unless they are renewed
+
+        Returns:
+            list: contains the configuration of the claimed simulations
+    """
+    db_session.prepare('claim_grid_simulations', 'SELECT * from claim_grid_simulations($1)')
+
+    def claim(cur):
+        db_session.execute_prepared(cur, 'claim_grid_simulations', [claim_size])
+        claimed = cur.fetchone()
+        if claimed is None:
+            return []
+
+        grid_id = claimed['claimed_grid_id']
+        if grid_id not in parameter_grids:
+            parameter_grids[grid_id] = get_parameter_grid(cur, grid_id)
+        grid = parameter_grids[grid_id]
+
+        # decode the configuration of the claimed simulations
+        simulation_ids = np.arange(claimed['claimed_first_simulation_id'] + claimed['claimed_start'],
+                                   claimed['claimed_first_simulation_id'] + claimed['claimed_end'], dtype=np.int64)
+        configs = grid.decode(simulation_ids)
+
+        # insert the claimed simulations and return them as stored
+        column_names_str = ",".join('"' + name + '"' for name in grid.param_names)
+        insert_sql = 'INSERT INTO experimentation_config("simulation_id","timestamp_init","lease_expires_at",' \
+                     '"state","label",' + column_names_str + ') VALUES %s RETURNING *'
+        template = "(%s,current_timestamp,current_timestamp + " + str(int(lease_duration)) \
+                   + " * interval '1 second','Executing'," \
+                   + ",".join('%s' for i in range(len(grid.param_names) + 1)) + ")"
+        columns = [simulation_ids.tolist(), configs['label'].tolist()] \
+                  + [configs[name].tolist() for name in grid.param_names]
+
+        return psycopg2.extras.execute_values(cur, insert_sql, list(zip(*columns)), template=template,
+                                              page_size=len(simulation_ids), fetch=True)
+
+    return db_session.run('claim_grid_simulations', claim, cursor_factory=psycopg2.extras.RealDictCursor)
+
+
+def release_simulation_configs(db_session, simulation_ids):
+    """ Returns to the queue the leased simulations that have not been started, so other agents can execute them
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            simulation_ids (list): identifiers of the simulations to be released
     """
-    # connect to the PostgreSQL server
-    conn = psycopg2.connect(**db_config_params)
+    def release(cur):
+        # only simulations still marked as executing are released
+        release_simulation_configs_sql = "UPDATE experimentation_config SET state='Not executed', timestamp_init=NULL, " \
+                                         "lease_expires_at=NULL " \
+                                         "WHERE simulation_id = ANY(%s) AND state='Executing'"
+        cur.execute(release_simulation_configs_sql, (list(simulation_ids),))
 
-    # create a cursor
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        db_session.run('release_simulation_configs', release, idempotent=True)
+    except (Exception, psycopg2.DatabaseError) as error:
+        print(error)
+    finally:
+        print('\tReleased {0} leased simulations\n\n'.format(len(simulation_ids)))
 
-    # get next simulation id and mark it as executing
-    get_simulation_id_sql = 'SELECT * from get_next_simulation_config()'
-    cur.execute(get_simulation_id_sql)
-    user_parameters = cur.fetchone()
 
-    # close the communication with the PostgreSQL
-    cur.close()
+def renew_simulation_leases(db_session, simulation_ids, lease_duration):
+    """ Extends the leases of the given simulations, provided that they are still being executed
 
-    if conn is not None:
-        conn.commit()
-        conn.close()
+        Args:
+            db_session (DBSession): persistent session to the database
+            simulation_ids (list): identifiers of the simulations
+            lease_duration (int): seconds the leases last from now
+    """
+    db_session.prepare('renew_simulation_leases',
+                       "UPDATE experimentation_config "
+                       "SET lease_expires_at = current_timestamp + $2 * interval '1 second' "
+                       "WHERE simulation_id = ANY($1) AND state='Executing'")
 
-    return user_parameters
+    db_session.run('renew_simulation_leases',
+                   lambda cur: db_session.execute_prepared(cur, 'renew_simulation_leases',
+                                                           [list(simulation_ids), lease_duration]),
+                   idempotent=True)
 
 
-def insert_simulation_results(db_config_params, simulation_id, sea_id, execution_time, output_params_names,
-                              simulation_output, label):
+def insert_simulation_results(db_session, simulation_id, sea_id, execution_time, output_params_names,
+                              simulation_output, label, result_dtype='float64', result_compression='none',
+                              timings=None):
     """ Inserts into the database the results obtained after completing the simulation
 
         Args:
-            db_config_params (dict): contains the connection parameters of the database
+            db_session (DBSession): persistent session to the database
             simulation_id (int): identifier of the simulation to be updated
             sea_id (string): id of the simulation executor agent that executes the current simulation
             execution_time (int): time required to complete the simulation (in seconds)
             output_params_names (list): contains the names of the output parameters
             simulation_output (dict): contains the results of the simulation
             label: represents to which class belongs the simulation
+            result_dtype (str): data type used to store the results ('float64' or 'float32')
+            result_compression (str): compression used to store the results ('none', 'zstd' or 'lz4')
+            timings (dict): if set, the durations of the encoding and the insertion are stored in its 'encode' and
+                            'insert' keys
     """
-    # connect to the PostgreSQL server
-    conn = psycopg2.connect(**db_config_params)
-
-    # create a cursor
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-
     # create insert query
     column_names_str = ",".join('"' + variable + '"' for variable in output_params_names)
-    placeholders_str = ",".join("decode(%s, 'escape')" for i in output_params_names)
+    placeholders_str = ",".join("${0}".format(i + 4) for i in range(len(output_params_names)))
     insert_simulation_results_sql = 'INSERT INTO simulation_results("simulation_id",' \
                                     '"sea_id", "execution_time",' \
-                                    + column_names_str + ',"label") VALUES (%s,%s,%s,' + placeholders_str + ',%s)'
+                                    + column_names_str + ',"label") VALUES ($1,$2,$3,' + placeholders_str + \
+                                    ',${0})'.format(len(output_params_names) + 4)
+    db_session.prepare('insert_simulation_results', insert_simulation_results_sql)
 
-    # convert results array into comma separated text
-    simulation_output_str = OrderedDict()
-    for variable in output_params_names:
-        simulation_output_str[variable] = ','.join(str(e) for e in simulation_output[variable])
-
-    # get a list of values from dict
-    simulation_output_list = [v for k, v in simulation_output_str.items()]
+    # encode results arrays into the binary format
+    start_time_encode = time.time()
+    simulation_output_list = [psycopg2.Binary(encode_trajectory(simulation_output[variable], result_dtype,
+                                                                result_compression))
+                              for variable in output_params_names]
 
     # add simulation identifier, SEA identifier, execution time and the label
     variables = list([str(simulation_id), sea_id, str(execution_time)]) \
-                + simulation_output_list + list(str(label))
+                + simulation_output_list + [str(label)]
 
     # execute query
-    cur.execute(insert_simulation_results_sql, variables)
+    start_time_insert = time.time()
+    db_session.run('insert_simulation_results',
+                   lambda cur: db_session.execute_prepared(cur, 'insert_simulation_results', variables))
+
+    if timings is not None:
+        timings['encode'] = start_time_insert - start_time_encode
+        timings['insert'] = time.time() - start_time_insert
 
-    # close the communication with the PostgreSQL
-    cur.close()
 
-    if conn is not None:
-        conn.commit()
-        conn.close()
+def insert_simulation_results_batch(db_session, sea_id, output_params_names, simulation_results,
+                                    result_dtype='float64', result_compression='none', timings=None):
+    """ Inserts into the database the results of a batch of simulations with a multi-row insert and marks them as
+        'Executed' in the same transaction
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            sea_id (string): id of the simulation executor agent that executes the simulations
+            output_params_names (list): contains the names of the output parameters
+            simulation_results (list): contains a dict per simulation with the keys 'simulation_id', 'execution_time',
+                                       'simulation_output' and 'label'
+            result_dtype (str): data type used to store the results ('float64' or 'float32')
+            result_compression (str): compression used to store the results ('none', 'zstd' or 'lz4')
+            timings (dict): if set, the durations of the encoding and the insertion of the whole batch are stored in
+                            its 'encode' and 'insert' keys
+    """
+    # create insert query
+    column_names_str = ",".join('"' + variable + '"' for variable in output_params_names)
+    insert_simulation_results_sql = 'INSERT INTO simulation_results("simulation_id",' \
+                                    '"sea_id", "execution_time",' + column_names_str + ',"label") VALUES %s'
+
+    # encode results arrays into the binary format
+    start_time_encode = time.time()
+    rows = list()
+    for result in simulation_results:
+        simulation_output_list = [psycopg2.Binary(encode_trajectory(result['simulation_output'][variable],
+                                                                    result_dtype, result_compression))
+                                  for variable in output_params_names]
+        rows.append([result['simulation_id'], sea_id, result['execution_time']]
+                    + simulation_output_list + [result['label']])
+
+    simulation_ids = [result['simulation_id'] for result in simulation_results]
+
+    def insert(cur):
+        psycopg2.extras.execute_values(cur, insert_simulation_results_sql, rows, page_size=len(rows))
+        cur.execute("UPDATE experimentation_config SET state='Executed', "
+                    "timestamp_end=current_timestamp "
+                    "WHERE simulation_id = ANY(%s)", (simulation_ids,))
+
+    start_time_insert = time.time()
+    db_session.run('insert_simulation_results_batch', insert)
+
+    if timings is not None:
+        timings['encode'] = start_time_insert - start_time_encode
+        timings['insert'] = time.time() - start_time_insert
+
+
+def insert_simulation_timings(db_session, sea_id, host, simulation_timings):
+    """ Inserts into the database the durations of the phases of a batch of simulations with a multi-row insert
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            sea_id (string): id of the simulation executor agent that executes the simulations
+            host (string): host where the simulation executor agent runs
+            simulation_timings (list): contains a dict per simulation with its 'simulation_id' and the duration (in
+                                       seconds) of each of its phases, keyed by the names in TIMING_PHASES
+    """
+    insert_simulation_timings_sql = 'INSERT INTO simulation_timings("simulation_id","sea_id","host",' \
+                                    + ",".join('"' + phase + '_time"' for phase in TIMING_PHASES) + ') VALUES %s'
 
+    rows = [[timings['simulation_id'], sea_id, host] + [timings.get(phase) for phase in TIMING_PHASES]
+            for timings in simulation_timings]
 
-def check_failed_simulations(db_config_params, simulation_environment_variables):
+    db_session.run('insert_simulation_timings',
+                   lambda cur: psycopg2.extras.execute_values(cur, insert_simulation_timings_sql, rows,
+                                                              page_size=len(rows)))
+
+
+def insert_simulation_stops(db_session, sea_id, simulation_stops):
+    """ Records the simulations stopped by a stop condition with a multi-row insert. A simulation executed again
+        keeps only its last stop
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            sea_id (string): id of the simulation executor agent that executes the simulations
+            simulation_stops (list): contains a tuple per simulation with its id, the name of the stop condition met
+                                     and the time at which it was stopped
+    """
+    insert_simulation_stops_sql = 'INSERT INTO simulation_stops("simulation_id","stop_reason","stop_time","sea_id") ' \
+                                  'VALUES %s ON CONFLICT ("simulation_id") DO UPDATE SET ' \
+                                  '"stop_reason" = EXCLUDED."stop_reason", "stop_time" = EXCLUDED."stop_time", ' \
+                                  '"sea_id" = EXCLUDED."sea_id", "recorded_at" = now()'
+
+    rows = [(simulation_id, stop_reason, float(stop_time), sea_id)
+            for simulation_id, stop_reason, stop_time in simulation_stops]
+
+    db_session.run('insert_simulation_stops',
+                   lambda cur: psycopg2.extras.execute_values(cur, insert_simulation_stops_sql, rows,
+                                                              page_size=len(rows)),
+                   idempotent=True)
+
+
+def get_cached_results(db_session, fmu_sha256, solver_hash, parameters_hashes):
+    """ Gets the cached results of a batch of parameter sets and records the hit in each found entry
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            fmu_sha256 (str): SHA-256 of the FMU
+            solver_hash (str): hash of the solver settings
+            parameters_hashes (list): hashes of the parameter sets
+
+        Returns:
+            dict: contains the names of the cached variables and their encoded results for each found parameter set,
+                  keyed by its hash
+    """
+    def get(cur):
+        cur.execute('UPDATE public.simulation_result_cache SET hits = hits + 1, last_used_at = current_timestamp '
+                    'WHERE fmu_sha256 = %s AND solver_hash = %s AND parameters_hash = ANY(%s) '
+                    'RETURNING parameters_hash, output_names, outputs',
+                    (fmu_sha256, solver_hash, parameters_hashes))
+        return {parameters_hash: (output_names, outputs) for parameters_hash, output_names, outputs in cur.fetchall()}
+
+    return db_session.run('get_cached_results', get, idempotent=True)
+
+
+def insert_cached_results(db_session, fmu_sha256, solver_hash, entries):
+    """ Inserts into the result cache the results of a batch of simulations with a multi-row insert. Entries already
+        cached by another agent are kept
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            fmu_sha256 (str): SHA-256 of the FMU
+            solver_hash (str): hash of the solver settings
+            entries (list): contains a tuple per simulation with the hash of its parameter set, the parameter set as
+                            JSON, the names of the variables and their encoded results
+    """
+    insert_cached_results_sql = 'INSERT INTO public.simulation_result_cache' \
+                                '(fmu_sha256, solver_hash, parameters_hash, parameters, output_names, outputs) ' \
+                                'VALUES %s ON CONFLICT DO NOTHING'
+
+    rows = [(fmu_sha256, solver_hash) + tuple(entry) for entry in entries]
+
+    db_session.run('insert_cached_results',
+                   lambda cur: psycopg2.extras.execute_values(cur, insert_cached_results_sql, rows,
+                                                              page_size=len(rows)),
+                   idempotent=True)
+
+
+def evict_result_cache(db_session, max_entries):
+    """ Removes the least recently used entries of the result cache over the given number of entries. An advisory
+        lock ensures only one agent evicts at a time
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            max_entries (int): maximum number of entries of the cache
+
+        Returns:
+            int: number of evicted entries
+    """
+    def evict(cur):
+        cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('simulation_result_cache'))")
+        if not cur.fetchone()[0]:
+            return 0
+        cur.execute('DELETE FROM public.simulation_result_cache WHERE ctid IN ('
+                    'SELECT ctid FROM public.simulation_result_cache ORDER BY last_used_at DESC OFFSET %s)',
+                    (max_entries,))
+        return cur.rowcount
+
+    return db_session.run('evict_result_cache', evict, idempotent=True)
+
+
+def select_simulation_ids(db_session, parameter_filter=None, label=None):
+    """ Gets the ids of the executed simulations whose parameters match a filter
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            parameter_filter (dict): condition of each parameter: a value, a list of values or a (low, high) tuple
+                                     with the bounds of a range
+            label (int): label of the simulations, or None for every label
+
+        Returns:
+            list: ids of the matching simulations, in ascending order
+    """
+    conditions = [psycopg2.sql.SQL("state = 'Executed'")]
+    values = []
+    for name, condition in (parameter_filter or {}).items():
+        column = psycopg2.sql.Identifier(name)
+        if isinstance(condition, tuple):
+            conditions.append(psycopg2.sql.SQL('{0} BETWEEN %s AND %s').format(column))
+            values.extend(condition)
+        elif isinstance(condition, list):
+            conditions.append(psycopg2.sql.SQL('{0} = ANY(%s)').format(column))
+            values.append(condition)
+        else:
+            conditions.append(psycopg2.sql.SQL('{0} = %s').format(column))
+            values.append(condition)
+    if label is not None:
+        conditions.append(psycopg2.sql.SQL('label = %s'))
+        values.append(label)
+
+    select_sql = psycopg2.sql.SQL('SELECT simulation_id FROM experimentation_config WHERE {0} '
+                                  'ORDER BY simulation_id').format(psycopg2.sql.SQL(' AND ').join(conditions))
+
+    def select(cur):
+        cur.execute(select_sql, values)
+        return [row[0] for row in cur.fetchall()]
+
+    return db_session.run('select_simulation_ids', select, idempotent=True)
+
+
+def get_simulation_results(db_session, simulation_ids, output_params_names):
+    """ Gets the encoded results of a set of simulations
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            simulation_ids (list): ids of the simulations
+            output_params_names (list): names of the output variables to be read
+
+        Returns:
+            list: contains a tuple per simulation with its id followed by the content of the bytea column of each
+                  output variable, as memoryviews
+    """
+    select_sql = psycopg2.sql.SQL('SELECT simulation_id, {0} FROM simulation_results '
+                                  'WHERE simulation_id = ANY(%s)').format(
+        psycopg2.sql.SQL(', ').join(psycopg2.sql.Identifier(name) for name in output_params_names))
+
+    def select(cur):
+        cur.execute(select_sql, (list(simulation_ids),))
+        return cur.fetchall()
+
+    return db_session.run('get_simulation_results', select, idempotent=True)
+
+
+def has_predicted_runtime(db_session):
+    """ Checks whether the simulations of the experimentation have a predicted runtime, used to lease the longest
+        simulations first
+
+        Args:
+            db_session (DBSession): persistent session to the database
+
+        Returns:
+            boolean: True if experimentation_config has the predicted_runtime column
+    """
+    def check(cur):
+        cur.execute("SELECT EXISTS (SELECT 1 FROM information_schema.columns "
+                    "WHERE table_name = 'experimentation_config' AND table_schema = current_schema() "
+                    "AND column_name = 'predicted_runtime')")
+        return cur.fetchone()[0]
+
+    return db_session.run('has_predicted_runtime', check, idempotent=True)
+
+
+def get_parameter_names(db_session):
+    """ Gets the names of the input parameters stored in experimentation_config
+
+        Args:
+            db_session (DBSession): persistent session to the database
+
+        Returns:
+            list: contains the name of the input parameters, sorted
+    """
+    def get(cur):
+        cur.execute("SELECT column_name FROM information_schema.columns "
+                    "WHERE table_name = 'experimentation_config' AND table_schema = current_schema() "
+                    "ORDER BY column_name")
+        return [row[0] for row in cur.fetchall() if row[0] not in NON_PARAMETER_COLUMNS]
+
+    return db_session.run('get_parameter_names', get, idempotent=True)
+
+
+def count_executed_simulations(db_session):
+    """ Counts the simulations whose results are stored
+
+        Args:
+            db_session (DBSession): persistent session to the database
+
+        Returns:
+            int: number of rows of simulation_results
+    """
+    def count(cur):
+        cur.execute('SELECT count(*) FROM simulation_results')
+        return cur.fetchone()[0]
+
+    return db_session.run('count_executed_simulations', count, idempotent=True)
+
+
+def try_lock_runtime_predictions(db_session):
+    """ Takes the session-level advisory lock that ensures only one agent refreshes the predicted runtimes at a time
+
+        Args:
+            db_session (DBSession): persistent session to the database
+
+        Returns:
+            boolean: True if the lock is taken, False if another agent holds it
+    """
+    def lock(cur):
+        cur.execute("SELECT pg_try_advisory_lock(hashtext('predicted_runtime'))")
+        return cur.fetchone()[0]
+
+    return db_session.run('try_lock_runtime_predictions', lock, idempotent=True)
+
+
+def unlock_runtime_predictions(db_session):
+    """ Releases the advisory lock taken by try_lock_runtime_predictions
+
+        Args:
+            db_session (DBSession): persistent session to the database
+    """
+    db_session.run('unlock_runtime_predictions',
+                   lambda cur: cur.execute("SELECT pg_advisory_unlock(hashtext('predicted_runtime'))"),
+                   idempotent=True)
+
+
+def get_runtime_samples(db_session, parameter_names, max_samples, n_results):
+    """ Gets the parameters and the execution time of a random sample of the executed simulations. The pages of
+        simulation_results are sampled (TABLESAMPLE SYSTEM), so only the sampled simulations are read and joined and
+        the cost does not grow with the size of the experimentation
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            parameter_names (list): names of the input parameters
+            max_samples (int): maximum number of simulations sampled
+            n_results (int): number of rows of simulation_results, used to size the sample
+
+        Returns:
+            list: contains a tuple per simulation with the value of each parameter followed by its execution time
+    """
+    select_sql = psycopg2.sql.SQL('SELECT {0}, r.execution_time FROM simulation_results r TABLESAMPLE SYSTEM (%s) '
+                                  'JOIN experimentation_config c USING (simulation_id) '
+                                  'WHERE r.execution_time IS NOT NULL LIMIT %s').format(
+        psycopg2.sql.SQL(', ').join(psycopg2.sql.Identifier('c', name) for name in parameter_names))
+
+    # percentage of the pages sampled. Twice the required rows are sampled, as whole pages are sampled at once
+    percentage = min(100.0, 200.0 * max_samples / max(1, n_results))
+
+    def select(cur):
+        cur.execute(select_sql, (percentage, max_samples))
+        return cur.fetchall()
+
+    return db_session.run('get_runtime_samples', select, idempotent=True)
+
+
+def get_pending_simulation_parameters(db_session, parameter_names, after_simulation_id, page_size):
+    """ Gets the parameters of a page of the simulations pending to be executed, in ascending order of their ids
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            parameter_names (list): names of the input parameters
+            after_simulation_id (int): id of the last simulation of the previous page (-1 for the first page)
+            page_size (int): maximum number of simulations of the page
+
+        Returns:
+            list: contains a tuple per simulation with its id followed by the value of each parameter
+    """
+    select_sql = psycopg2.sql.SQL("SELECT simulation_id, {0} FROM experimentation_config "
+                                  "WHERE state = 'Not executed' AND simulation_id > %s "
+                                  "ORDER BY simulation_id LIMIT %s").format(
+        psycopg2.sql.SQL(', ').join(psycopg2.sql.Identifier(name) for name in parameter_names))
+
+    def select(cur):
+        cur.execute(select_sql, (after_simulation_id, page_size))
+        return cur.fetchall()
+
+    return db_session.run('get_pending_simulation_parameters', select, idempotent=True)
+
+
+def update_predicted_runtimes(db_session, predicted_runtimes):
+    """ Stores the predicted runtime of a batch of pending simulations with a single statement. Simulations leased in
+        the meantime are not modified
+
+        Args:
+            db_session (DBSession): persistent session to the database
+            predicted_runtimes (list): contains a tuple per simulation with its id and its predicted runtime (in
+                                       seconds)
+    """
+    update_sql = "UPDATE experimentation_config AS c SET predicted_runtime = v.predicted_runtime " \
+                 "FROM (VALUES %s) AS v(simulation_id, predicted_runtime) " \
+                 "WHERE c.simulation_id = v.simulation_id AND c.state = 'Not executed'"
+
+    db_session.run('update_predicted_runtimes',
+                   lambda cur: psycopg2.extras.execute_values(cur, update_sql, predicted_runtimes,
+                                                              template='(%s::bigint, %s::real)',
+                                                              page_size=len(predicted_runtimes)),
+                   idempotent=True)
+
+
+def check_failed_simulations(db_session, simulation_environment_variables):
     """ Checks in the database whether there are failed simulations that have not exceed the maximum failures.
 
         Args:
-            db_config_params (dict): contains the connection parameters of the database
+            db_session (DBSession): persistent session to the database
             simulation_environment_variables (dict): environment variables required for the correct operation of
                                                      the simulation
 
         Returns:
             boolean: indicates whether failed simulations are reset (True) or not (False).
     """
-    # connect to the PostgreSQL server
-    conn = psycopg2.connect(**db_config_params)
-
-    # create a cursor
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-
-    # check whether there are failed simulations that have not exceed the maximum failures
-    check_failed_simulations_sql = 'SELECT search_failed_simulations(%s,%s)'
-    cur.execute(check_failed_simulations_sql, (simulation_environment_variables['max_failures'],
-                                               simulation_environment_variables['time_out']))
-    is_simulation_reset = cur.fetchone()
+    def check(cur):
+        # check whether there are failed simulations that have not exceed the maximum failures
+        check_failed_simulations_sql = 'SELECT search_failed_simulations(%s,%s)'
+        cur.execute(check_failed_simulations_sql, (simulation_environment_variables['max_failures'],
+                                                   simulation_environment_variables['time_out']))
+        return cur.fetchone()
+
+    is_simulation_reset = db_session.run('check_failed_simulations', check,
+                                         cursor_factory=psycopg2.extras.RealDictCursor, idempotent=True)
     is_simulation_reset = is_simulation_reset['search_failed_simulations']
 
-    # close the communication with the PostgreSQL
-    cur.close()
-
-    if conn is not None:
-        conn.commit()
-        conn.close()
-
     return is_simulation_reset
 
 
-def insert_simulation_failure_registry(db_config_params, simulation_id, sea_id, failure_type):
+def insert_simulation_failure_registry(db_session, simulation_id, sea_id, failure_type):
     """ Inserts into the database a new failure registry when a failure occurs during the execution of a given simulation
 
         Args:
-            db_config_params (dict): contains the connection parameters of the database
+            db_session (DBSession): persistent session to the database
             simulation_id (int): identifier of the simulation to be updated
             sea_id (string): id of the simulation executor agent that executes the current simulation
             failure_type (string): description of the failure
     """
-    conn = None
-    try:
-        # connect to the PostgreSQL server
-        conn = psycopg2.connect(**db_config_params)
-
-        # create a cursor
-        cur = conn.cursor()
-
-        insert_sql = "INSERT INTO simulation_failure_registry " \
-                     "VALUES (%s, to_char(current_timestamp, 'YYYY/MM/DD HH24:MI:SS'), %s, %s)"
+    db_session.prepare('insert_simulation_failure_registry',
+                       "INSERT INTO simulation_failure_registry "
+                       "VALUES ($1, current_timestamp, $2, $3)")
 
+    def insert(cur):
         variables = [simulation_id, sea_id, failure_type]
-        cur.execute(insert_sql, variables)
+        db_session.execute_prepared(cur, 'insert_simulation_failure_registry', variables)
 
-        # close the communication with the PostgreSQL
-        cur.close()
+    try:
+        db_session.run('insert_simulation_failure_registry', insert)
     except (Exception, psycopg2.DatabaseError) as error:
         print(error)
     finally:
         print('\tInserted new failure registry for Simulation {0}\n\n'.format(simulation_id))
-        if conn is not None:
-            conn.commit()
-            conn.close()
 
 
-def rollback_simulation_state(db_config_params, simulation_id, sea_id, failure_type):
+def rollback_simulation_state(db_session, simulation_id, sea_id, failure_type):
     """ Modifies the state of a simulation to "Failed" when an error occurs
 
         Args:
-            db_config_params (dict): contains the connection parameters of the database
+            db_session (DBSession): persistent session to the database
             simulation_id (int): identifier of the simulation to be updated
             sea_id (string): id of the simulation executor agent that executes the current simulation
             failure_type (string): description of the failure
     """
     if simulation_id is not None:
         print('An error occurred during the simulation')
-        update_simulation_state(db_config_params, simulation_id, 'Failed')
-        insert_simulation_failure_registry(db_config_params, simulation_id, sea_id, failure_type)
-
+        METRICS.inc('sea_simulation_failures_total', type=failure_type)
+        update_simulation_state(db_session, simulation_id, 'Failed')
+        insert_simulation_failure_registry(db_session, simulation_id, sea_id, failure_type)
@@ -0,0 +1,175 @@
+import time
+import psycopg2
+
+
+class DBSession:
+    """ Persistent connection to the database that lives for the whole life of the agent. The connection is
+        re-established when it breaks, the hot queries are kept as server-side prepared statements and the latency
+        of every call is recorded.
+
+        A session must not be shared between threads. Each thread talking to the database opens its own session.
+    """
+
+    def __init__(self, db_config_params, max_reconnect_attempts=5, reconnect_interval=1.0):
+        """
+            Args:
+                db_config_params (dict): contains the connection parameters of the database
+                max_reconnect_attempts (int): attempts to re-establish a broken connection before giving up
+                reconnect_interval (float): seconds to wait between reconnection attempts (doubled on each attempt)
+        """
+        self.db_config_params = db_config_params
+        self.max_reconnect_attempts = max_reconnect_attempts
+        self.reconnect_interval = reconnect_interval
+        self.conn = None
+
+        # statements registered by the user (name -> SQL) and statements already prepared in the current connection
+        self.statements = {}
+        self.prepared_statements = set()
+
+        # latency of each call (name -> {'calls', 'total', 'max'})
+        self.latency_stats = {}
+
+    def connect(self):
+        """ Opens the connection to the database. Previously prepared statements are prepared again lazily
+        """
+        attempt = 0
+        while True:
+            try:
+                self.conn = psycopg2.connect(**self.db_config_params)
+                self.prepared_statements = set()
+                return self.conn
+            except psycopg2.OperationalError as error:
+                attempt += 1
+                if attempt >= self.max_reconnect_attempts:
+                    raise
+                print('Unable to connect to the database ({0}). Retrying...'.format(str(error).strip()))
+                time.sleep(self.reconnect_interval * 2 ** (attempt - 1))
+
+    def close(self):
+        """ Closes the connection to the database
+        """
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+        self.conn = None
+
+    def is_connected(self):
+        """ Checks whether the connection to the database is open
+
+            Returns:
+                boolean: True if the connection is open
+        """
+        return self.conn is not None and not self.conn.closed
+
+    def prepare(self, name, sql):
+        """ Registers a statement to be executed as a server-side prepared statement. Parameters are referenced with
+            $1, $2... as in the PREPARE command of PostgreSQL
+
+            Args:
+                name (str): name of the prepared statement
+                sql (str): statement to be prepared
+        """
+        if self.statements.get(name) != sql:
+            self.statements[name] = sql
+            self.prepared_statements.discard(name)
+
+    def execute_prepared(self, cur, name, variables=()):
+        """ Executes a prepared statement, preparing it first if it is not yet prepared in the current connection
+
+            Args:
+                cur (cursor): cursor of the current transaction
+                name (str): name of a statement registered with prepare()
+                variables (list): values of the parameters of the statement
+        """
+        if name not in self.prepared_statements:
+            # a statement prepared in a rolled back transaction or registered with a different SQL may be left in
+            # the connection, so it is replaced
+            cur.execute('SELECT 1 FROM pg_prepared_statements WHERE name = %s', (name.lower(),))
+            if cur.fetchone() is not None:
+                cur.execute('DEALLOCATE {0}'.format(name))
+            cur.execute('PREPARE {0} AS {1}'.format(name, self.statements[name]))
+            self.prepared_statements.add(name)
+
+        if variables:
+            placeholders_str = ','.join('%s' for i in variables)
+            cur.execute('EXECUTE {0}({1})'.format(name, placeholders_str), variables)
+        else:
+            cur.execute('EXECUTE {0}'.format(name))
+
+    def run(self, name, operation, cursor_factory=None, idempotent=False):
+        """ Runs an operation in its own transaction. The transaction is committed if the operation succeeds and rolled
+            back otherwise. If the connection is broken, it is re-established and, if the operation is idempotent, it is
+            run again. Other operations are not retried, as the commit may have reached the server before the
+            connection broke: the error is raised and the connection is re-established by the next call
+
+            Args:
+                name (str): name used to record the latency of the call
+                operation (function): receives the cursor and returns the result of the call
+                cursor_factory: type of the cursor passed to the operation
+                idempotent (bool): whether running the operation twice has the same effect as running it once
+
+            Returns:
+                the value returned by the operation
+        """
+        attempt = 0
+        while True:
+            start_time = time.time()
+            prepared_statements = set(self.prepared_statements)
+            try:
+                if not self.is_connected():
+                    self.connect()
+                    prepared_statements = set()
+
+                cur = self.conn.cursor(cursor_factory=cursor_factory)
+                try:
+                    result = operation(cur)
+                finally:
+                    cur.close()
+                self.conn.commit()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                # retry only when the connection itself is broken, not when the statement is wrong
+                if self.is_connected() or attempt >= self.max_reconnect_attempts:
+                    self._rollback(prepared_statements)
+                    raise
+                if not idempotent:
+                    # the commit may have reached the server, so running the operation again could repeat it
+                    self.close()
+                    raise
+                attempt += 1
+                print('The connection to the database is broken. Reconnecting...')
+                self.close()
+            except Exception:
+                self._rollback(prepared_statements)
+                raise
+            else:
+                self._record_latency(name, time.time() - start_time)
+                return result
+
+    def _rollback(self, prepared_statements):
+        """ Rolls back the current transaction, if the connection is still open
+
+            Args:
+                prepared_statements (set): statements known to be prepared before the transaction started
+        """
+        if self.is_connected():
+            self.conn.rollback()
+        self.prepared_statements = prepared_statements
+
+    def _record_latency(self, name, elapsed_time):
+        """ Records the latency of a call
+
+            Args:
+                name (str): name of the call
+                elapsed_time (float): duration of the call (in seconds)
+        """
+        stats = self.latency_stats.setdefault(name, {'calls': 0, 'total': 0.0, 'max': 0.0})
+        stats['calls'] += 1
+        stats['total'] += elapsed_time
+        stats['max'] = max(stats['max'], elapsed_time)
+
+    def print_latency_stats(self):
+        """ Prints the number of calls and the mean and maximum latency of each call made through the session
+        """
+        print('Database latency per call (seconds):')
+        for name, stats in sorted(self.latency_stats.items()):
+            print('\t{0}: calls={1} mean={2:.4f} max={3:.4f}'.format(name, stats['calls'],
+                                                                      stats['total'] / stats['calls'], stats['max']))
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import zipfile
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+
+# The cache directory may be a volume shared by all the agents running in the same node. Its layout is:
+#
+#   <sha256>.fmu        downloaded FMU, named after the SHA-256 of its content
+#   <sha256>.py         downloaded module of a model simulated by the numpy_ode backend
+#   <sha256>/           extracted FMU, reused by every agent loading the same FMU
+#   <url hash>.json     ETag, Last-Modified and SHA-256 of the last download of each URL
+#   *.lock              locks that prevent several agents from downloading or extracting the same file at once
+CHUNK_SIZE = 1024 * 1024
+
+
+@contextmanager
+def file_lock(path):
+    """ Holds an exclusive lock on a file while the context is active. The lock is shared by all the processes using
+        the same cache directory
+
+        Args:
+            path (str): path of the lock file
+    """
+    with open(path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_file_sha256(path):
+    """ Computes the SHA-256 of a file
+
+        Args:
+            path (str): path of the file
+
+        Returns:
+            str: hexadecimal SHA-256 of the content of the file
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as in_file:
+        for chunk in iter(lambda: in_file.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def download_fmu(path_to_model_remote, cache_dir, extension='.fmu'):
+    """ Downloads the FMU into the cache, unless the cached copy is still valid. The server is asked with a conditional
+        request (If-None-Match/If-Modified-Since) and the FMU is stored under the SHA-256 of its content. Local paths
+        and file:// URLs are hashed instead of downloaded
+
+        Args:
+            path_to_model_remote (str): URL or local path of the FMU
+            cache_dir (str): directory where the FMUs are cached
+            extension (str): extension of the cached file ('.py' for the modules of the numpy_ode backend)
+
+        Returns:
+            str: path of the cached FMU
+            str: SHA-256 of the FMU
+    """
+    url = urllib.parse.urlparse(path_to_model_remote)
+    if url.scheme in ('', 'file'):
+        path_to_model_local = urllib.request.url2pathname(url.path) if url.scheme == 'file' else path_to_model_remote
+        return path_to_model_local, get_file_sha256(path_to_model_local)
+
+    url_hash = hashlib.sha256(path_to_model_remote.encode()).hexdigest()
+    metadata_path = os.path.join(cache_dir, url_hash + '.json')
+
+    with file_lock(os.path.join(cache_dir, url_hash + '.lock')):
+        # headers of the previous download, if the corresponding FMU is still cached
+        metadata = {}
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as metadata_file:
+                metadata = json.load(metadata_file)
+            if not os.path.exists(os.path.join(cache_dir, metadata['sha256'] + extension)):
+                metadata = {}
+
+        request = urllib.request.Request(path_to_model_remote)
+        if metadata.get('etag'):
+            request.add_header('If-None-Match', metadata['etag'])
+        if metadata.get('last_modified'):
+            request.add_header('If-Modified-Since', metadata['last_modified'])
+
+        print("Downloading files...")
+        print("\t", path_to_model_remote)
+        try:
+            response = urllib.request.urlopen(request)
+        except urllib.error.HTTPError as error:
+            if error.code == 304 and metadata:
+                print("Cached FMU is up to date")
+                return os.path.join(cache_dir, metadata['sha256'] + extension), metadata['sha256']
+            raise
+
+        # download into a temporary file computing the hash on the fly and rename it after its content
+        sha256 = hashlib.sha256()
+        with response, tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.part', delete=False) as out_file:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                sha256.update(chunk)
+                out_file.write(chunk)
+        sha256 = sha256.hexdigest()
+        path_to_model_local = os.path.join(cache_dir, sha256 + extension)
+        os.replace(out_file.name, path_to_model_local)
+
+        metadata = {'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'sha256': sha256}
+        with open(metadata_path, 'w') as metadata_file:
+            json.dump(metadata, metadata_file)
+        print("Download completed")
+
+    return path_to_model_local, sha256
+
+
+def extract_fmu(path_to_model_local, sha256, cache_dir):
+    """ Extracts the FMU into the cache, unless another agent already did it
+
+        Args:
+            path_to_model_local (str): path of the FMU
+            sha256 (str): SHA-256 of the FMU
+            cache_dir (str): directory where the FMUs are cached
+
+        Returns:
+            str: directory containing the extracted FMU
+    """
+    extracted_dir = os.path.join(cache_dir, sha256)
+
+    with file_lock(os.path.join(cache_dir, sha256 + '.lock')):
+        if not os.path.isdir(extracted_dir):
+            # extract into a temporary directory and rename it, so a partial extraction is never used
+            tmp_dir = tempfile.mkdtemp(dir=cache_dir, suffix='.part')
+            try:
+                with zipfile.ZipFile(path_to_model_local) as fmu_file:
+                    fmu_file.extractall(tmp_dir)
+                os.rename(tmp_dir, extracted_dir)
+            except Exception:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+
+    return extracted_dir
+
+
+def load_cached_fmu(path_to_model_remote, cache_dir):
+    """ Loads the FMU using the cache. The FMU is only downloaded when it changed and only extracted once per cache
+        directory. A breakdown of the startup time is printed
+
+        Args:
+            path_to_model_remote (str): URL or local path of the FMU
+            cache_dir (str): directory where the FMUs are cached
+
+        Returns:
+            FMUModel: loaded model
+            str: SHA-256 of the FMU
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    start_time = time.time()
+    path_to_model_local, sha256 = download_fmu(path_to_model_remote, cache_dir)
+    download_time = time.time() - start_time
+
+    start_time_extract = time.time()
+    extracted_dir = extract_fmu(path_to_model_local, sha256, cache_dir)
+    extract_time = time.time() - start_time_extract
+
+    # PyFMI is only imported when a FMU is loaded, so the numpy_ode backend runs without it
+    from pyfmi import load_fmu
+
+    start_time_load = time.time()
+    try:
+        model = load_fmu(extracted_dir, allow_unzipped_fmu=True)
+    except TypeError:
+        # versions of PyFMI older than 2.8 can only load zipped FMUs
+        model = load_fmu(path_to_model_local)
+    load_time = time.time() - start_time_load
+
+    print('FMU {0} (sha256 {1}) loaded'.format(path_to_model_remote, sha256))
+    print('\tDownload time: {0}'.format(round(download_time, 3)))
+    print('\tExtraction time: {0}'.format(round(extract_time, 3)))
+    print('\tLoading time: {0}'.format(round(load_time, 3)))
+    print('\tTotal startup time: {0}'.format(round(time.time() - start_time, 3)))
+
+    return model, sha256
@@ -0,0 +1,69 @@
+import threading
+import psycopg2
+from DB_Manager import renew_simulation_leases
+from DB_Session import DBSession
+
+
+class LeaseHeartbeat(threading.Thread):
+    """ Background thread that renews the leases of the simulations held by the agent (the one being executed and the
+        prefetched ones) while the simulations run. If the agent dies, its leases expire after lease_duration seconds
+        and the simulations are reset by the other agents, while long simulations of live agents are never reset.
+    """
+
+    def __init__(self, db_config_params, lease_duration=60, renewal_interval=20):
+        """
+            Args:
+                db_config_params (dict): contains the connection parameters of the database
+                lease_duration (int): seconds a lease lasts since it is renewed
+                renewal_interval (float): seconds between two renewals. It must be shorter than the lease duration
+        """
+        super().__init__(name='LeaseHeartbeat', daemon=True)
+        self.db_session = DBSession(db_config_params)
+        self.lease_duration = lease_duration
+        self.renewal_interval = renewal_interval
+
+        self.simulation_ids = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def add(self, simulation_ids):
+        """ Starts renewing the leases of the given simulations
+
+            Args:
+                simulation_ids (list): identifiers of the leased simulations
+        """
+        with self.lock:
+            self.simulation_ids.update(simulation_ids)
+
+    def remove(self, simulation_ids):
+        """ Stops renewing the leases of the given simulations
+
+            Args:
+                simulation_ids (list): identifiers of the simulations that are no longer held by the agent
+        """
+        with self.lock:
+            self.simulation_ids.difference_update(simulation_ids)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.simulation_ids)
+
+    def close(self):
+        """ Stops renewing the leases
+        """
+        self.stop_event.set()
+        self.join()
+        self.db_session.close()
+
+    def run(self):
+        while not self.stop_event.wait(self.renewal_interval):
+            with self.lock:
+                simulation_ids = list(self.simulation_ids)
+            if not simulation_ids:
+                continue
+
+            try:
+                renew_simulation_leases(self.db_session, simulation_ids, self.lease_duration)
+            except (Exception, psycopg2.DatabaseError) as error:
+                # the lease is renewed again in the next interval
+                print('LeaseHeartbeat: the leases could not be renewed:\n\t{0}'.format(error))
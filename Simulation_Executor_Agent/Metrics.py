@@ -0,0 +1,160 @@
+import bisect
+import threading
+from socketserver import ThreadingMixIn
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# upper bounds (in seconds) of the buckets of the latency histograms
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+
+class Metrics:
+    """ Registry of the runtime metrics of the agent: counters, gauges and latency histograms, optionally labelled.
+        The metrics are always collected (the cost is a dictionary update) and they are exposed in the Prometheus text
+        format by serve() when a metrics port is set
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.help = {}
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def describe(self, name, help_text):
+        """ Sets the description of a metric
+        """
+        self.help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        """ Increases a counter
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """ Sets the value of a gauge. The value may be a callable evaluated when the metrics are exposed
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        """ Records a sample (in seconds) in a latency histogram
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def expose(self):
+        """ Formats the metrics in the Prometheus text format
+
+            Returns:
+                str: metrics in the Prometheus text format
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: (list(buckets), total, count)
+                          for key, (buckets, total, count) in self.histograms.items()}
+
+        lines = []
+        described = set()
+
+        def header(name, metric_type):
+            if name not in described:
+                described.add(name)
+                if name in self.help:
+                    lines.append('# HELP {0} {1}'.format(name, self.help[name]))
+                lines.append('# TYPE {0} {1}'.format(name, metric_type))
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append('{0}{1} {2}'.format(name, format_labels(labels), value))
+
+        for (name, labels), value in sorted(gauges.items(), key=lambda item: item[0]):
+            header(name, 'gauge')
+            lines.append('{0}{1} {2}'.format(name, format_labels(labels), value() if callable(value) else value))
+
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket
+                lines.append('{0}_bucket{1} {2}'.format(name, format_labels(labels + (('le', str(bound)),)),
+                                                        cumulative))
+            lines.append('{0}_sum{1} {2}'.format(name, format_labels(labels), total))
+            lines.append('{0}_count{1} {2}'.format(name, format_labels(labels), count))
+
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port):
+        """ Exposes the metrics on http://<host>:<port>/metrics from a background thread
+
+            Args:
+                port (int): port of the HTTP server
+
+            Returns:
+                MetricsServer: the running server
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.expose().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = MetricsServer(('', port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='MetricsServer', daemon=True).start()
+        print('Metrics exposed on port {0}'.format(port))
+
+        return server
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """ HTTP server that handles each request in its own thread (http.server.ThreadingHTTPServer requires Python 3.7)
+    """
+    daemon_threads = True
+
+
+def format_labels(labels):
+    """ Formats the labels of a metric
+
+        Args:
+            labels (tuple): pairs of label name and value
+
+        Returns:
+            str: labels in the Prometheus text format
+    """
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in labels) + '}'
+
+
+# metrics of the agent
+METRICS = Metrics()
+METRICS.describe('sea_claim_seconds', 'Time to lease the next simulations from the database')
+METRICS.describe('sea_simulation_seconds', 'Time to execute a simulation')
+METRICS.describe('sea_persist_seconds', 'Time to encode and insert (or queue) the results of a simulation')
+METRICS.describe('sea_result_write_seconds', 'Time to encode and insert a batch of results in the result writer')
+METRICS.describe('sea_simulations_total', 'Simulations completed by the agent')
+METRICS.describe('sea_simulation_failures_total', 'Simulations failed by the agent, by failure type')
+METRICS.describe('sea_result_cache_hits_total', 'Simulations whose results are copied from the result cache')
+METRICS.describe('sea_result_cache_misses_total', 'Simulations not found in the result cache')
+METRICS.describe('sea_inflight_leases', 'Simulations leased by the agent and not persisted yet')
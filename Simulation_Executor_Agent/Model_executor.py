@@ -1,6 +1,100 @@
+import time
+import importlib.util
+import importlib.machinery
 import numpy as np
 
 
+class SimulationOutput(dict):
+    """ Results of a simulation as a dict with an array per variable, together with the reason why it was stopped
+        before its final time by a stop condition, if it was. It is used where the results leave the result handler
+        (worker process and batch backends)
+    """
+
+    def __init__(self, values, stop_reason=None, stop_time=None):
+        """
+            Args:
+                values (dict): contains an array with the results of each variable
+                stop_reason (str): name of the stop condition that ended the simulation, or None
+                stop_time (float): time at which the simulation was stopped, or None
+        """
+        super().__init__(values)
+        self.stop_reason = stop_reason
+        self.stop_time = stop_time
+
+
+class ModelSnapshot:
+    """ State of a FMU just after it is instantiated, taken once with the FMI 2.0 get/set FMU state functions and
+        restored before every simulation instead of resetting the FMU. The value references of the parameters are
+        resolved the first time they are set and then set at once as vectors per data type.
+    """
+
+    def __init__(self, model, state):
+        """
+            Args:
+                model (FMUModelME2): loaded FMU
+                state (FMUState2): state of the FMU just after it is instantiated
+        """
+        self.model = model
+        self.state = state
+        self.parameters = {}
+
+    @classmethod
+    def take(cls, model):
+        """ Takes the snapshot of a loaded FMU
+
+            Args:
+                model (FMUModel): loaded FMU
+
+            Returns:
+                ModelSnapshot: snapshot of the FMU, or None if it cannot get and set its state
+        """
+        try:
+            if not model.get_capability_flags().get('canGetAndSetFMUstate', False):
+                return None
+            model.reset()
+            return cls(model, model.get_fmu_state())
+        except Exception as error:
+            # FMI 1.0 models have no FMU state and some FMUs declare it without supporting it
+            print('The state of the FMU cannot be stored, so it is reset before every simulation: {0}'.format(error))
+            return None
+
+    def restore(self):
+        """ Returns the FMU to the state of the snapshot
+        """
+        self.model.set_fmu_state(self.state)
+
+    def set_parameters(self, user_parameters):
+        """ Sets the values of the parameters of a simulation
+
+            Args:
+                user_parameters (dict): value of each parameter
+        """
+        from pyfmi.fmi import FMI2_REAL, FMI2_INTEGER, FMI2_BOOLEAN
+
+        values_by_type = {}
+        for name, value in user_parameters.items():
+            if name not in self.parameters:
+                self.parameters[name] = (self.model.get_variable_data_type(name),
+                                         self.model.get_variable_valueref(name))
+            data_type, value_reference = self.parameters[name]
+            if data_type not in (FMI2_REAL, FMI2_INTEGER, FMI2_BOOLEAN):
+                # strings and enumerations are set one by one
+                self.model.set(name, value)
+                continue
+            value_references, values = values_by_type.setdefault(data_type, ([], []))
+            value_references.append(value_reference)
+            values.append(value)
+
+        for data_type, (value_references, values) in values_by_type.items():
+            value_references = np.array(value_references, dtype=np.uint32)
+            if data_type == FMI2_REAL:
+                self.model.set_real(value_references, np.array(values, dtype=np.float64))
+            elif data_type == FMI2_INTEGER:
+                self.model.set_integer(value_references, np.array(values, dtype=np.int32))
+            else:
+                self.model.set_boolean(value_references, np.array(values, dtype=bool))
+
+
 def simulate_model(model, **kwargs):
     """
     Creates a dictionary with the requested measurements, using the defined
@@ -22,11 +116,48 @@ def simulate_model(model, **kwargs):
         final_time (5)
         final time of the simulation
 
+        output_names ([])
+        list. Names of the variables to be recorded. All the variables are recorded
+        if empty. When set, the samples are written straight into preallocated NumPy
+        buffers and the returned result gives a contiguous array per variable.
+
+        ncp (0)
+        int. Number of communication points at which the outputs are recorded. PyFMI
+        default if 0.
+
+        output_interval (0.0)
+        float. Time between two recorded points. Only used when ncp is not set.
+
+        timings (None)
+        dict. If set, the durations (in seconds) of the set-up, initialization and
+        integration of the model are stored in its 'setup', 'initialize' and
+        'integrate' keys.
+
+        snapshot (None)
+        ModelSnapshot. If set, the FMU is restored to the snapshot instead of being
+        reset and the parameters are set as vectors of value references.
+
+        stop_conditions (None)
+        StopConditions. Conditions over the recorded variables that end the
+        simulation before final_time. The returned result keeps the samples up to
+        the stop and the name of the condition met and its time in its
+        stop_reason and stop_time attributes. Requires output_names.
+
+        solver_config ({})
+        Dictionary. Solver of the experimentation ('solver'), its relative and
+        absolute tolerances ('rtol', 'atol') and its maximum step ('max_step', the
+        fixed step of fixed-step solvers). PyFMI defaults are used for those not set.
+
     """
-    defaults = {'initialState': [], 'final_time': 0.0, 'user_parameters': {}}
+    defaults = {'initialState': [], 'final_time': 0.0, 'user_parameters': {}, 'output_names': [], 'ncp': 0,
+                'output_interval': 0.0, 'timings': None, 'snapshot': None,
+                'stop_conditions': None, 'solver_config': {}}
 
     defaults.update(kwargs)
 
+    # PyFMI is only imported when a FMU is simulated, so the numpy_ode backend runs without it
+    from Result_handler import NumpyResultHandler
+
     initial_state = np.array(defaults['initialState'])
 
     if not bool(defaults['final_time']):
@@ -37,20 +168,257 @@ def simulate_model(model, **kwargs):
     opts['initialize'] = False
     opts['result_handling'] = 'memory'
 
+    # record only the requested variables at the requested output grid
+    result_handler = None
+    if defaults['output_names']:
+        opts['filter'] = list(defaults['output_names'])
+        result_handler = NumpyResultHandler(model, defaults['output_names'],
+                                            stop_conditions=defaults['stop_conditions'])
+        opts['result_handling'] = 'custom'
+        opts['result_handler'] = result_handler
+    if defaults['ncp']:
+        opts['ncp'] = int(defaults['ncp'])
+    elif defaults['output_interval']:
+        opts['ncp'] = max(1, int(round(defaults['final_time'] / defaults['output_interval'])))
+
+    # solver of the experimentation
+    solver_config = defaults['solver_config']
+    if solver_config.get('solver'):
+        opts['solver'] = solver_config['solver']
+    solver_options = opts[opts['solver'] + '_options']
+    for option in ('rtol', 'atol'):
+        if solver_config.get(option):
+            solver_options[option] = solver_config[option]
+    if solver_config.get('max_step'):
+        # fixed-step solvers take the step as 'h' instead of a maximum step
+        solver_options['maxh' if 'maxh' in solver_options else 'h'] = solver_config['max_step']
+
     # set up model for the beginning of the simulation
-    model.reset()
-    model.setup_experiment()
-    for sss in defaults['user_parameters']:
-        model.set(sss, defaults['user_parameters'][sss])
+    start_time_setup = time.time()
+    snapshot = defaults['snapshot']
+    if snapshot is not None:
+        snapshot.restore()
+        model.setup_experiment()
+        snapshot.set_parameters(defaults['user_parameters'])
+    else:
+        model.reset()
+        model.setup_experiment()
+        for sss in defaults['user_parameters']:
+            model.set(sss, defaults['user_parameters'][sss])
 
     # initialize model
-    model.initialize()
+    start_time_initialize = time.time()
+    if snapshot is not None:
+        # PyFMI keeps its own record of the initialization of the previous simulation, as the FMU is not reset
+        model.enter_initialization_mode()
+        model.exit_initialization_mode()
+    else:
+        model.initialize()
     if initial_state.size > 0:
         model.continuous_states = initial_state
     model.event_update()
     model.enter_continuous_time_mode()
 
     # simulate
+    start_time_integrate = time.time()
     simulation_result = model.simulate(start_time=0.0, final_time=defaults['final_time'], options=opts)
 
+    if defaults['timings'] is not None:
+        defaults['timings']['setup'] = start_time_initialize - start_time_setup
+        defaults['timings']['initialize'] = start_time_integrate - start_time_initialize
+        defaults['timings']['integrate'] = time.time() - start_time_integrate
+
+    # return the buffers of the result handler directly, without going through the PyFMI result object
+    if result_handler is not None:
+        return result_handler.get_result()
+
     return simulation_result
+
+
+class SimulationBackend:
+    """ Executes the simulations of the SEA. A backend receives the parameter sets of a batch of simulations and
+        returns their results. Backends whose batch_size is greater than 1 simulate a whole batch at once, so the SEA
+        leases the simulations in blocks of that size
+    """
+
+    batch_size = 1
+
+    def simulate_batch(self, parameter_sets, output_names, ncp=0, output_interval=0.0, final_time=0.0, timings=None):
+        """ Simulates a batch of parameter sets
+
+            Args:
+                parameter_sets (list): contains a dict with the parameters of each simulation
+                output_names (list): names of the variables to be recorded
+                ncp (int): number of communication points (the default of the backend if 0)
+                output_interval (float): time between two recorded points. Only used when ncp is not set
+                final_time (float): final time of the simulations (5.0 if 0)
+                timings (dict): if set, the durations of the phases of the whole batch are stored in it
+
+            Returns:
+                list: contains the results of each simulation, a dict with an array per output variable
+        """
+        raise NotImplementedError
+
+
+class PyFMIBackend(SimulationBackend):
+    """ Default backend: simulates the parameter sets one by one with the loaded FMU (see simulate_model)
+    """
+
+    def __init__(self, model, solver_config=None, snapshot=None, stop_conditions=None):
+        """
+            Args:
+                model (FMUModel): loaded FMU
+                solver_config (dict): solver of the experimentation (see simulate_model)
+                snapshot (ModelSnapshot): snapshot restored before every simulation, or None to reset the FMU
+                stop_conditions (StopConditions): conditions that end the simulations early, or None
+        """
+        self.model = model
+        self.solver_config = solver_config or {}
+        self.snapshot = snapshot
+        self.stop_conditions = stop_conditions
+
+    def simulate_batch(self, parameter_sets, output_names, ncp=0, output_interval=0.0, final_time=0.0, timings=None):
+        results = []
+        for parameters in parameter_sets:
+            simulation_timings = {}
+            results.append(simulate_model(self.model, user_parameters=parameters, output_names=output_names, ncp=ncp,
+                                          output_interval=output_interval, final_time=final_time,
+                                          solver_config=self.solver_config, snapshot=self.snapshot,
+                                          stop_conditions=self.stop_conditions, timings=simulation_timings))
+            if timings is not None:
+                for phase, duration in simulation_timings.items():
+                    timings[phase] = timings.get(phase, 0.0) + duration
+
+        return results
+
+
+class NumpyODEBackend(SimulationBackend):
+    """ Backend for models that expose their right-hand side as a Python module (see model/Academic_model_ode.py).
+        The states of the whole batch are integrated at once with a fixed-step fourth order Runge-Kutta method on
+        NumPy arrays, so small models are simulated at array speed instead of paying the set-up and initialization of
+        an FMU per simulation. The module defines:
+
+            PARAMETERS: dict with the parameters of the model and their default values
+            initial_state(params): states at the start time, with shape (number of states, batch size)
+            derivatives(t, x, params): time derivative of the states
+            outputs(t, x, params): dict with the value of each output variable for the whole batch
+
+        where params is a dict with an array per parameter containing its value in each simulation.
+
+        The stop conditions, if any, are evaluated at every communication point. The simulations that meet one of
+        them are removed from the integrated states, so the batch gets cheaper as its simulations stop.
+    """
+
+    def __init__(self, ode_model, batch_size=256, max_step=1e-3, stop_conditions=None):
+        """
+            Args:
+                ode_model (module): module exposing the right-hand side of the model
+                batch_size (int): number of simulations integrated at once
+                max_step (float): maximum integration step (in seconds). The step is adjusted to fall on every
+                                  communication point
+                stop_conditions (StopConditions): conditions that end the simulations early, or None
+        """
+        self.ode_model = ode_model
+        self.batch_size = batch_size
+        self.max_step = max_step
+        self.stop_conditions = stop_conditions if stop_conditions else None
+
+    def simulate_batch(self, parameter_sets, output_names, ncp=0, output_interval=0.0, final_time=0.0, timings=None):
+        if not final_time:
+            final_time = 5.0
+        if not ncp:
+            ncp = max(1, int(round(final_time / output_interval))) if output_interval else 500
+
+        start_time_setup = time.time()
+        # reject the parameters the model does not define, as the FMU does, instead of ignoring them
+        unknown_parameters = set().union(*parameter_sets) - set(self.ode_model.PARAMETERS)
+        if unknown_parameters:
+            raise ValueError('Unknown parameters of the model: {0}'.format(', '.join(sorted(unknown_parameters))))
+
+        batch_size = len(parameter_sets)
+        params = {name: np.array([parameters.get(name, default) for parameters in parameter_sets], dtype=np.float64)
+                  for name, default in self.ode_model.PARAMETERS.items()}
+
+        # the samples of each simulation are contiguous, so its results are views over the buffer
+        buffer = np.empty((len(output_names), batch_size, ncp + 1), dtype=np.float64)
+
+        # simulations still being integrated and, for the stopped ones, their last point and the condition met
+        active = np.arange(batch_size)
+        last_points = np.full(batch_size, ncp)
+        stop_reasons = [None] * batch_size
+        communication_interval = final_time / ncp
+        times = communication_interval * np.arange(ncp + 1)
+
+        start_time_initialize = time.time()
+        x = np.asarray(self.ode_model.initial_state(params), dtype=np.float64)
+        self._record(buffer, 0, 0.0, x, params, output_names, active)
+
+        start_time_integrate = time.time()
+        n_steps = max(1, int(np.ceil(communication_interval / self.max_step)))
+        h = communication_interval / n_steps
+        derivatives = self.ode_model.derivatives
+        t = 0.0
+        for point in range(1, ncp + 1):
+            for step in range(n_steps):
+                k1 = derivatives(t, x, params)
+                k2 = derivatives(t + h / 2, x + h / 2 * k1, params)
+                k3 = derivatives(t + h / 2, x + h / 2 * k2, params)
+                k4 = derivatives(t + h, x + h * k3, params)
+                x = x + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+                t += h
+            t = times[point]
+            self._record(buffer, point, t, x, params, output_names, active)
+
+            if self.stop_conditions is not None:
+                # only the simulations being integrated are evaluated, over the samples the conditions depend on, as
+                # the samples of the stopped ones are not recorded anymore
+                start = self.stop_conditions.window_start(times[:point + 1])
+                series = {name: buffer[output_names.index(name), active, start:point + 1]
+                          for name in self.stop_conditions.variables}
+                met = self.stop_conditions.check(times[start:point + 1], series)
+                if np.any(met >= 0):
+                    for simulation, index in zip(active[met >= 0], met[met >= 0]):
+                        last_points[simulation] = point
+                        stop_reasons[simulation] = self.stop_conditions.names[index]
+                    # the stopped simulations are no longer integrated
+                    running = met < 0
+                    active = active[running]
+                    x = x[:, running]
+                    params = {name: values[running] for name, values in params.items()}
+                    if not active.size:
+                        break
+
+        if timings is not None:
+            timings['setup'] = start_time_initialize - start_time_setup
+            timings['initialize'] = start_time_integrate - start_time_initialize
+            timings['integrate'] = time.time() - start_time_integrate
+
+        return [SimulationOutput({name: buffer[row, simulation, :last_points[simulation] + 1]
+                                  for row, name in enumerate(output_names)},
+                                 stop_reasons[simulation],
+                                 times[last_points[simulation]] if stop_reasons[simulation] else None)
+                for simulation in range(batch_size)]
+
+    def _record(self, buffer, point, t, x, params, output_names, active):
+        """ Stores the outputs of the simulations being integrated at a communication point
+        """
+        values = self.ode_model.outputs(t, x, params)
+        for row, name in enumerate(output_names):
+            buffer[row, active, point] = values[name]
+
+
+def load_ode_model(path):
+    """ Loads the module exposing the right-hand side of a model for the NumpyODEBackend
+
+        Args:
+            path (str): path of the Python file of the module
+
+        Returns:
+            module: the loaded module
+    """
+    loader = importlib.machinery.SourceFileLoader('ode_model', path)
+    spec = importlib.util.spec_from_loader('ode_model', loader)
+    ode_model = importlib.util.module_from_spec(spec)
+    loader.exec_module(ode_model)
+
+    return ode_model
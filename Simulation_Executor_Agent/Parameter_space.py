@@ -0,0 +1,54 @@
+import numpy as np
+
+
+class ParameterGrid:
+    """ Parameter grid of an experimentation stored in implicit mode. The configuration of a simulation is not stored in
+        the database: it is decoded from its simulation id by mixed-radix decoding over the values of the input
+        parameters, following the same order used by the SGA to generate the simulations (itertools.product order).
+    """
+
+    def __init__(self, grid_id, first_simulation_id, n_simulations, param_names, param_values, anomalous_values):
+        """
+            Args:
+                grid_id (int): identifier of the grid
+                first_simulation_id (int): simulation id of the first combination of the grid
+                n_simulations (int): number of simulations of the grid
+                param_names (list): names of the input parameters in the order they are combined
+                param_values (list): values of each input parameter
+                anomalous_values (dict): anomalous values of the input parameters used to label the simulations
+        """
+        self.grid_id = grid_id
+        self.first_simulation_id = first_simulation_id
+        self.n_simulations = n_simulations
+        self.param_names = list(param_names)
+        self.param_values = [np.array(values, dtype=np.float64) for values in param_values]
+        self.shape = tuple(len(values) for values in self.param_values)
+
+        # for each parameter, whether each of its values makes the simulation anomalous
+        self.anomalous_masks = [np.isin(values, anomalous_values.get(name, []))
+                                for name, values in zip(self.param_names, self.param_values)]
+
+    def decode(self, simulation_ids):
+        """ Decodes the configuration and the label of the given simulations
+
+            Args:
+                simulation_ids (array): identifiers of simulations of the grid
+
+            Returns:
+                dict: contains an array with the values of each input parameter and the label of the simulations
+        """
+        offsets = np.asarray(simulation_ids, dtype=np.int64) - self.first_simulation_id
+        if offsets.size and (offsets.min() < 0 or offsets.max() >= self.n_simulations):
+            raise ValueError('Simulation ids out of grid {0}'.format(self.grid_id))
+
+        indexes = np.unravel_index(offsets, self.shape)
+
+        configs = {name: values[index] for name, values, index in zip(self.param_names, self.param_values, indexes)}
+
+        # label=1 if any of the parameters of the simulation has an anomalous value
+        label = np.zeros(offsets.size, dtype=bool)
+        for mask, index in zip(self.anomalous_masks, indexes):
+            label |= mask[index]
+        configs['label'] = label.astype(np.int32)
+
+        return configs
@@ -0,0 +1,175 @@
+import json
+import hashlib
+import psycopg2
+from Metrics import METRICS
+from Result_codec import encode_trajectory, decode_trajectory
+from DB_Manager import get_cached_results, insert_cached_results, evict_result_cache
+
+
+def hash_parameters(parameters):
+    """ Hashes a parameter set independently of the order of its parameters and of the numeric type of their values
+
+        Args:
+            parameters (dict): value of each parameter
+
+        Returns:
+            str: SHA-256 of the canonical form of the parameter set
+    """
+    canonical = json.dumps(sorted((name, float(value)) for name, value in parameters.items()))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def hash_solver_settings(solver_settings):
+    """ Hashes the settings that change the results of a simulation besides its parameters
+
+        Args:
+            solver_settings (dict): backend, solver configuration and output grid of the simulations
+
+        Returns:
+            str: SHA-256 of the canonical form of the settings
+    """
+    return hashlib.sha256(json.dumps(solver_settings, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+    """ Cache of simulation results shared by every experimentation of the database, keyed by the SHA-256 of the FMU,
+        the hash of the parameter set and the hash of the solver settings. Simulations already executed by a previous
+        experimentation with the same FMU and solver are copied from the cache instead of being simulated again. The
+        least recently used entries are evicted once the cache grows over its maximum number of entries.
+    """
+
+    def __init__(self, db_session, fmu_sha256, solver_settings, result_dtype='float64', result_compression='none',
+                 max_entries=0, eviction_interval=1000):
+        """
+            Args:
+                db_session (DBSession): persistent session to the database
+                fmu_sha256 (str): SHA-256 of the FMU
+                solver_settings (dict): backend, solver configuration and output grid of the simulations
+                result_dtype (str): data type used to store the cached results ('float64' or 'float32')
+                result_compression (str): compression used to store the cached results ('none', 'zstd' or 'lz4')
+                max_entries (int): maximum number of entries of the cache (0 for no limit)
+                eviction_interval (int): entries stored by the agent between two evictions
+        """
+        self.db_session = db_session
+        self.fmu_sha256 = fmu_sha256
+        self.solver_hash = hash_solver_settings(solver_settings)
+        self.result_dtype = result_dtype
+        self.result_compression = result_compression
+        self.max_entries = max_entries
+        self.eviction_interval = eviction_interval
+        self.stored_since_eviction = 0
+        self.hits = 0
+        self.misses = 0
+        self.evict()
+
+    def get_many(self, parameter_sets, output_names):
+        """ Gets the cached results of a batch of parameter sets with a single query
+
+            Args:
+                parameter_sets (list): contains a dict with the parameters of each simulation
+                output_names (list): names of the variables to be returned
+
+            Returns:
+                list: contains the results of each simulation (a dict with an array per variable), or None for the
+                      simulations that are not cached
+        """
+        parameters_hashes = [hash_parameters(parameters) for parameters in parameter_sets]
+        try:
+            cached_results = get_cached_results(self.db_session, self.fmu_sha256, self.solver_hash,
+                                                list(set(parameters_hashes)))
+        except (Exception, psycopg2.DatabaseError) as error:
+            print('The result cache could not be read:\n\t{0}'.format(error))
+            cached_results = {}
+
+        simulation_outputs = []
+        for parameters_hash in parameters_hashes:
+            simulation_output = None
+            if parameters_hash in cached_results:
+                cached_names, cached_outputs = cached_results[parameters_hash]
+                cached_outputs = dict(zip(cached_names, cached_outputs))
+                # results cached by an experimentation that recorded other variables are not valid
+                if all(name in cached_outputs for name in output_names):
+                    simulation_output = {name: decode_trajectory(cached_outputs[name]) for name in output_names}
+            simulation_outputs.append(simulation_output)
+
+        hits = sum(simulation_output is not None for simulation_output in simulation_outputs)
+        self.hits += hits
+        self.misses += len(simulation_outputs) - hits
+        METRICS.inc('sea_result_cache_hits_total', hits)
+        METRICS.inc('sea_result_cache_misses_total', len(simulation_outputs) - hits)
+
+        return simulation_outputs
+
+    def get(self, parameters, output_names):
+        """ Gets the cached results of a parameter set
+
+            Args:
+                parameters (dict): parameters of the simulation
+                output_names (list): names of the variables to be returned
+
+            Returns:
+                dict: contains an array with the results of each variable, or None if the simulation is not cached
+        """
+        return self.get_many([parameters], output_names)[0]
+
+    def put_many(self, parameter_sets, simulation_outputs, output_names):
+        """ Stores the results of a batch of simulations. Results that can not be stored are discarded, as they are
+            not needed to complete the experimentation. Simulations ended by a stop condition are not stored, as the
+            cache does not keep the reason why they stopped
+
+            Args:
+                parameter_sets (list): contains a dict with the parameters of each simulation
+                simulation_outputs (list): contains the results of each simulation
+                output_names (list): names of the variables to be stored
+        """
+        entries = [(hash_parameters(parameters), json.dumps(parameters, default=float), list(output_names),
+                    [psycopg2.Binary(encode_trajectory(simulation_output[name], self.result_dtype,
+                                                       self.result_compression))
+                     for name in output_names])
+                   for parameters, simulation_output in zip(parameter_sets, simulation_outputs)
+                   if getattr(simulation_output, 'stop_reason', None) is None]
+        if not entries:
+            return
+        try:
+            insert_cached_results(self.db_session, self.fmu_sha256, self.solver_hash, entries)
+        except (Exception, psycopg2.DatabaseError) as error:
+            print('The results of {0} simulations could not be cached:\n\t{1}'.format(len(entries), error))
+            return
+
+        self.stored_since_eviction += len(entries)
+        if self.stored_since_eviction >= self.eviction_interval:
+            self.evict()
+
+    def put(self, parameters, simulation_output, output_names):
+        """ Stores the results of a simulation
+
+            Args:
+                parameters (dict): parameters of the simulation
+                simulation_output (dict): contains the results of the simulation
+                output_names (list): names of the variables to be stored
+        """
+        self.put_many([parameters], [simulation_output], output_names)
+
+    def evict(self):
+        """ Removes the least recently used entries over the maximum number of entries. Only one agent evicts at a
+            time: the others skip the eviction
+        """
+        self.stored_since_eviction = 0
+        if not self.max_entries:
+            return
+
+        try:
+            evicted = evict_result_cache(self.db_session, self.max_entries)
+        except (Exception, psycopg2.DatabaseError) as error:
+            print('The result cache could not be evicted:\n\t{0}'.format(error))
+            return
+
+        if evicted:
+            print('{0} entries evicted from the result cache'.format(evicted))
+
+    def print_stats(self):
+        """ Prints the hits and misses of the agent
+        """
+        lookups = self.hits + self.misses
+        print('Result cache: {0} hits, {1} misses ({2:.1f}% hit ratio)'.format(
+            self.hits, self.misses, 100 * self.hits / lookups if lookups else 0.0))
@@ -0,0 +1,122 @@
+import struct
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Binary format of a trajectory stored in a bytea column of simulation_results:
+#
+#   magic (4 bytes) | version (1 byte) | dtype (1 byte) | compression (1 byte) | padding (1 byte) | samples (8 bytes)
+#   followed by the samples as raw little-endian floats, optionally compressed
+#
+# Values written before this format was introduced are comma separated text. They have no magic and are still decoded.
+MAGIC = b'CFMI'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBBxQ')
+
+DTYPES = {'float64': 1, 'float32': 2}
+NUMPY_DTYPES = {1: np.dtype('<f8'), 2: np.dtype('<f4')}
+
+COMPRESSIONS = {'none': 0, 'zstd': 1, 'lz4': 2}
+
+
+def check_encoding(dtype, compression):
+    """ Checks whether a trajectory can be encoded with the given data type and compression
+
+        Args:
+            dtype (str): data type of the samples ('float64' or 'float32')
+            compression (str): compression of the samples ('none', 'zstd' or 'lz4')
+    """
+    if dtype not in DTYPES:
+        raise ValueError("Unknown result data type '{0}'. Valid values: {1}".format(dtype, ', '.join(DTYPES)))
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unknown result compression '{0}'. Valid values: {1}".format(compression,
+                                                                                    ', '.join(COMPRESSIONS)))
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError("zstd compression requires the 'zstandard' package")
+    if compression == 'lz4' and lz4 is None:
+        raise ValueError("lz4 compression requires the 'lz4' package")
+
+
+def encode_trajectory(values, dtype='float64', compression='none'):
+    """ Encodes the samples of a simulated variable into the binary format stored in the database
+
+        Args:
+            values (array): samples of the variable
+            dtype (str): data type of the stored samples ('float64' or 'float32')
+            compression (str): compression of the stored samples ('none', 'zstd' or 'lz4')
+
+        Returns:
+            bytes: encoded trajectory
+    """
+    check_encoding(dtype, compression)
+    dtype_code = DTYPES[dtype]
+
+    # no copy is made when the samples already have the requested type and are contiguous
+    samples = np.ascontiguousarray(values, dtype=NUMPY_DTYPES[dtype_code])
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, dtype_code, COMPRESSIONS[compression], samples.size)
+
+    if compression == 'zstd':
+        payload = zstandard.ZstdCompressor().compress(samples.data)
+    elif compression == 'lz4':
+        payload = lz4.frame.compress(samples.data)
+    else:
+        payload = samples.data
+
+    return b''.join((header, payload))
+
+
+def decode_trajectory(data):
+    """ Decodes a trajectory stored in the database. Uncompressed trajectories are not copied: the returned array is a
+        read-only view over the given buffer
+
+        Args:
+            data (bytes or memoryview): content of the bytea column
+
+        Returns:
+            np.ndarray: samples of the variable
+    """
+    data = memoryview(data)
+
+    if data.nbytes < HEADER.size or data[:len(MAGIC)].tobytes() != MAGIC:
+        return _decode_legacy_trajectory(data)
+
+    magic, version, dtype_code, compression_code, samples = HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError('Unsupported trajectory format version: {0}'.format(version))
+    dtype = NUMPY_DTYPES[dtype_code]
+    payload = data[HEADER.size:]
+
+    if compression_code == COMPRESSIONS['zstd']:
+        if zstandard is None:
+            raise ValueError("zstd compressed trajectories require the 'zstandard' package")
+        payload = zstandard.ZstdDecompressor().decompress(payload, max_output_size=samples * dtype.itemsize)
+    elif compression_code == COMPRESSIONS['lz4']:
+        if lz4 is None:
+            raise ValueError("lz4 compressed trajectories require the 'lz4' package")
+        payload = lz4.frame.decompress(payload)
+
+    return np.frombuffer(payload, dtype=dtype, count=samples)
+
+
+def _decode_legacy_trajectory(data):
+    """ Decodes a trajectory stored as comma separated text
+
+        Args:
+            data (memoryview): content of the bytea column
+
+        Returns:
+            np.ndarray: samples of the variable
+    """
+    text = data.tobytes().decode()
+    if not text:
+        return np.empty(0, dtype=np.float64)
+
+    return np.array(text.split(','), dtype=np.float64)
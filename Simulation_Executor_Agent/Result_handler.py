@@ -0,0 +1,143 @@
+import numpy as np
+from pyfmi.common.io import ResultHandler, Trajectory
+from pyfmi.fmi import FMI2_REAL, FMI2_INTEGER, FMI2_BOOLEAN
+from assimulo.exception import TerminateSimulation
+
+
+class NumpyResult:
+    """ Result of a simulation recorded by NumpyResultHandler. Each variable is a contiguous view over the buffer of
+        the handler, so it can be handed to the persistence layer without copying it
+    """
+
+    def __init__(self, names, buffer, n_points):
+        """
+            Args:
+                names (list): names of the recorded variables. The time is stored in the first row of the buffer
+                buffer (np.ndarray): recorded samples with shape (number of variables + 1, capacity)
+                n_points (int): number of recorded samples
+        """
+        self.rows = {name: row for row, name in enumerate(['time'] + list(names))}
+        self.buffer = buffer
+        self.n_points = n_points
+        # name of the stop condition that ended the simulation and time at which it was met, if any
+        self.stop_reason = None
+        self.stop_time = None
+
+    def __getitem__(self, name):
+        return self.buffer[self.rows[name], :self.n_points]
+
+    def __contains__(self, name):
+        return name in self.rows
+
+    def keys(self):
+        return self.rows.keys()
+
+    def is_variable(self, name):
+        return name in self.rows
+
+    def is_negated(self, name):
+        return False
+
+    def get_variable_data(self, name):
+        return Trajectory(self['time'], self[name])
+
+
+class NumpyResultHandler(ResultHandler):
+    """ PyFMI result handler that writes the samples of the selected variables straight into a preallocated NumPy
+        buffer. The buffer is sized for the expected number of communication points and it only grows (doubling its
+        size) when events add extra points, so the memory used by a simulation is bounded and predictable.
+
+        The stop conditions, if any, are evaluated at every recorded point: once one of them is met the integration is
+        terminated and the result keeps the samples recorded up to that point.
+    """
+
+    def __init__(self, model, names, expected_points=501, stop_conditions=None):
+        """
+            Args:
+                model (FMUModel): model being simulated
+                names (list): names of the variables to be recorded
+                expected_points (int): expected number of recorded samples, used to size the buffer
+                stop_conditions (StopConditions): conditions that end the simulation early, or None
+        """
+        super().__init__(model)
+        self.names = list(names)
+        self.expected_points = expected_points
+        self.buffer = None
+        self.n_points = 0
+        self.stop_conditions = stop_conditions if stop_conditions else None
+        self.stop_reason = None
+        self.stop_time = None
+        if self.stop_conditions is not None:
+            missing_variables = set(self.stop_conditions.variables) - set(self.names)
+            if missing_variables:
+                raise ValueError('The variables of the stop conditions must be recorded: {0}'.format(
+                    ', '.join(sorted(missing_variables))))
+            # buffer rows of the variables evaluated by the stop conditions
+            self.stop_rows = {name: self.names.index(name) + 1 for name in self.stop_conditions.variables}
+
+        # value references and buffer rows of the variables grouped by type (row 0 is the time)
+        self.variables = {}
+        for row, name in enumerate(self.names, start=1):
+            data_type = model.get_variable_data_type(name)
+            if data_type not in (FMI2_REAL, FMI2_INTEGER, FMI2_BOOLEAN):
+                raise ValueError('Variable {0} can not be recorded as a number'.format(name))
+            value_references, rows = self.variables.setdefault(data_type, ([], []))
+            value_references.append(model.get_variable_valueref(name))
+            rows.append(row)
+        self.variables = {data_type: (np.array(value_references, dtype=np.uint32), np.array(rows))
+                          for data_type, (value_references, rows) in self.variables.items()}
+
+    def set_options(self, options):
+        super().set_options(options)
+        if options.get('ncp'):
+            self.expected_points = int(options['ncp']) + 1
+
+    def simulation_start(self, *args, **kwargs):
+        # the buffer of the previous simulation is not reused as it may still be referenced by its result
+        self.buffer = np.empty((len(self.names) + 1, self.expected_points), dtype=np.float64)
+        self.n_points = 0
+        self.stop_reason = None
+        self.stop_time = None
+
+    def integration_point(self, solver=None, *args, **kwargs):
+        if self.n_points == self.buffer.shape[1]:
+            self._grow()
+
+        model = self.model
+        column = self.buffer[:, self.n_points]
+        column[0] = model.time
+        for data_type, (value_references, rows) in self.variables.items():
+            if data_type == FMI2_REAL:
+                column[rows] = model.get_real(value_references)
+            elif data_type == FMI2_INTEGER:
+                column[rows] = model.get_integer(value_references)
+            else:
+                column[rows] = model.get_boolean(value_references)
+        self.n_points += 1
+
+        if self.stop_conditions is not None:
+            # only the samples the conditions depend on are evaluated
+            start = self.stop_conditions.window_start(self.buffer[0, :self.n_points])
+            series = {name: self.buffer[row, start:self.n_points] for name, row in self.stop_rows.items()}
+            met = int(self.stop_conditions.check(self.buffer[0, start:self.n_points], series))
+            if met >= 0:
+                self.stop_reason = self.stop_conditions.names[met]
+                self.stop_time = column[0]
+                # the solver ends the simulation gracefully, keeping the recorded samples
+                raise TerminateSimulation()
+
+    def diagnostics_point(self, *args, **kwargs):
+        pass
+
+    def get_result(self):
+        result = NumpyResult(self.names, self.buffer, self.n_points)
+        result.stop_reason = self.stop_reason
+        result.stop_time = self.stop_time
+        return result
+
+    def _grow(self):
+        """ Doubles the capacity of the buffer
+        """
+        buffer = np.empty((self.buffer.shape[0], 2 * self.buffer.shape[1]), dtype=np.float64)
+        buffer[:, :self.n_points] = self.buffer[:, :self.n_points]
+        self.buffer = buffer
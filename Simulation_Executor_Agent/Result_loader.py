@@ -0,0 +1,166 @@
+from collections import OrderedDict
+import numpy as np
+from DB_Session import DBSession
+from Result_codec import decode_trajectory
+from DB_Manager import get_output_params_names, select_simulation_ids, get_simulation_results
+
+
+class ResultLoader:
+    """ Read-side client of the results of an experimentation, for analysis scripts and notebooks. The trajectories
+        are returned as NumPy arrays built over the fetched bytea buffers, without parsing them sample by sample:
+        uncompressed trajectories are read-only views, so copy them before modifying them. Large selections are
+        fetched in batches and the decoded results of the most recently used simulations are kept in memory.
+
+        Example:
+            with ResultLoader(db_config_params) as loader:
+                simulation_ids = loader.select({'M1': (10, 20)}, label=1)
+                s1 = loader.load_matrix(simulation_ids, 's1')
+    """
+
+    def __init__(self, db_config_params, cache_size=10000, batch_size=1000):
+        """
+            Args:
+                db_config_params (dict): contains the connection parameters of the database
+                cache_size (int): number of simulations whose decoded results are cached (0 to disable the cache)
+                batch_size (int): number of simulations fetched at once
+        """
+        self.db_session = DBSession(db_config_params)
+        self.output_params_names = get_output_params_names(self.db_session)
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """ Closes the session to the database
+        """
+        self.db_session.close()
+
+    def select(self, parameter_filter=None, label=None):
+        """ Gets the ids of the executed simulations whose parameters match a filter
+
+            Args:
+                parameter_filter (dict): condition of each parameter: a value, a list of values or a (low, high)
+                                         tuple with the bounds of a range
+                label (int): label of the simulations, or None for every label
+
+            Returns:
+                list: ids of the matching simulations, in ascending order
+        """
+        return select_simulation_ids(self.db_session, parameter_filter, label)
+
+    def iter_results(self, simulation_ids=None, variables=None, parameter_filter=None, label=None):
+        """ Streams the results of a selection of simulations in batches, so only one batch is fetched at a time
+
+            Args:
+                simulation_ids (list): ids of the simulations, or None to select them with the filter
+                variables (list): names of the output variables, or None for all of them
+                parameter_filter (dict): condition of each parameter (see select). Only used without simulation_ids
+                label (int): label of the simulations. Only used without simulation_ids
+
+            Yields:
+                tuple: id of a simulation and a dict with an array per output variable
+        """
+        if simulation_ids is None:
+            simulation_ids = self.select(parameter_filter, label)
+
+        simulation_ids = [int(simulation_id) for simulation_id in simulation_ids]
+        for start in range(0, len(simulation_ids), self.batch_size):
+            batch_ids = simulation_ids[start:start + self.batch_size]
+            results = self.load(batch_ids, variables)
+            for simulation_id in batch_ids:
+                if simulation_id in results:
+                    yield simulation_id, results[simulation_id]
+
+    def load(self, simulation_ids, variables=None):
+        """ Loads the results of a set of simulations. Those not in the cache are fetched in batches
+
+            Args:
+                simulation_ids (list): ids of the simulations
+                variables (list): names of the output variables, or None for all of them
+
+            Returns:
+                dict: contains a dict with an array per output variable for each found simulation, keyed by its id
+        """
+        variables = self._check_variables(variables)
+
+        results = {}
+        missing_ids = []
+        for simulation_id in simulation_ids:
+            simulation_id = int(simulation_id)
+            cached_result = self.cache.get(simulation_id)
+            if cached_result is not None and all(name in cached_result for name in variables):
+                self.cache.move_to_end(simulation_id)
+                results[simulation_id] = {name: cached_result[name] for name in variables}
+                self.hits += 1
+            else:
+                missing_ids.append(simulation_id)
+                self.misses += 1
+
+        for start in range(0, len(missing_ids), self.batch_size):
+            rows = get_simulation_results(self.db_session, missing_ids[start:start + self.batch_size], variables)
+            for row in rows:
+                result = {name: decode_trajectory(data) for name, data in zip(variables, row[1:])}
+                results[row[0]] = result
+                self._cache(row[0], result)
+
+        return results
+
+    def load_matrix(self, simulation_ids, variable):
+        """ Loads a variable of a set of simulations as a matrix. Every trajectory must have the same length
+
+            Args:
+                simulation_ids (list): ids of the simulations
+                variable (str): name of the output variable
+
+            Returns:
+                np.ndarray: trajectory of each simulation, with shape (number of simulations, number of samples), in
+                            the order of simulation_ids
+        """
+        results = self.load(simulation_ids, [variable])
+        missing_ids = [simulation_id for simulation_id in simulation_ids if int(simulation_id) not in results]
+        if missing_ids:
+            raise KeyError('No results for the simulations {0}'.format(missing_ids[:10]))
+
+        return np.stack([results[int(simulation_id)][variable] for simulation_id in simulation_ids])
+
+    def _check_variables(self, variables):
+        """ Checks the requested output variables
+
+            Args:
+                variables (list): names of the output variables, or None for all of them
+
+            Returns:
+                list: names of the output variables
+        """
+        if variables is None:
+            return list(self.output_params_names)
+
+        unknown_variables = set(variables) - set(self.output_params_names)
+        if unknown_variables:
+            raise ValueError('Unknown output variables: {0}'.format(', '.join(sorted(unknown_variables))))
+
+        return list(variables)
+
+    def _cache(self, simulation_id, result):
+        """ Adds decoded results to the cache, merged with those already cached, and evicts the least recently used
+            simulations
+
+            Args:
+                simulation_id (int): id of the simulation
+                result (dict): contains an array per output variable
+        """
+        if not self.cache_size:
+            return
+
+        self.cache[simulation_id] = dict(self.cache.get(simulation_id, {}), **result)
+        self.cache.move_to_end(simulation_id)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
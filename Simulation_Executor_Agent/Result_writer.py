@@ -0,0 +1,158 @@
+import time
+import queue
+import threading
+import psycopg2
+from DB_Manager import insert_simulation_results, insert_simulation_results_batch, update_simulation_state, \
+    rollback_simulation_state
+from DB_Session import DBSession
+from Metrics import METRICS
+from Timing_recorder import TimingRecorder
+
+
+class ResultWriter(threading.Thread):
+    """ Background thread that persists the results of the simulations while the agent keeps simulating. Completed
+        simulations are queued in a bounded queue and written in batches, together with their 'Executed' state, in a
+        single transaction. When the database is slower than the simulations the queue fills up and submit() blocks,
+        which throttles the agent instead of accumulating results in memory.
+    """
+
+    def __init__(self, db_config_params, sea_id, output_params_names, queue_size=16, batch_size=8,
+                 flush_interval=1.0, result_dtype='float64', result_compression='none', lease_heartbeat=None,
+                 record_timings=False):
+        """
+            Args:
+                db_config_params (dict): contains the connection parameters of the database
+                sea_id (string): id of the simulation executor agent
+                output_params_names (list): contains the names of the output parameters
+                queue_size (int): maximum number of results waiting to be written
+                batch_size (int): maximum number of results written in a single transaction
+                flush_interval (float): maximum time (in seconds) a result waits for a batch to be completed
+                result_dtype (str): data type used to store the results ('float64' or 'float32')
+                result_compression (str): compression used to store the results ('none', 'zstd' or 'lz4')
+                lease_heartbeat (LeaseHeartbeat): heartbeat renewing the leases of the queued simulations, if any.
+                                                  The leases stop being renewed once the results are written
+                record_timings (bool): whether the timings of the simulations are stored in simulation_timings
+        """
+        super().__init__(name='ResultWriter', daemon=True)
+        self.db_session = DBSession(db_config_params)
+        self.sea_id = sea_id
+        self.output_params_names = output_params_names
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.result_dtype = result_dtype
+        self.result_compression = result_compression
+        self.lease_heartbeat = lease_heartbeat
+        self.timing_recorder = TimingRecorder(self.db_session, sea_id) if record_timings else None
+
+        self.results = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.error = None
+
+    def submit(self, simulation_id, execution_time, simulation_output, label, timings=None):
+        """ Queues the results of a simulation to be written. It blocks while the queue is full
+
+            Args:
+                simulation_id (int): identifier of the simulation
+                execution_time (int): time required to complete the simulation (in seconds)
+                simulation_output (dict): contains the results of the simulation
+                label: represents to which class belongs the simulation
+                timings (dict): durations of the phases of the simulation already completed. The durations of the
+                                encoding, insertion and state update are added once the results are written
+        """
+        result = {'simulation_id': simulation_id, 'execution_time': execution_time,
+                  'simulation_output': simulation_output, 'label': label, 'timings': timings}
+
+        while True:
+            if not self.is_alive():
+                raise RuntimeError('The result writer is not running: {0}'.format(self.error))
+            try:
+                self.results.put(result, timeout=self.flush_interval)
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        """ Writes the pending results and stops the writer
+        """
+        self.stop_event.set()
+        self.join()
+        if self.timing_recorder is not None:
+            self.timing_recorder.flush()
+        self.db_session.close()
+
+    def run(self):
+        try:
+            while not (self.stop_event.is_set() and self.results.empty()):
+                try:
+                    batch = [self.results.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    continue
+
+                # complete the batch with the results already queued
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.results.get_nowait())
+                    except queue.Empty:
+                        break
+
+                self.write_batch(batch)
+        except Exception as error:
+            self.error = error
+            print("ResultWriter: Execution aborted as a result of an irreversible error:\n\t{0}".format(error))
+
+    def write_batch(self, batch):
+        """ Writes a batch of results. If the batch fails, the results are written one by one so a single faulty
+            simulation does not discard the rest
+
+            Args:
+                batch (list): results to be written
+        """
+        start_time = time.time()
+        batch_timings = {}
+        try:
+            insert_simulation_results_batch(self.db_session, self.sea_id, self.output_params_names, batch,
+                                            self.result_dtype, self.result_compression, batch_timings)
+        except (psycopg2.IntegrityError, psycopg2.DataError, psycopg2.ProgrammingError) as error:
+            print(error)
+            for result in batch:
+                self.write_result(result)
+        else:
+            METRICS.observe('sea_result_write_seconds', time.time() - start_time)
+            METRICS.inc('sea_simulations_total', len(batch))
+            for result in batch:
+                print('\tSimulation {0} marked as Executed\n\n'.format(result['simulation_id']))
+                # the state is updated in the same transaction as the insertion, whose duration is shared by the batch
+                if self.timing_recorder is not None and result['timings'] is not None:
+                    self.timing_recorder.record(result['simulation_id'],
+                                                dict(result['timings'], state_update=0.0,
+                                                     encode=batch_timings['encode'] / len(batch),
+                                                     insert=batch_timings['insert'] / len(batch)))
+        finally:
+            if self.lease_heartbeat is not None:
+                self.lease_heartbeat.remove([result['simulation_id'] for result in batch])
+
+    def write_result(self, result):
+        """ Writes the results of a single simulation
+
+            Args:
+                result (dict): results to be written
+        """
+        simulation_id = result['simulation_id']
+        timings = dict(result['timings'] or {})
+        try:
+            insert_simulation_results(self.db_session, simulation_id, self.sea_id, result['execution_time'],
+                                      self.output_params_names, result['simulation_output'], result['label'],
+                                      self.result_dtype, self.result_compression, timings)
+        except psycopg2.IntegrityError as error:
+            print(error)
+            print("This simulation was already done")
+            update_simulation_state(self.db_session, simulation_id, 'Executed')
+        except psycopg2.DatabaseError as error:
+            print(error)
+            rollback_simulation_state(self.db_session, simulation_id, self.sea_id, 'Database Error')
+        else:
+            start_time = time.time()
+            update_simulation_state(self.db_session, simulation_id, 'Executed')
+            METRICS.inc('sea_simulations_total')
+            if self.timing_recorder is not None and result['timings'] is not None:
+                self.timing_recorder.record(simulation_id, dict(timings, state_update=time.time() - start_time))
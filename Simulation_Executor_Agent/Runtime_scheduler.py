@@ -0,0 +1,157 @@
+import threading
+import numpy as np
+import psycopg2
+from DB_Session import DBSession
+from DB_Manager import get_parameter_names, count_executed_simulations, try_lock_runtime_predictions, \
+    unlock_runtime_predictions, get_runtime_samples, get_pending_simulation_parameters, update_predicted_runtimes
+
+
+class RuntimePredictor:
+    """ Predicts the runtime of a simulation as the mean execution time of its k nearest executed simulations in the
+        parameter space. Every parameter is scaled by its standard deviation, so parameters with large values do not
+        dominate the distance.
+    """
+
+    def __init__(self, n_neighbours=5, block_size=1024):
+        """
+            Args:
+                n_neighbours (int): number of executed simulations averaged by each prediction
+                block_size (int): simulations whose distances to the executed ones are computed at once
+        """
+        self.n_neighbours = n_neighbours
+        self.block_size = block_size
+        self.samples = None
+        self.runtimes = None
+        self.scale = None
+
+    def fit(self, parameters, runtimes):
+        """ Sets the executed simulations the predictions are based on
+
+            Args:
+                parameters (np.ndarray): parameters of the executed simulations, with shape (simulations, parameters)
+                runtimes (np.ndarray): execution time of each executed simulation (in seconds)
+        """
+        parameters = np.asarray(parameters, dtype=np.float64)
+        self.scale = np.nanstd(parameters, axis=0)
+        self.scale[~(self.scale > 0)] = 1.0
+        self.samples = np.nan_to_num(parameters / self.scale)
+        self.runtimes = np.asarray(runtimes, dtype=np.float64)
+
+    def predict(self, parameters):
+        """ Predicts the runtime of a set of simulations
+
+            Args:
+                parameters (np.ndarray): parameters of the simulations, with shape (simulations, parameters)
+
+            Returns:
+                np.ndarray: predicted runtime of each simulation (in seconds)
+        """
+        queries = np.nan_to_num(np.asarray(parameters, dtype=np.float64) / self.scale)
+        k = min(self.n_neighbours, len(self.samples))
+        sample_norms = np.einsum('ij,ij->i', self.samples, self.samples)
+
+        predictions = np.empty(len(queries))
+        for start in range(0, len(queries), self.block_size):
+            block = queries[start:start + self.block_size]
+            # squared distances, up to the norm of each query, which does not change the ranking
+            distances = sample_norms - 2 * block @ self.samples.T
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            predictions[start:start + len(block)] = self.runtimes[nearest].mean(axis=1)
+
+        return predictions
+
+
+class RuntimeScheduler(threading.Thread):
+    """ Background thread that predicts the runtime of the pending simulations from the execution times already
+        stored, so they are leased longest first and the slowest region of the parameter space does not end up at the
+        tail of the experimentation. The predictions are refreshed as new results arrive. Only one agent refreshes them
+        at a time: the others skip the refresh.
+
+        Only the simulations stored in experimentation_config while pending are predicted. The simulations claimed
+        from the parameter grids of an experimentation in implicit mode are inserted as 'Executing', so they never
+        get a prediction and the scheduler is not started for those experimentations.
+    """
+
+    def __init__(self, db_config_params, refresh_interval=60, min_new_results=20, n_neighbours=5,
+                 max_samples=10000, page_size=10000):
+        """
+            Args:
+                db_config_params (dict): contains the connection parameters of the database
+                refresh_interval (float): seconds between two checks for new results
+                min_new_results (int): results stored since the last refresh required to refresh the predictions
+                n_neighbours (int): number of executed simulations averaged by each prediction
+                max_samples (int): maximum number of executed simulations the predictions are based on
+                page_size (int): pending simulations predicted and updated at once
+        """
+        super().__init__(name='RuntimeScheduler', daemon=True)
+        self.db_session = DBSession(db_config_params)
+        self.refresh_interval = refresh_interval
+        self.min_new_results = min_new_results
+        self.max_samples = max_samples
+        self.page_size = page_size
+        self.predictor = RuntimePredictor(n_neighbours)
+        self.parameter_names = None
+        self.n_results = 0
+        self.stop_event = threading.Event()
+
+    def close(self):
+        """ Stops refreshing the predictions
+        """
+        self.stop_event.set()
+        self.join()
+        self.db_session.close()
+
+    def run(self):
+        while not self.stop_event.wait(self.refresh_interval):
+            try:
+                n_results = count_executed_simulations(self.db_session)
+                if n_results - self.n_results < max(1, self.min_new_results):
+                    continue
+                if not try_lock_runtime_predictions(self.db_session):
+                    # another agent is refreshing the predictions with these results
+                    self.n_results = n_results
+                    continue
+                try:
+                    n_predictions = self.refresh(n_results)
+                finally:
+                    unlock_runtime_predictions(self.db_session)
+                self.n_results = n_results
+                print('RuntimeScheduler: predicted runtimes of {0} pending simulations refreshed from {1} '
+                      'results'.format(n_predictions, n_results))
+            except (Exception, psycopg2.DatabaseError) as error:
+                # the predictions are refreshed again in the next interval
+                print('RuntimeScheduler: the predicted runtimes could not be refreshed:\n\t{0}'.format(error))
+
+    def refresh(self, n_results):
+        """ Fits the predictor to a sample of the executed simulations and updates the predicted runtime of every
+            pending simulation, page by page
+
+            Args:
+                n_results (int): number of executed simulations
+
+            Returns:
+                int: number of pending simulations whose runtime is predicted
+        """
+        if self.parameter_names is None:
+            self.parameter_names = get_parameter_names(self.db_session)
+
+        samples = get_runtime_samples(self.db_session, self.parameter_names, self.max_samples, n_results)
+        if not samples:
+            return 0
+        samples = np.array(samples, dtype=np.float64)
+        self.predictor.fit(samples[:, :-1], samples[:, -1])
+
+        n_predictions = 0
+        last_simulation_id = -1
+        while not self.stop_event.is_set():
+            rows = get_pending_simulation_parameters(self.db_session, self.parameter_names, last_simulation_id,
+                                                     self.page_size)
+            if not rows:
+                break
+            simulation_ids = [row[0] for row in rows]
+            predictions = self.predictor.predict(np.array([row[1:] for row in rows], dtype=np.float64))
+            update_predicted_runtimes(self.db_session, list(zip(simulation_ids, predictions.tolist())))
+            n_predictions += len(rows)
+            last_simulation_id = simulation_ids[-1]
+
+        return n_predictions
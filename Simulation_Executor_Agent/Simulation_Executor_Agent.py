@@ -1,15 +1,25 @@
+import os
 import time
 import signal
 import datetime
-import urllib.request
-import shutil
 import string
+from collections import deque
 from random import *
 from argparse import ArgumentParser
-from pyfmi import load_fmu
 from DB_Manager import *
+from DB_Session import DBSession
 from Config_Loader import load_environment_variables
-from Model_executor import simulate_model
+from FMU_cache import load_cached_fmu, download_fmu
+from Result_cache import ResultCache
+from Model_executor import ModelSnapshot, PyFMIBackend, NumpyODEBackend, load_ode_model
+from Stop_conditions import StopConditions
+from Result_codec import check_encoding
+from Result_writer import ResultWriter
+from Lease_heartbeat import LeaseHeartbeat
+from Runtime_scheduler import RuntimeScheduler
+from Simulation_worker import SimulationWorker, SimulationWorkerError
+from Metrics import METRICS
+from Timing_recorder import TimingRecorder
 
 
 def time_out_signal_handler(signum, frame):
@@ -79,20 +89,138 @@ def get_argsv(parser):
         raise SystemExit(0)
 
 
-def download_config_files(path_to_model_remote, path_to_model_local):
-    """ Downloads the required files
+def execute_simulation_batches(db_session, backend, simulation_environment_variables, sea_id, output_params_names,
+                               parameter_grids, lease_heartbeat, timing_recorder, ncp=0, output_interval=0.0,
+                               final_time=0.0, result_cache=None, record_stops=False):
+    """ Executes the simulations with a batch backend. Each lease is simulated at once and its results are written
+        in a single transaction, so the cost per simulation of the database round trips is also divided by the size
+        of the batch
 
         Args:
-            path_to_model_remote (str): remote directory of the file to be downloaded
-            path_to_model_local (str): local directory where the downloaded file is stored
-
+            db_session (DBSession): persistent session to the database
+            backend (SimulationBackend): backend simulating the batches
+            simulation_environment_variables (dict): environment variables required for the correct operation of
+                                                     the simulation
+            sea_id (string): id of the simulation executor agent
+            output_params_names (list): contains the names of the output parameters
+            parameter_grids (dict): parameter grids of the experimentation, or None if it is not in implicit mode
+            lease_heartbeat (LeaseHeartbeat): heartbeat renewing the leases of the batch being executed
+            timing_recorder (TimingRecorder): recorder of the timings of the simulations, or None
+            ncp (int): number of communication points (the default of the backend if 0)
+            output_interval (float): time between two recorded points. Only used when ncp is not set
+            final_time (float): final time of the simulations (the default of the backend if 0)
+            result_cache (ResultCache): cache whose results are copied instead of simulating them, or None
+            record_stops (bool): whether the simulations stopped by a stop condition are recorded
     """
-    # download simulation parameters file
-    print("Downloading files...")
-    print("\t", path_to_model_remote)
-    with urllib.request.urlopen(path_to_model_remote) as response, open(path_to_model_local, 'wb') as out_file:
-        shutil.copyfileobj(response, out_file)
-    print("Download completed")
+    lease_duration = int(simulation_environment_variables['lease_duration'])
+    time_out_period = 60 * int(simulation_environment_variables['time_out'])
+    result_dtype = simulation_environment_variables['result_dtype']
+    result_compression = simulation_environment_variables['result_compression']
+
+    while True:
+        simulation_ids = []
+        try:
+            # lease the next batch of simulations
+            start_time_claim = time.time()
+            leased_simulation_configs = lease_simulation_configs(db_session, backend.batch_size, parameter_grids,
+                                                                 lease_duration)
+            simulation_ids = [config['simulation_id'] for config in leased_simulation_configs]
+            lease_heartbeat.add(simulation_ids)
+            claim_time = time.time() - start_time_claim
+            METRICS.observe('sea_claim_seconds', claim_time)
+
+            # check whether we have finished the simulation
+            if not leased_simulation_configs:
+                if check_failed_simulations(db_session, simulation_environment_variables):
+                    print("One or more failed simulations are found. "
+                          "They have been reset and they will be executed again")
+                    continue
+                else:
+                    break
+
+            labels = [config['label'] for config in leased_simulation_configs]
+            parameter_sets = [{key: value for key, value in config.items() if key not in NON_PARAMETER_COLUMNS}
+                              for config in leased_simulation_configs]
+
+            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            print("{0}: Executing a batch of {1} simulations ({2} to {3})".format(
+                timestamp, len(simulation_ids), simulation_ids[0], simulation_ids[-1]))
+
+            # perform the simulations whose results are not in the result cache
+            signal.alarm(time_out_period)
+            start_time = time.time()
+            timings = {}
+            if result_cache is not None:
+                simulation_outputs = result_cache.get_many(parameter_sets, output_params_names)
+            else:
+                simulation_outputs = [None] * len(parameter_sets)
+            missing = [index for index, simulation_output in enumerate(simulation_outputs) if simulation_output is None]
+            if missing:
+                missing_outputs = backend.simulate_batch([parameter_sets[index] for index in missing],
+                                                         output_params_names, ncp, output_interval, final_time,
+                                                         timings=timings)
+                for index, simulation_output in zip(missing, missing_outputs):
+                    simulation_outputs[index] = simulation_output
+                if result_cache is not None:
+                    result_cache.put_many([parameter_sets[index] for index in missing], missing_outputs,
+                                          output_params_names)
+            signal.alarm(0)
+            execution_time = (time.time() - start_time) / len(simulation_ids)
+            METRICS.observe('sea_simulation_seconds', execution_time)
+
+            # persist simulation results and mark them as executed in a single transaction
+            simulation_results = [{'simulation_id': simulation_id, 'execution_time': round(execution_time, 3),
+                                   'simulation_output': simulation_output, 'label': label}
+                                  for simulation_id, simulation_output, label
+                                  in zip(simulation_ids, simulation_outputs, labels)]
+            start_time_insert = time.time()
+            insert_simulation_results_batch(db_session, sea_id, output_params_names, simulation_results,
+                                            result_dtype, result_compression, timings)
+            METRICS.observe('sea_persist_seconds', (time.time() - start_time_insert) / len(simulation_ids))
+            METRICS.inc('sea_simulations_total', len(simulation_ids))
+
+            simulation_stops = [(simulation_id, simulation_output.stop_reason, simulation_output.stop_time)
+                                for simulation_id, simulation_output in zip(simulation_ids, simulation_outputs)
+                                if getattr(simulation_output, 'stop_reason', None) is not None]
+            if simulation_stops:
+                print('{0} simulations of the batch were stopped by a stop condition'.format(len(simulation_stops)))
+                if record_stops:
+                    insert_simulation_stops(db_session, sea_id, simulation_stops)
+
+            print('Batch executed in {0} seconds ({1} seconds per simulation)'.format(
+                round(time.time() - start_time, 3), round(execution_time, 6)))
+
+            # the durations of the batch are shared by its simulations
+            if timing_recorder is not None:
+                timings = dict(timings, claim=claim_time, state_update=0.0)
+                for simulation_id in simulation_ids:
+                    timing_recorder.record(simulation_id, {phase: duration / len(simulation_ids)
+                                                           for phase, duration in timings.items()})
+
+        except TimeoutError:
+            print("This batch exceeded the maximum execution time. Thus, it is aborted and marked as 'Failed'")
+            for simulation_id in simulation_ids:
+                rollback_simulation_state(db_session, simulation_id, sea_id, 'Time Out')
+
+        except psycopg2.DatabaseError as error:
+            print(error)
+            for simulation_id in simulation_ids:
+                rollback_simulation_state(db_session, simulation_id, sea_id, 'Database Error')
+
+        except (KeyboardInterrupt, InterruptedError):
+            # the simulations of the interrupted batch are returned to the queue
+            release_simulation_configs(db_session, simulation_ids)
+            break
+
+        except Exception as error:
+            for simulation_id in simulation_ids:
+                rollback_simulation_state(db_session, simulation_id, sea_id, 'Unknown')
+            print("UnknownException: Execution aborted as a result of an irreversible error:\n\t{0}".format(error))
+            break
+
+        finally:
+            signal.alarm(0)
+            lease_heartbeat.remove(simulation_ids)
 
 
 def main():
@@ -101,19 +229,81 @@ def main():
 
     # read the arguments
     model_path_remote = get_argsv(parser)
-    model_path_local = 'model/' + model_path_remote.split('/')[-1]
-
-    # download configuration files
-    download_config_files(model_path_remote, model_path_local)
-
-    # load the model
-    model = load_fmu(model_path_local)
 
     # load environment variables required for the execution
     db_config_params, simulation_environment_variables = load_environment_variables()
 
+    # load the model. It is only downloaded and extracted if it is not already in the cache. When the simulations are
+    # isolated in a worker process, the model is loaded by the worker instead
+    simulation_worker = None
+    batch_backend = None
+    model_snapshot = None
+    fmu_sha256 = None
+    use_snapshot = simulation_environment_variables['fmu_snapshot'].lower() == 'true'
+    if simulation_environment_variables['backend'].lower() == 'numpy_ode':
+        # the model is a Python module exposing its right-hand side, simulated in batches
+        model = None
+        os.makedirs(simulation_environment_variables['fmu_cache_dir'], exist_ok=True)
+        path_to_ode_model, fmu_sha256 = download_fmu(model_path_remote,
+                                                     simulation_environment_variables['fmu_cache_dir'], '.py')
+        batch_backend = NumpyODEBackend(load_ode_model(path_to_ode_model),
+                                        int(simulation_environment_variables['batch_size']),
+                                        float(simulation_environment_variables['ode_max_step']))
+    elif simulation_environment_variables['isolation'].lower() == 'process':
+        model = None
+        simulation_worker = SimulationWorker(model_path_remote, simulation_environment_variables['fmu_cache_dir'],
+                                             int(simulation_environment_variables['worker_max_simulations']),
+                                             int(simulation_environment_variables['worker_max_rss_mb']),
+                                             use_snapshot,
+                                             float(simulation_environment_variables['worker_load_timeout']))
+        simulation_worker.start()
+    else:
+        model, fmu_sha256 = load_cached_fmu(model_path_remote, simulation_environment_variables['fmu_cache_dir'])
+        # restore the state of the instantiated FMU before every simulation instead of resetting it, if supported
+        if use_snapshot:
+            model_snapshot = ModelSnapshot.take(model)
+
+    # open a persistent session to the database used during the whole execution
+    db_session = DBSession(db_config_params)
+
+    # check the encoding used to store the results before executing any simulation
+    result_dtype = simulation_environment_variables['result_dtype']
+    result_compression = simulation_environment_variables['result_compression']
+    try:
+        check_encoding(result_dtype, result_compression)
+    except ValueError as error:
+        raise SystemExit("Failure cause: {0}".format(error))
+
     # get the name of output variables
-    output_params_names = get_output_params_names(db_config_params)
+    output_params_names = get_output_params_names(db_session)
+
+    # solver configuration and output grid of the simulations. Those stored with the experimentation take precedence
+    # over the environment variables
+    solver_config = get_solver_config(db_session)
+    ncp = int(solver_config.get('ncp') or simulation_environment_variables['ncp'])
+    output_interval = float(solver_config.get('output_interval') or simulation_environment_variables['output_interval'])
+    final_time = solver_config.get('final_time', 0.0)
+    if batch_backend is not None and solver_config.get('max_step'):
+        batch_backend.max_step = solver_config['max_step']
+
+    # conditions that end the simulations before their final time, once their outcome is known
+    try:
+        stop_conditions = StopConditions(get_stop_conditions(db_session))
+        unknown_variables = set(stop_conditions.variables) - set(output_params_names)
+        if unknown_variables:
+            raise ValueError('The stop conditions use variables that are not recorded: {0}'.format(
+                ', '.join(sorted(unknown_variables))))
+    except ValueError as error:
+        raise SystemExit("Failure cause: {0}".format(error))
+    if batch_backend is not None:
+        batch_backend.stop_conditions = stop_conditions if stop_conditions else None
+
+    # the FMU loaded in the agent is simulated through the default backend, one simulation at a time
+    simulation_backend = None
+    if model is not None:
+        simulation_backend = PyFMIBackend(model, solver_config, model_snapshot, stop_conditions)
+    # record the simulations stopped by a stop condition, if the database has a table to store them
+    record_stops = bool(stop_conditions) and has_simulation_stops(db_session)
 
     # register signals
     signal.signal(signal.SIGALRM, time_out_signal_handler)  # signal to handel time outs
@@ -128,104 +318,283 @@ def main():
     all_char = string.ascii_letters + string.digits
     sea_id = "".join(choice(all_char) for x in range(id_length))
 
-    while True:
-        simulation_id = None
-        try:
-            start_time_get_config = time.time()
-            # get next simulation parameters from db
-            current_simulation_config = get_next_simulation_config(db_config_params)
-
-            # check whether we have finished the simulation
-            if current_simulation_config is None:
-                if check_failed_simulations(db_config_params, simulation_environment_variables):
-                    print(
-                        "One or more failed simulations are found. They have been reset and they will be executed again")
-                    continue
+    # renew the leases of the simulations held by the agent while they are executed
+    lease_duration = int(simulation_environment_variables['lease_duration'])
+    lease_heartbeat = LeaseHeartbeat(db_config_params, lease_duration,
+                                     float(simulation_environment_variables['lease_renewal_interval']))
+    lease_heartbeat.start()
+
+    # optionally, predict the runtime of the pending simulations from the results already stored, so they are leased
+    # longest first
+    runtime_scheduler = None
+    if simulation_environment_variables['runtime_scheduler'].lower() == 'true':
+        if has_parameter_grids(db_session):
+            print('The experimentation is stored in implicit mode, so its simulations are leased in grid order')
+        elif has_predicted_runtime(db_session):
+            runtime_scheduler = RuntimeScheduler(
+                db_config_params, float(simulation_environment_variables['runtime_scheduler_interval']),
+                int(simulation_environment_variables['runtime_scheduler_min_results']))
+            runtime_scheduler.start()
+        else:
+            print('The experimentation has no predicted runtimes, so the simulations are leased in order of their id')
+
+    # optionally, expose the runtime metrics of the agent over HTTP
+    METRICS.set('sea_inflight_leases', lambda: len(lease_heartbeat))
+    metrics_port = int(simulation_environment_variables['metrics_port'])
+    if metrics_port:
+        METRICS.serve(metrics_port)
+
+    # record the durations of the phases of the simulations, if the database has a table to store them
+    record_timings = simulation_environment_variables['record_timings'].lower() == 'true' \
+        and has_simulation_timings(db_session)
+    timing_recorder = TimingRecorder(db_session, sea_id) if record_timings else None
+
+    # optionally, copy the results of the simulations already executed by any experimentation with the same FMU and
+    # solver settings from the result cache instead of simulating them again
+    result_cache = None
+    if simulation_environment_variables['result_cache'].lower() == 'true':
+        if has_result_cache(db_session):
+            if fmu_sha256 is None:
+                # the FMU is loaded by the worker process, so only its hash is obtained here
+                os.makedirs(simulation_environment_variables['fmu_cache_dir'], exist_ok=True)
+                _, fmu_sha256 = download_fmu(model_path_remote, simulation_environment_variables['fmu_cache_dir'])
+            solver_settings = dict(solver_config, backend=simulation_environment_variables['backend'].lower(),
+                                   ncp=ncp, output_interval=output_interval, final_time=final_time)
+            if batch_backend is not None:
+                solver_settings['max_step'] = batch_backend.max_step
+            if stop_conditions:
+                solver_settings['stop_conditions'] = stop_conditions.conditions
+            result_cache = ResultCache(db_session, fmu_sha256, solver_settings, result_dtype, result_compression,
+                                       int(simulation_environment_variables['result_cache_max_entries']))
+        else:
+            print('The database has no result cache, so every simulation is executed')
+
+    # optionally, persist the results from a background thread while the next simulations are executed
+    result_writer = None
+    if simulation_environment_variables['async_result_writer'].lower() == 'true':
+        result_writer = ResultWriter(db_config_params, sea_id, output_params_names,
+                                     queue_size=int(simulation_environment_variables['result_writer_queue_size']),
+                                     batch_size=int(simulation_environment_variables['result_writer_batch_size']),
+                                     result_dtype=result_dtype, result_compression=result_compression,
+                                     lease_heartbeat=lease_heartbeat, record_timings=record_timings)
+        result_writer.start()
+
+    # number of simulations leased at once and local queue of leased simulations pending to be executed
+    lease_size = int(simulation_environment_variables['lease_size'])
+    leased_simulation_configs = deque()
+
+    # parameter grids of the experimentation, if it is stored in implicit mode
+    parameter_grids = dict() if has_parameter_grids(db_session) else None
+
+    # time required to lease a simulation, as the lease round trip is shared by all the leased simulations
+    claim_time = 0.0
+
+    if batch_backend is not None:
+        # the simulations are leased and simulated in blocks of the size of the batches of the backend
+        execute_simulation_batches(db_session, batch_backend, simulation_environment_variables, sea_id,
+                                   output_params_names, parameter_grids, lease_heartbeat, timing_recorder, ncp,
+                                   output_interval, final_time, result_cache, record_stops)
+    else:
+        while True:
+            simulation_id = None
+            submitted = False
+            try:
+                start_time_get_config = time.time()
+                # lease the next simulations from db when the local queue is empty
+                if not leased_simulation_configs:
+                    leased_simulation_configs.extend(lease_simulation_configs(db_session, lease_size, parameter_grids,
+                                                                              lease_duration))
+                    lease_heartbeat.add(config['simulation_id'] for config in leased_simulation_configs)
+                    METRICS.observe('sea_claim_seconds', time.time() - start_time_get_config)
+                    claim_time = (time.time() - start_time_get_config) / max(1, len(leased_simulation_configs))
+
+                # check whether we have finished the simulation
+                if not leased_simulation_configs:
+                    if check_failed_simulations(db_session, simulation_environment_variables):
+                        print(
+                            "One or more failed simulations are found. "
+                            "They have been reset and they will be executed again")
+                        continue
+                    else:
+                        break
+
+                # get next simulation parameters from the local queue
+                current_simulation_config = leased_simulation_configs.popleft()
+                get_config_execution_time = round((time.time() - start_time_get_config), 3)
+
+                # start time out signal for a given period of time (seconds). The worker process has its own watchdog
+                if simulation_worker is None:
+                    signal.alarm(time_out_period)
+
+                # start crono to calculate execution time
+                start_time = time.time()
+                timestamp = datetime.datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S')
+
+                # get simulation id and label
+                simulation_id = current_simulation_config['simulation_id']
+                label = current_simulation_config['label']
+
+                # remove columns not required as model's input data
+                for column in NON_PARAMETER_COLUMNS:
+                    current_simulation_config.pop(column, None)
+
+                print("{0}: Executing simulation {1} with parameters:".format(timestamp, simulation_id))
+                for key, value in current_simulation_config.items():
+                    print('\t\t\t\t\t\t', key, ':', value)
+
+                # perform simulation, unless its results are in the result cache
+                timings = {'claim': claim_time}
+                simulation_output = None
+                if result_cache is not None:
+                    simulation_output = result_cache.get(current_simulation_config, output_params_names)
+                    if simulation_output is not None:
+                        print('The results of the simulation are copied from the result cache')
+                if simulation_output is None:
+                    if simulation_worker is not None:
+                        simulation_output = simulation_worker.simulate(time_out_period,
+                                                                       user_parameters=current_simulation_config,
+                                                                       output_names=output_params_names, ncp=ncp,
+                                                                       output_interval=output_interval,
+                                                                       final_time=final_time,
+                                                                       solver_config=solver_config,
+                                                                       stop_conditions=stop_conditions,
+                                                                       timings=timings)
+                    else:
+                        simulation_output = simulation_backend.simulate_batch([current_simulation_config],
+                                                                              output_params_names, ncp,
+                                                                              output_interval, final_time,
+                                                                              timings=timings)[0]
+                    if result_cache is not None:
+                        result_cache.put(current_simulation_config, simulation_output, output_params_names)
+
+                # measure execution time in seconds
+                execution_time = round((time.time() - start_time), 3)
+                METRICS.observe('sea_simulation_seconds', time.time() - start_time)
+
+                start_time_insert = time.time()
+                if result_writer is not None:
+                    # stop the alarm, as the simulation is already completed
+                    signal.alarm(0)
+
+                    # queue simulation results to be persisted in the background. It waits while the queue is full
+                    result_writer.submit(simulation_id, execution_time, simulation_output, label, timings)
+                    submitted = True
+                    insert_time = round((time.time() - start_time_insert), 3)
+                    METRICS.observe('sea_persist_seconds', time.time() - start_time_insert)
+
+                    print('Execution time for getting the simulation configuration: {0}'.format(
+                        get_config_execution_time))
+                    print('Waiting time for queueing the simulation results: {0}'.format(insert_time))
                 else:
-                    break
-            get_config_execution_time = round((time.time() - start_time_get_config), 3)
-
-            # start time out signal for a given period of time (seconds)
-            signal.alarm(time_out_period)
-
-            # start crono to calculate execution time
-            start_time = time.time()
-            timestamp = datetime.datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S')
-
-            # get simulation id and label
-            simulation_id = current_simulation_config['simulation_id']
-            label = current_simulation_config['label']
-
-            # remove columns not required as model's input data
-            del current_simulation_config['simulation_id']
-            del current_simulation_config['timestamp_init']
-            del current_simulation_config['timestamp_end']
-            del current_simulation_config['state']
-            del current_simulation_config['label']
-
-            print("{0}: Executing simulation {1} with parameters:".format(timestamp, simulation_id))
-            for key, value in current_simulation_config.items():
-                print('\t\t\t\t\t\t', key, ':', value)
-
-            # perform simulation
-            simulation_output = simulate_model(model, user_parameters=current_simulation_config)
+                    # persist simulation results in the database
+                    insert_simulation_results(db_session, simulation_id, sea_id, execution_time,
+                                              output_params_names, simulation_output, label,
+                                              result_dtype, result_compression, timings)
+                    insert_time = round((time.time() - start_time_insert), 3)
+                    METRICS.observe('sea_persist_seconds', time.time() - start_time_insert)
+
+                    print('Execution time for getting the simulation configuration: {0}'.format(
+                        get_config_execution_time))
+                    print('Execution time for inserting the simulation results: {0}'.format(insert_time))
+                    # stop the alarm
+                    signal.alarm(0)
+
+            except TimeoutError as error:
+                print(error)
+                print("This simulation exceeded the maximum execution time. Thus, it is aborted and marked as 'Failed'")
+                rollback_simulation_state(db_session, simulation_id, sea_id, 'Time Out')
 
-            # measure execution time in seconds
-            execution_time = round((time.time() - start_time), 3)
+            except SimulationWorkerError as error:
+                # the worker is respawned for the next simulation, so the agent keeps running
+                print(error)
+                rollback_simulation_state(db_session, simulation_id, sea_id, error.failure_type)
 
-            start_time_insert = time.time()
-            # persist simulation results in the database
-            insert_simulation_results(db_config_params, simulation_id, sea_id, execution_time,
-                                      output_params_names, simulation_output, label)
-            insert_time = round((time.time() - start_time_insert), 3)
-
-            print('Execution time for getting the simulation configuration: {0}'.format(get_config_execution_time))
-            print('Execution time for inserting the simulation results: {0}'.format(insert_time))
-            # stop the alarm
-            signal.alarm(0)
+            except psycopg2.IntegrityError as error:
+                print(error)
+                print("This simulation was already done")
+                update_simulation_state(db_session, simulation_id, 'Executed')
 
-        except TimeoutError as error:
-            print(error)
-            print("This simulation exceeded the maximum execution time. Thus, it is aborted and marked as 'Failed'")
-            rollback_simulation_state(db_config_params, simulation_id, sea_id, 'Time Out')
+            except psycopg2.DatabaseError as error:
+                print(error)
+                rollback_simulation_state(db_session, simulation_id, sea_id, 'Database Error')
 
-        except psycopg2.IntegrityError as error:
-            print(error)
-            print("This simulation was already done")
-            update_simulation_state(db_config_params, simulation_id, 'Executed')
-
-        except psycopg2.DatabaseError as error:
-            print(error)
-            rollback_simulation_state(db_config_params, simulation_id, sea_id, 'Database Error')
+            except psycopg2.Error as error:
+                rollback_simulation_state(db_session, simulation_id, sea_id, 'Database Error')
+                print("psycopg2.Error: Execution aborted as a result of an irreversible error:\n\t{0}".format(error))
+                break
 
-        except psycopg2.Error as error:
-            rollback_simulation_state(db_config_params, simulation_id, sea_id, 'Database Error')
-            print("psycopg2.Error: Execution aborted as a result of an irreversible error:\n\t{0}".format(error))
-            break
+            except KeyboardInterrupt:
+                rollback_simulation_state(db_session, simulation_id, sea_id, 'User aborted')
+                break
 
-        except KeyboardInterrupt:
-            rollback_simulation_state(db_config_params, simulation_id, sea_id, 'User aborted')
-            break
+            except KeyError as error:
+                print("KeyError: Execution aborted as a result of an irreversible error:\n\t{0}".format(error))
+                break
 
-        except KeyError as error:
-            print("KeyError: Execution aborted as a result of an irreversible error:\n\t{0}".format(error))
-            break
+            except Exception as error:
+                # known issue: when a timeout signal is sent to the child process, it is not returned as such to the parent
+                # process. In contrast, it is returned as a generic error. Thus, we assume that any general error caused
+                # once the timeout period is exceeded is due to a timeout error.
+                if (time.time() - start_time) > time_out_period:
+                    print("This simulation exceeded the maximum execution time. "
+                          "Thus, it is aborted and marked as 'Failed'")
+                    rollback_simulation_state(db_session, simulation_id, sea_id, 'Time Out')
+                else:
+                    rollback_simulation_state(db_session, simulation_id, sea_id, 'Unknown')
+                    print("UnknownException: Execution aborted as a result of an irreversible error:\n\t{0}".format(
+                        error))
+                    break
 
-        except Exception as error:
-            # known issue: when a timeout signal is sent to the child process, it is not returned as such to the parent
-            # process. In contrast, it is returned as a generic error. Thus, we assume that any general error caused
-            # once the timeout period is exceeded is due to a timeout error.
-            if (time.time() - start_time) > time_out_period:
-                print("This simulation exceeded the maximum execution time. Thus, it is aborted and marked as 'Failed'")
-                rollback_simulation_state(db_config_params, simulation_id, sea_id, 'Time Out')
             else:
-                rollback_simulation_state(db_config_params, simulation_id, sea_id, 'Unknown')
-                print("UnknownException: Execution aborted as a result of an irreversible error:\n\t{0}".format(error))
-                break
-
-        else:
-            print('\nSimulation {0} finished!'.format(simulation_id))
-            update_simulation_state(db_config_params, simulation_id, 'Executed')
+                print('\nSimulation {0} finished!'.format(simulation_id))
+                stop_reason = getattr(simulation_output, 'stop_reason', None)
+                if stop_reason is not None:
+                    print('The simulation was stopped at {0} seconds by the stop condition {1}'.format(
+                        simulation_output.stop_time, stop_reason))
+                    if record_stops:
+                        insert_simulation_stops(db_session, sea_id,
+                                                [(simulation_id, stop_reason, simulation_output.stop_time)])
+                # the result writer marks the simulation as executed once its results are persisted
+                if result_writer is None:
+                    start_time_update = time.time()
+                    update_simulation_state(db_session, simulation_id, 'Executed')
+                    METRICS.inc('sea_simulations_total')
+                    if timing_recorder is not None:
+                        timings['state_update'] = time.time() - start_time_update
+                        timing_recorder.record(simulation_id, timings)
+
+            finally:
+                # the lease of a queued simulation is renewed until the result writer persists it
+                if simulation_id is not None and not submitted:
+                    lease_heartbeat.remove([simulation_id])
+
+    # return the leased simulations that have not been started to the queue
+    if leased_simulation_configs:
+        release_simulation_configs(db_session,
+                                   [config['simulation_id'] for config in leased_simulation_configs])
+
+    # write the results still queued before finishing
+    if result_writer is not None:
+        print('Writing pending simulation results...')
+        result_writer.close()
+        result_writer.db_session.print_latency_stats()
+
+    if timing_recorder is not None:
+        timing_recorder.flush()
+
+    if result_cache is not None:
+        result_cache.print_stats()
+
+    lease_heartbeat.close()
+
+    if runtime_scheduler is not None:
+        runtime_scheduler.close()
+
+    if simulation_worker is not None:
+        simulation_worker.stop()
+
+    db_session.print_latency_stats()
+    db_session.close()
 
     print('\n\nSIMULATION FINISHED')
 
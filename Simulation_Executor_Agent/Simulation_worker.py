@@ -0,0 +1,211 @@
+import os
+import signal
+import multiprocessing
+import numpy as np
+from FMU_cache import load_cached_fmu
+from Model_executor import simulate_model, ModelSnapshot, SimulationOutput
+
+
+class SimulationWorkerError(Exception):
+    """ Raised when a simulation executed by the worker process fails. The failure type is recorded in the failure
+        registry
+    """
+
+    def __init__(self, failure_type, message):
+        super().__init__(message)
+        self.failure_type = failure_type
+
+
+class SimulationWorker:
+    """ Executes the simulations in a persistent child process that keeps the FMU loaded. A hung simulation is killed
+        by the parent once its time out expires and a crashed FMU only takes the worker down: in both cases a new worker
+        is spawned for the next simulation. Workers are also recycled after a number of simulations or when their
+        memory grows over a threshold, so a leaking FMU does not degrade long runs.
+    """
+
+    def __init__(self, model_path_remote, cache_dir, max_simulations=0, max_rss_mb=0, snapshot=False,
+                 load_timeout=600):
+        """
+            Args:
+                model_path_remote (str): URL or local path of the FMU
+                cache_dir (str): directory where the FMUs are cached
+                max_simulations (int): simulations executed by a worker before it is recycled (0 for no limit)
+                max_rss_mb (int): maximum resident memory of a worker in MB before it is recycled (0 for no limit)
+                snapshot (bool): restore a snapshot of the FMU before every simulation instead of resetting it
+                load_timeout (float): maximum time to download and load the FMU in a new worker (in seconds)
+        """
+        self.model_path_remote = model_path_remote
+        self.cache_dir = cache_dir
+        self.max_simulations = max_simulations
+        self.max_rss_mb = max_rss_mb
+        self.snapshot = snapshot
+        self.load_timeout = load_timeout
+
+        # spawn instead of fork, as the agent holds database connections and threads
+        self.context = multiprocessing.get_context('spawn')
+        self.process = None
+        self.connection = None
+        self.n_simulations = 0
+
+    def start(self):
+        """ Spawns a new worker process and waits until it has loaded the FMU. The FMU is loaded by the worker itself
+            before any simulation is sent, so its download does not count against the time out of a simulation
+
+            Raises:
+                SystemExit: the worker could not load the FMU within the load time out. No simulation could be executed
+                            by a new worker either
+        """
+        parent_connection, child_connection = self.context.Pipe()
+        self.process = self.context.Process(target=worker_main, name='SimulationWorker',
+                                            args=(child_connection, self.model_path_remote, self.cache_dir,
+                                                  self.snapshot),
+                                            daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.connection = parent_connection
+        self.n_simulations = 0
+
+        try:
+            if self.connection.poll(self.load_timeout):
+                status, payload = self.connection.recv()
+            else:
+                status, payload = 'error', 'timed out after {0} seconds'.format(self.load_timeout)
+        except (EOFError, OSError):
+            self.process.join(timeout=1)
+            status, payload = 'error', 'the worker exited with code {0}'.format(self.process.exitcode)
+        if status == 'error':
+            self.kill()
+            raise SystemExit('Failure cause: the simulation worker could not load the model: {0}'.format(payload))
+
+        print('Simulation worker {0} started'.format(self.process.pid))
+
+    def kill(self):
+        """ Kills the worker process immediately
+        """
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.connection.close()
+            print('Simulation worker {0} killed'.format(self.process.pid))
+            self.process = None
+
+    def stop(self):
+        """ Stops the worker process once it finishes its current request
+        """
+        if self.process is not None:
+            try:
+                self.connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.kill()
+            else:
+                self.connection.close()
+                self.process = None
+
+    def simulate(self, time_out_period, **kwargs):
+        """ Executes a simulation in the worker process. The arguments are those of simulate_model, except the model
+
+            Args:
+                time_out_period (int): maximum execution time of the simulation (in seconds)
+                timings (dict): if set, the durations of the phases of the simulation measured by the worker are
+                                stored in it
+
+            Returns:
+                SimulationOutput: contains an array with the results of each output variable
+
+            Raises:
+                TimeoutError: the simulation exceeded the time out. The worker is killed
+                SimulationWorkerError: the simulation failed or the worker crashed
+        """
+        if self.process is None:
+            self.start()
+
+        timings = kwargs.pop('timings', None)
+        self.connection.send(kwargs)
+
+        # the parent acts as watchdog: a hung worker is killed regardless of the state of the FMU
+        if not self.connection.poll(time_out_period):
+            self.kill()
+            raise TimeoutError('Simulation worker timed out after {0} seconds'.format(time_out_period))
+
+        try:
+            status, payload, rss_mb, worker_timings = self.connection.recv()
+        except (EOFError, OSError):
+            self.process.join(timeout=1)
+            exit_code = self.process.exitcode
+            self.kill()
+            raise SimulationWorkerError('Worker crashed',
+                                        'Simulation worker crashed with exit code {0}'.format(exit_code))
+
+        self.n_simulations += 1
+        if timings is not None:
+            timings.update(worker_timings)
+        if (self.max_simulations and self.n_simulations >= self.max_simulations) \
+                or (self.max_rss_mb and rss_mb >= self.max_rss_mb):
+            print('Recycling simulation worker {0} after {1} simulations ({2} MB)'.format(
+                self.process.pid, self.n_simulations, round(rss_mb, 1)))
+            self.stop()
+
+        if status == 'error':
+            raise SimulationWorkerError('Simulation error', payload)
+
+        return payload
+
+
+def worker_main(connection, model_path_remote, cache_dir, snapshot=False):
+    """ Main loop of the worker process. It loads the FMU once and executes the simulations requested by the parent
+        until it receives None
+
+        Args:
+            connection (Connection): end of the pipe connected to the parent
+            model_path_remote (str): URL or local path of the FMU
+            cache_dir (str): directory where the FMUs are cached
+            snapshot (bool): restore a snapshot of the FMU before every simulation instead of resetting it
+    """
+    # interruptions are handled by the parent
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    # the parent waits until the model is loaded before sending any simulation
+    try:
+        model, fmu_sha256 = load_cached_fmu(model_path_remote, cache_dir)
+        model_snapshot = ModelSnapshot.take(model) if snapshot else None
+    except Exception as error:
+        connection.send(('error', '{0}: {1}'.format(type(error).__name__, error)))
+        connection.close()
+        return
+    connection.send(('ready', None))
+
+    while True:
+        kwargs = connection.recv()
+        if kwargs is None:
+            break
+
+        timings = {}
+        try:
+            result = simulate_model(model, timings=timings, snapshot=model_snapshot, **kwargs)
+            # only the recorded variables are sent back, as contiguous arrays, along with the stop condition met
+            response = ('ok', SimulationOutput({name: np.ascontiguousarray(result[name])
+                                                for name in kwargs.get('output_names', [])},
+                                               getattr(result, 'stop_reason', None),
+                                               getattr(result, 'stop_time', None)))
+        except Exception as error:
+            response = ('error', '{0}: {1}'.format(type(error).__name__, error))
+
+        connection.send(response + (current_rss_mb(), timings))
+
+    connection.close()
+
+
+def current_rss_mb():
+    """ Measures the current resident memory of the process. Unlike the peak reported by getrusage, it decreases when
+        the memory is released, so a worker is not recycled for a single simulation that needed more memory
+
+        Returns:
+            float: resident memory of the process in MB
+    """
+    with open('/proc/self/statm') as statm:
+        resident_pages = int(statm.read().split()[1])
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
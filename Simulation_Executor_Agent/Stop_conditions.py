@@ -0,0 +1,125 @@
+import numpy as np
+
+# comparisons available to the threshold conditions
+OPERATORS = {'>': np.greater, '>=': np.greater_equal, '<': np.less, '<=': np.less_equal,
+             'abs>': lambda values, threshold: np.abs(values) > threshold}
+
+
+class StopConditions:
+    """ Conditions over the output variables that end a simulation before its final time, once its outcome is known.
+        They are evaluated at every recorded point and the first condition met (in the order they are declared) is
+        the reason why the simulation stops. Two types of conditions are supported:
+
+            {"name": "s1_diverged", "type": "threshold", "variable": "s1", "operator": ">", "value": 0.5}
+                the last value of the variable is compared with the threshold ('>', '>=', '<', '<=' or 'abs>')
+            {"name": "settled", "type": "steady_state", "variables": ["v1", "v2"], "window": 0.5, "tolerance": 1e-4}
+                every variable has changed less than the tolerance during the last window seconds
+    """
+
+    def __init__(self, conditions):
+        """
+            Args:
+                conditions (list): contains a dict per condition
+
+            Raises:
+                ValueError: a condition is not valid
+        """
+        if not isinstance(conditions, list) or not all(isinstance(condition, dict) and 'name' in condition
+                                                       for condition in conditions):
+            raise ValueError('The stop conditions must be a list of objects with a name')
+        names = [condition['name'] for condition in conditions]
+        if len(set(names)) != len(names):
+            raise ValueError('The names of the stop conditions must be unique')
+
+        for condition in conditions:
+            if condition.get('type') == 'threshold':
+                if condition.get('operator') not in OPERATORS:
+                    raise ValueError('Unknown operator of the stop condition {0}: {1}'.format(
+                        condition.get('name'), condition.get('operator')))
+                required_keys = ['name', 'variable', 'value']
+            elif condition.get('type') == 'steady_state':
+                required_keys = ['name', 'variables', 'window', 'tolerance']
+            else:
+                raise ValueError('Unknown type of the stop condition {0}: {1}'.format(condition.get('name'),
+                                                                                     condition.get('type')))
+            missing_keys = [key for key in required_keys if key not in condition]
+            if missing_keys:
+                raise ValueError('The stop condition {0} lacks {1}'.format(condition.get('name'),
+                                                                           ', '.join(missing_keys)))
+
+        self.conditions = list(conditions)
+        self.names = names
+        # the conditions depend on the samples recorded during the longest window (only the last one if there is none)
+        self.max_window = max([condition['window'] for condition in self.conditions
+                               if condition['type'] == 'steady_state'], default=0.0)
+
+    def __bool__(self):
+        return bool(self.conditions)
+
+    @property
+    def variables(self):
+        """ Names of the variables evaluated by the conditions
+        """
+        variables = set()
+        for condition in self.conditions:
+            if condition['type'] == 'threshold':
+                variables.add(condition['variable'])
+            else:
+                variables.update(condition['variables'])
+        return sorted(variables)
+
+    def window_start(self, times):
+        """ Finds the first recorded point the conditions depend on, so only the samples from it on are evaluated
+
+            Args:
+                times (np.ndarray): recorded times
+
+            Returns:
+                int: index of the last point recorded at least max_window seconds before the last one, or 0
+        """
+        return max(int(np.searchsorted(times, times[-1] - self.max_window, side='right')) - 1, 0)
+
+    def check(self, times, series):
+        """ Evaluates the conditions at the last recorded point
+
+            Args:
+                times (np.ndarray): recorded times
+                series (dict): contains the recorded samples of each variable, with shape (..., number of points). A
+                               batch of simulations is evaluated at once by adding leading dimensions
+
+            Returns:
+                np.ndarray: index of the first condition met by each simulation, or -1 if none of them is met
+        """
+        met = None
+        # the conditions are evaluated in reverse order so the first one declared takes precedence
+        for index in range(len(self.conditions) - 1, -1, -1):
+            condition = self.conditions[index]
+            if condition['type'] == 'threshold':
+                values = series[condition['variable']][..., -1]
+                is_met = OPERATORS[condition['operator']](values, condition['value'])
+            else:
+                is_met = self._is_steady(times, series, condition)
+            met = np.where(is_met, index, -1 if met is None else met)
+
+        return met
+
+    def _is_steady(self, times, series, condition):
+        """ Checks whether the variables of a steady state condition have settled during its window
+
+            Args:
+                times (np.ndarray): recorded times
+                series (dict): contains the recorded samples of each variable
+                condition (dict): steady state condition
+
+            Returns:
+                np.ndarray: whether each simulation has settled
+        """
+        shape = series[condition['variables'][0]].shape[:-1]
+        if times[-1] - times[0] < condition['window']:
+            return np.zeros(shape, dtype=bool)
+
+        start = np.searchsorted(times, times[-1] - condition['window'])
+        is_steady = np.ones(shape, dtype=bool)
+        for variable in condition['variables']:
+            is_steady &= np.ptp(series[variable][..., start:], axis=-1) <= condition['tolerance']
+        return is_steady
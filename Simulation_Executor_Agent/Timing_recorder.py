@@ -0,0 +1,48 @@
+import socket
+import psycopg2
+from DB_Manager import insert_simulation_timings
+
+
+class TimingRecorder:
+    """ Collects the durations of the phases of the simulations (claim, set-up, initialization, integration, encoding,
+        insertion and state update) and stores them in the simulation_timings table in batches, so recording them
+        does not add a round trip per simulation. A recorder is used by a single thread, with its own session
+    """
+
+    def __init__(self, db_session, sea_id, batch_size=50):
+        """
+            Args:
+                db_session (DBSession): persistent session to the database
+                sea_id (string): id of the simulation executor agent
+                batch_size (int): number of simulations whose timings are stored at once
+        """
+        self.db_session = db_session
+        self.sea_id = sea_id
+        self.host = socket.gethostname()
+        self.batch_size = batch_size
+        self.simulation_timings = []
+
+    def record(self, simulation_id, timings):
+        """ Adds the timings of a simulation. They are stored once the batch is completed
+
+            Args:
+                simulation_id (int): identifier of the simulation
+                timings (dict): duration (in seconds) of each phase of the simulation
+        """
+        self.simulation_timings.append(dict(timings, simulation_id=simulation_id))
+        if len(self.simulation_timings) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Stores the pending timings. Timings that can not be stored are discarded, as they are not needed to
+            complete the experimentation
+        """
+        if not self.simulation_timings:
+            return
+
+        try:
+            insert_simulation_timings(self.db_session, self.sea_id, self.host, self.simulation_timings)
+        except (Exception, psycopg2.DatabaseError) as error:
+            print('The timings of {0} simulations could not be stored:\n\t{1}'.format(len(self.simulation_timings),
+                                                                                     error))
+        self.simulation_timings = []
@@ -0,0 +1,58 @@
+""" Right-hand side of Academic_model.mo for the NumPy ODE backend of the SEA (SIMULATION_BACKEND=numpy_ode).
+
+    Chain of five masses connected by spring-dampers, the first one fixed to the wall. Every function works on a whole
+    batch of simulations: each parameter is an array with a value per simulation and the states have shape
+    (number of states, batch size).
+"""
+import numpy as np
+
+# parameters of the model and their default values
+PARAMETERS = {'M1': 10.0, 'M2': 20.0, 'M3': 50.0, 'M4': 100.0, 'M5': 80.0,
+              's0_1': 0.01, 's0_2': 0.015, 's0_3': 0.01, 's0_4': 0.02, 's0_5': 0.022,
+              'C_spring': 1000.0, 'D_damper': 0.1}
+
+N_MASSES = 5
+
+
+def initial_state(params):
+    """ Positions (s0_i) and velocities (0) of the masses at the start of the simulation
+    """
+    positions = np.stack([params['s0_{0}'.format(i)] for i in range(1, N_MASSES + 1)])
+    return np.concatenate([positions, np.zeros_like(positions)])
+
+
+def spring_forces(x, params):
+    """ Force of each spring-damper, f_i = c (s_i - s_(i-1)) + d (v_i - v_(i-1)), with s_0 = v_0 = 0
+    """
+    positions, velocities = x[:N_MASSES], x[N_MASSES:]
+    relative_positions = np.diff(positions, axis=0, prepend=0.0)
+    relative_velocities = np.diff(velocities, axis=0, prepend=0.0)
+    return params['C_spring'] * relative_positions + params['D_damper'] * relative_velocities
+
+
+def accelerations(x, params):
+    """ Acceleration of each mass, m_i a_i = f_(i+1) - f_i, with f_6 = 0
+    """
+    forces = spring_forces(x, params)
+    masses = np.stack([params['M{0}'.format(i)] for i in range(1, N_MASSES + 1)])
+    return (np.append(forces[1:], np.zeros_like(forces[:1]), axis=0) - forces) / masses
+
+
+def derivatives(t, x, params):
+    """ Time derivative of the states
+    """
+    return np.concatenate([x[N_MASSES:], accelerations(x, params)])
+
+
+def outputs(t, x, params):
+    """ Output variables of the model
+    """
+    forces = spring_forces(x, params)
+    acceleration = accelerations(x, params)
+    values = {}
+    for i in range(N_MASSES):
+        values['s{0}'.format(i + 1)] = x[i]
+        values['v{0}'.format(i + 1)] = x[N_MASSES + i]
+        values['a{0}'.format(i + 1)] = acceleration[i]
+        values['F{0}'.format(i + 1)] = forces[i]
+    return values
@@ -15,6 +15,9 @@ def load_environment_variables():
         db_config_params['database'] = os.environ['POSTGRESQL_DB_NAME']
         db_config_params['user'] = os.environ['POSTGRESQL_DB_USER']
         db_config_params['password'] = os.environ['POSTGRESQL_DB_PASS']
+        # optional schemas where the experimentation is stored (comma separated search path, without spaces)
+        if get_experiment_schema() is not None:
+            db_config_params['options'] = '-c search_path={0}'.format(os.environ['POSTGRESQL_SCHEMA'])
     except KeyError as error:
         print("One or more environmental variables are not set. Required environmental variables:")
         print("\tPOSTGRESQL_IP")
@@ -26,3 +29,16 @@ def load_environment_variables():
     else:
         return db_config_params
 
+
+def get_experiment_schema():
+    """ Reads the schema where the experimentation is stored, which is the first schema of POSTGRESQL_SCHEMA. The
+        next schemas, if any, are only used to look up the objects that are not found in the first one
+
+        Returns:
+            str: name of the schema, or None if the experimentation is stored in the default schema
+    """
+    if not os.environ.get('POSTGRESQL_SCHEMA'):
+        return None
+
+    return os.environ['POSTGRESQL_SCHEMA'].split(',')[0]
+
@@ -1,8 +1,14 @@
+import io
+import json
+import time
 import psycopg2
 import psycopg2.extras
-from sqlalchemy import create_engine
+import psycopg2.sql
 from pandas import DataFrame
 
+# phases of the simulations (see simulation_timings) spent in the database. The others are spent in the computation
+DB_PHASES = ['claim', 'insert', 'state_update']
+
 
 def execute_query(db_config_params, query):
     """ Executes a given query in the database
@@ -66,38 +72,295 @@ def create_database(db_config_params):
             conn.close()
 
 
-def insert_generated_simulations_into_db(simulations: DataFrame, max_simulation_id, db_config_params):
-    """ Executes a query in the database to store the experimentation set up
+def create_schema(db_config_params, schema):
+    """ Creates the schema where the experimentation is stored, if it does not exist yet. Each experimentation (or
+        each run of an experimentation) can live in its own schema, so it can be removed at once with drop_schema
+
+        Args:
+            db_config_params (dict): contains the connection parameters of the database
+            schema (str): name of the schema
+    """
+    conn = psycopg2.connect(**db_config_params)
+    try:
+        cur = conn.cursor()
+        cur.execute(psycopg2.sql.SQL('CREATE SCHEMA IF NOT EXISTS {0}').format(psycopg2.sql.Identifier(schema)))
+        cur.close()
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def drop_schema(db_config_params, schema):
+    """ Removes an experimentation stored in its own schema, together with its results. Unlike deleting the rows
+        of the tables, the cost does not depend on the size of the experimentation and no VACUUM is required
+
+        Args:
+            db_config_params (dict): contains the connection parameters of the database
+            schema (str): name of the schema
+    """
+    conn = psycopg2.connect(**db_config_params)
+    try:
+        cur = conn.cursor()
+        cur.execute(psycopg2.sql.SQL('DROP SCHEMA IF EXISTS {0} CASCADE').format(psycopg2.sql.Identifier(schema)))
+        cur.close()
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def generate_create_experimentation_config_table_sql(input_params_names):
+    """ Generates an SQL statement to create the table where the experimentation set up is stored, if it does not
+        exist yet. The input parameters are stored as double precision columns, the state as a simulation_state and
+        the timestamps as timestamptz (NULL until they are set). The number of failures of each simulation is kept in
+        failure_count, the expiry of the lease of the agent executing it in lease_expires_at and its runtime
+        predicted by the SEAs, used to lease the longest simulations first, in predicted_runtime.
+
+        Args:
+            input_params_names (list): names of the input parameters
+
+        Returns:
+            str: SQL statement containing the query to create the table
+    """
+    columns_sql = ",".join('"{0}" double precision'.format(col) for col in sorted(input_params_names))
+
+    return 'CREATE TABLE IF NOT EXISTS experimentation_config(' \
+           '"simulation_id" bigint,' \
+           '"timestamp_init" timestamptz,' \
+           '"timestamp_end" timestamptz,' \
+           '"lease_expires_at" timestamptz,' \
+           '"predicted_runtime" real,' \
+           + columns_sql + ',' \
+           '"state" simulation_state NOT NULL DEFAULT \'Not executed\',' \
+           '"label" integer NOT NULL DEFAULT 0,' \
+           '"failure_count" integer NOT NULL DEFAULT 0)'
+
+
+def copy_simulations_into_db(cur, simulations: DataFrame):
+    """ Loads a chunk of simulations into the database with COPY FROM STDIN
+
+        Args:
+            cur (cursor): cursor of the transaction in which the simulations are loaded
+            simulations (DataFrame): chunk of simulations to be loaded
+    """
+    buffer = io.StringIO()
+    simulations.to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+
+    columns_str = ",".join('"' + col + '"' for col in simulations.columns)
+    cur.copy_expert('COPY experimentation_config (' + columns_str + ') FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def insert_generated_simulations_into_db(simulations, max_simulation_id, db_config_params):
+    """ Executes a query in the database to store the experimentation set up. The simulations are streamed in chunks
+        and loaded with COPY in a single transaction. The primary key is created once all the simulations are loaded.
 
         Args:
-            simulations (DataFrame): configuration of all the simulations involving the experimentation
+            simulations (iterable): chunks (DataFrame) with the configuration of all the simulations involving the
+                                    experimentation
             max_simulation_id (int): the maximum simulation id stored in the database
             db_config_params (dict): contains the connection parameters of the database
 
+        Returns:
+            int: number of simulations stored
+
     """
-    # create database connection string
-    connection_str = 'postgresql+psycopg2://{0}:{1}@{2}:{3}/{4}'.format(db_config_params['user'],
-                                                                        db_config_params['password'],
-                                                                        db_config_params['host'],
-                                                                        db_config_params['port'],
-                                                                        db_config_params['database'])
+    table_name = 'experimentation_config'
+    n_simulations = 0
+    start_time = time.time()
+
+    # connect to the PostgreSQL server
+    conn = psycopg2.connect(**db_config_params)
+
+    try:
+        # create a cursor
+        cur = conn.cursor()
+
+        for chunk in simulations:
+            # create the table. If the table exists, the simulations are appended to the stored ones
+            if n_simulations == 0:
+                input_params_names = [col for col in chunk.columns if col not in ('simulation_id', 'label')]
+                cur.execute(generate_create_experimentation_config_table_sql(input_params_names))
+
+            # reset the IDs of the simulations
+            chunk['simulation_id'] = chunk['simulation_id'] + max_simulation_id + 1
+
+            copy_simulations_into_db(cur, chunk)
+            n_simulations += len(chunk)
+
+            elapsed_time = time.time() - start_time
+            print('\t{0} simulations stored ({1:.0f} rows/s)'.format(n_simulations, n_simulations / elapsed_time))
+
+        # set the column "simulation_id" as the primary key, unless it is already set
+        cur.execute("SELECT 1 FROM pg_index WHERE indrelid = to_regclass(%s) AND indisprimary", (table_name,))
+        if n_simulations > 0 and cur.fetchone() is None:
+            cur.execute('ALTER TABLE {0} ADD PRIMARY KEY (simulation_id);'.format(table_name))
+
+        # close the communication with the PostgreSQL
+        cur.close()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    elapsed_time = time.time() - start_time
+    print('{0} simulations stored in {1:.3f} seconds ({2:.0f} rows/s)'.format(n_simulations, elapsed_time,
+                                                                           n_simulations / max(elapsed_time, 1e-9)))
+
+    return n_simulations
+
 
-    pg_engine = create_engine(connection_str)
+def insert_experimentation_grid(parameter_grid, max_simulation_id, db_config_params):
+    """ Stores the definition of a parameter grid (implicit mode) instead of its simulations. The table
+        experimentation_config is created empty: the SEAs insert the simulations as they claim them.
+
+        Args:
+            parameter_grid (dict): contains the names of the input parameters in the order they are combined
+                                   ('param_names'), their values ('param_values'), their anomalous values
+                                   ('anomalous_values') and the number of simulations of the grid ('n_simulations')
+            max_simulation_id (int): the maximum simulation id stored in the database
+            db_config_params (dict): contains the connection parameters of the database
 
-    # reset the IDs of the simulations
-    index_list = list(range(max_simulation_id + 1, max_simulation_id + 1 + len(simulations)))
-    simulations['simulation_id'] = index_list
+        Returns:
+            int: identifier of the stored grid
 
-    # create the table. If the table exists, the simulations are appended to the stored ones
+    """
     table_name = 'experimentation_config'
-    simulations.to_sql(name=table_name, con=pg_engine, if_exists='append', index=False)
+    start_time = time.time()
+
+    create_grid_table_sql = 'CREATE TABLE IF NOT EXISTS experimentation_grid(' \
+                            '"grid_id" serial PRIMARY KEY,' \
+                            '"first_simulation_id" bigint NOT NULL,' \
+                            '"n_simulations" bigint NOT NULL,' \
+                            '"next_offset" bigint NOT NULL DEFAULT 0,' \
+                            '"param_names" text[] NOT NULL,' \
+                            '"param_values" jsonb NOT NULL,' \
+                            '"anomalous_values" jsonb NOT NULL)'
+
+    insert_grid_sql = 'INSERT INTO experimentation_grid' \
+                      '(first_simulation_id, n_simulations, param_names, param_values, anomalous_values) ' \
+                      'VALUES (%s, %s, %s, %s, %s) RETURNING grid_id'
+
+    # connect to the PostgreSQL server
+    conn = psycopg2.connect(**db_config_params)
 
-    # set the column "simulation_id" as the primary key
     try:
-        with pg_engine.connect() as con:
-            con.execute('ALTER TABLE {0} ADD PRIMARY KEY (simulation_id);'.format(table_name))
-    except (Exception, psycopg2.ProgrammingError):
-        pass
+        # create a cursor
+        cur = conn.cursor()
+
+        # create the tables, if they do not exist yet
+        cur.execute(generate_create_experimentation_config_table_sql(parameter_grid['param_names']))
+        cur.execute("SELECT 1 FROM pg_index WHERE indrelid = to_regclass(%s) AND indisprimary", (table_name,))
+        if cur.fetchone() is None:
+            cur.execute('ALTER TABLE {0} ADD PRIMARY KEY (simulation_id);'.format(table_name))
+        cur.execute(create_grid_table_sql)
+
+        # store the grid after the simulations already stored
+        cur.execute(insert_grid_sql, (max_simulation_id + 1, parameter_grid['n_simulations'],
+                                      list(parameter_grid['param_names']),
+                                      json.dumps(parameter_grid['param_values']),
+                                      json.dumps(parameter_grid['anomalous_values'])))
+        grid_id = cur.fetchone()[0]
+
+        # close the communication with the PostgreSQL
+        cur.close()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    print('Parameter grid {0} with {1} simulations stored in {2:.3f} seconds'.format(
+        grid_id, parameter_grid['n_simulations'], time.time() - start_time))
+
+    return grid_id
+
+
+def insert_solver_config(solver_config, db_config_params):
+    """ Stores the solver configuration of the experimentation. The SEAs use the last one stored, so it can be changed
+        without regenerating the experimentation.
+
+        Args:
+            solver_config (dict): contains the solver ('solver'), its tolerances ('rtol', 'atol'), its maximum step
+                                  ('max_step'), the number of communication points ('ncp') or the time between two
+                                  of them ('output_interval') and the final time of the simulations ('final_time').
+                                  The options not set take the defaults of the SEA
+            db_config_params (dict): contains the connection parameters of the database
+
+    """
+    create_solver_config_table_sql = 'CREATE TABLE IF NOT EXISTS solver_config(' \
+                                     '"solver_config_id" serial PRIMARY KEY,' \
+                                     '"solver" text,' \
+                                     '"rtol" double precision,' \
+                                     '"atol" double precision,' \
+                                     '"max_step" double precision,' \
+                                     '"ncp" integer,' \
+                                     '"output_interval" double precision,' \
+                                     '"final_time" double precision,' \
+                                     '"created_at" timestamptz DEFAULT current_timestamp)'
+
+    # tables created by previous versions lack the output interval
+    migrate_solver_config_table_sql = 'ALTER TABLE solver_config ADD COLUMN IF NOT EXISTS "output_interval" ' \
+                                      'double precision'
+
+    insert_solver_config_sql = 'INSERT INTO solver_config(solver, rtol, atol, max_step, ncp, output_interval, ' \
+                               'final_time) VALUES (%(solver)s, %(rtol)s, %(atol)s, %(max_step)s, %(ncp)s, ' \
+                               '%(output_interval)s, %(final_time)s)'
+
+    # connect to the PostgreSQL server
+    conn = psycopg2.connect(**db_config_params)
+
+    try:
+        cur = conn.cursor()
+        cur.execute(create_solver_config_table_sql)
+        cur.execute(migrate_solver_config_table_sql)
+        cur.execute(insert_solver_config_sql, {option: solver_config.get(option)
+                                               for option in ['solver', 'rtol', 'atol', 'max_step', 'ncp',
+                                                              'output_interval', 'final_time']})
+        cur.close()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    print('Solver configuration stored: {0}'.format(solver_config))
+
+
+def insert_stop_conditions(stop_conditions, db_config_params):
+    """ Stores the stop conditions of the experimentation. The SEAs use the last ones stored, so they can be changed
+        without regenerating the experimentation.
+
+        Args:
+            stop_conditions (list): contains a dict per stop condition with its name, its type ('threshold' or
+                                    'steady_state') and its settings
+            db_config_params (dict): contains the connection parameters of the database
+
+    """
+    create_stop_conditions_table_sql = 'CREATE TABLE IF NOT EXISTS stop_conditions(' \
+                                       '"stop_conditions_id" serial PRIMARY KEY,' \
+                                       '"conditions" jsonb,' \
+                                       '"created_at" timestamptz DEFAULT current_timestamp)'
+
+    insert_stop_conditions_sql = 'INSERT INTO stop_conditions(conditions) VALUES (%s)'
+
+    # connect to the PostgreSQL server
+    conn = psycopg2.connect(**db_config_params)
+
+    try:
+        cur = conn.cursor()
+        cur.execute(create_stop_conditions_table_sql)
+        cur.execute(insert_stop_conditions_sql, (json.dumps(stop_conditions),))
+        cur.close()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
 
 def get_max_simulation_id(db_config_params):
@@ -118,7 +381,15 @@ def get_max_simulation_id(db_config_params):
         # create a cursor
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-        get_max_simulation_id_sql = "select max(simulation_id) as max_simulation_id from experimentation_config"
+        # simulations of the parameter grids (implicit mode) are considered even if they are not inserted yet
+        get_max_simulation_id_sql = "select greatest(" \
+                                    "(select max(simulation_id) from experimentation_config), " \
+                                    "(select max(first_simulation_id + n_simulations - 1) " \
+                                    "from experimentation_grid)) as max_simulation_id"
+
+        cur.execute("select to_regclass('experimentation_grid') is not null as has_grids")
+        if not cur.fetchone()['has_grids']:
+            get_max_simulation_id_sql = "select max(simulation_id) as max_simulation_id from experimentation_config"
 
         # execute query
         cur.execute(get_max_simulation_id_sql)
@@ -140,3 +411,78 @@ def get_max_simulation_id(db_config_params):
         if conn is not None:
             conn.commit()
             conn.close()
+
+
+def get_simulation_timings_report(db_config_params, by_host=False):
+    """ Computes, for each experimentation of the database, the percentiles of the duration of each phase of its
+        simulations and the share of the time spent in the database (claim, insertion and state update) and in the
+        computation (the other phases). The experimentations are kept apart by schema, so every schema with a
+        simulation_timings table is reported. The phases are the *_time columns of the table
+
+        Args:
+            db_config_params (dict): contains the connection parameters of the database
+            by_host (bool): whether the share of the database time is also broken down per host
+
+        Returns:
+            list: contains a dict per experimentation with its schema ('experiment'), a dict per phase with its
+                  percentiles (p50, p90, p99), mean and number of samples ('phases') and a dict with the number of
+                  simulations, the database and compute times and the share of the database time for all the hosts
+                  (whose host is None) and, if by_host is set, for each host ('shares')
+    """
+    tables_sql = "SELECT table_schema, array_agg(column_name::text ORDER BY ordinal_position) AS columns " \
+                 "FROM information_schema.columns " \
+                 "WHERE table_name = 'simulation_timings' AND column_name LIKE '%\\_time' " \
+                 "GROUP BY table_schema ORDER BY table_schema"
+
+    conn = None
+    report = []
+    try:
+        # connect to the PostgreSQL server
+        conn = psycopg2.connect(**db_config_params)
+
+        # create a cursor
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+        cur.execute(tables_sql)
+        for schema, columns in [(row['table_schema'], row['columns']) for row in cur.fetchall()]:
+            table = psycopg2.sql.Identifier(schema, 'simulation_timings')
+            phases = [column[:-len('_time')] for column in columns]
+            db_columns = [psycopg2.sql.Identifier(phase + '_time') for phase in phases if phase in DB_PHASES]
+            compute_columns = [psycopg2.sql.Identifier(phase + '_time') for phase in phases if phase not in DB_PHASES]
+
+            percentiles_sql = psycopg2.sql.SQL(' UNION ALL ').join(
+                psycopg2.sql.SQL("SELECT {0} AS phase, "
+                                 "percentile_cont(0.5) WITHIN GROUP (ORDER BY {1}) AS p50, "
+                                 "percentile_cont(0.9) WITHIN GROUP (ORDER BY {1}) AS p90, "
+                                 "percentile_cont(0.99) WITHIN GROUP (ORDER BY {1}) AS p99, "
+                                 "avg({1}) AS mean, count({1}) AS samples "
+                                 "FROM {2}").format(psycopg2.sql.Literal(phase),
+                                                    psycopg2.sql.Identifier(phase + '_time'), table)
+                for phase in phases)
+            cur.execute(percentiles_sql)
+            phase_stats = cur.fetchall()
+
+            share_sql = psycopg2.sql.SQL("SELECT {0} AS host, count(*) AS simulations, "
+                                         "sum({1}) AS db_time, sum({2}) AS compute_time FROM {3} {4}").format(
+                psycopg2.sql.SQL('host' if by_host else 'NULL'),
+                psycopg2.sql.SQL(' + ').join(psycopg2.sql.SQL('coalesce({0}, 0)').format(column)
+                                             for column in db_columns or [psycopg2.sql.SQL('NULL')]),
+                psycopg2.sql.SQL(' + ').join(psycopg2.sql.SQL('coalesce({0}, 0)').format(column)
+                                             for column in compute_columns or [psycopg2.sql.SQL('NULL')]),
+                table,
+                psycopg2.sql.SQL('GROUP BY ROLLUP(host) ORDER BY host NULLS FIRST' if by_host else ''))
+            cur.execute(share_sql)
+            shares = cur.fetchall()
+            for share in shares:
+                total_time = (share['db_time'] or 0) + (share['compute_time'] or 0)
+                share['db_share'] = share['db_time'] / total_time if total_time else None
+
+            report.append({'experiment': schema, 'phases': phase_stats, 'shares': shares})
+
+        # close the communication with the PostgreSQL
+        cur.close()
+    finally:
+        if conn is not None:
+            conn.close()
+
+    return report
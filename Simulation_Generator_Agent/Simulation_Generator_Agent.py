@@ -1,16 +1,30 @@
+import os
+import sys
+import json
 import pandas as pd
 import numpy as np
 import urllib.request
 import shutil
 from pandas import read_json
 from argparse import ArgumentParser
-from itertools import product
 from pandas import DataFrame
-from Config_Loader import load_environment_variables
-from DB_Manager import execute_query, get_max_simulation_id, insert_generated_simulations_into_db, create_database
+from Config_Loader import load_environment_variables, get_experiment_schema
+from DB_Manager import execute_query, get_max_simulation_id, insert_generated_simulations_into_db, create_database, \
+    insert_experimentation_grid, get_simulation_timings_report, create_schema, drop_schema, insert_solver_config, \
+    insert_stop_conditions
+
+# the stop conditions are validated by the module of the SEA that applies them. It is copied next to the SGA in its
+# image and read from the SEA directory when the SGA is run from the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Simulation_Executor_Agent'))
+from Stop_conditions import StopConditions
 
 # hardcoded file names
-config_files = ['input_params.json', 'output_params.json', 'anomalous_params.json', 'experimentation_config.csv']
+config_files = ['input_params.json', 'output_params.json', 'anomalous_params.json', 'experimentation_config.csv',
+                'solver_config.json', 'stop_conditions.json']
+
+# options of the solver configuration and their types
+solver_config_options = {'solver': str, 'rtol': float, 'atol': float, 'max_step': float, 'ncp': int,
+                         'output_interval': float, 'final_time': float}
 
 
 def get_argument_parser():
@@ -28,6 +42,28 @@ def get_argument_parser():
     parser.add_argument("--output_params", help="file containing the name of output parameters")
     parser.add_argument("--anomalous_params", help="file containing which values make an anomalous simulation")
     parser.add_argument("--experimentation_config", help="file containing the entire experimentation configuration")
+    parser.add_argument("--solver_config", help="file containing the solver configuration of the simulations (solver, "
+                                                "rtol, atol, max_step, ncp, output_interval and final_time). It can "
+                                                "also be given with --migrate to change the solver of an existing "
+                                                "experimentation")
+    parser.add_argument("--stop_conditions", help="file containing the conditions over the output variables that stop "
+                                                  "a simulation before its final time (thresholds and steady states). "
+                                                  "It can also be given with --migrate")
+    parser.add_argument("--chunk_size", type=int, default=100000,
+                        help="number of simulations generated and stored at once (default: 100000)")
+    parser.add_argument("--migrate", action="store_true",
+                        help="only migrate the schema of an existing database and update its stored procedures")
+    parser.add_argument("--implicit", action="store_true",
+                        help="store only the definition of the parameter grid instead of every simulation. The "
+                             "configuration of each simulation is decoded from its id when it is executed (only "
+                             "with --input_params)")
+    parser.add_argument("--timing_report", nargs="?", const="experiment", choices=["experiment", "host"],
+                        help="only print, for each experimentation of the database, the percentiles of the duration "
+                             "of each phase of the simulations and the share of the time spent in the database. "
+                             "With 'host', the share is also broken down per host")
+    parser.add_argument("--drop_experiment", action="store_true",
+                        help="only remove the experimentation stored in the schema set by POSTGRESQL_SCHEMA, together "
+                             "with its results")
 
     return parser
 
@@ -49,19 +85,29 @@ def get_args(parser):
     output_params_file = args.output_params
     anomalous_params_file = args.anomalous_params
     experimentation_config_file = args.experimentation_config
+    solver_config_file = args.solver_config
+    stop_conditions_file = args.stop_conditions
+    chunk_size = args.chunk_size
+    implicit = args.implicit
+    migrate = args.migrate
+    timing_report = args.timing_report
+    drop_experiment = args.drop_experiment
 
     is_config_file = False
 
     # It is mandatory to set the input params file or the experimentation configuration file to configure the parameters
     # of the simulations. It is also mandatory to set the output params files. Anomalous params file is optional.
     # In case these requirements are not satisfied, the application will be exited
+    # The implicit mode is only available when the parameter grid is defined by the input params file.
     if url is not None:
         if input_params_file is not None or experimentation_config_file is not None:
             if output_params_file is not None:
-                is_config_file = True
+                is_config_file = not implicit or input_params_file is not None
 
-    if is_config_file:
-        return url, input_params_file, output_params_file, anomalous_params_file, experimentation_config_file
+    # No configuration file is required to migrate, report or remove an existing experimentation.
+    if is_config_file or migrate or timing_report or drop_experiment:
+        return url, input_params_file, output_params_file, anomalous_params_file, experimentation_config_file, \
+               solver_config_file, stop_conditions_file, chunk_size, implicit, migrate, timing_report, drop_experiment
     else:
         print('Not all arguments have been set. Use -h or --help flags to show help details')
         raise SystemExit(0)
@@ -88,15 +134,14 @@ def download_config_files(url, file_list):
     print("Download completed")
 
 
-def generate_all_simulation_combinations():
-    """ Generates all possible simulation configurations based on the input params file defined by the user.
+def get_input_params():
+    """ Reads the input params file defined by the user
 
         Returns:
-            DataFrame: contains all the generated simulations
-
+            list: names of the input parameters in the order they are combined
+            list: contains an array with the values of each input parameter
     """
     input_params = read_json('data/input_params.json')
-    input_params_names = sorted(list(input_params.columns))
 
     simulation_params = list()
 
@@ -105,74 +150,173 @@ def generate_all_simulation_combinations():
         values_col = np.array(input_params[col][0])
         simulation_params.append(values_col[~np.isnan(values_col)])
 
-    # generate all possible combinations and add the column "simulation_id"
-    simulation_combinations = pd.DataFrame(list(product(*simulation_params)), columns=input_params.columns)
-    simulation_combinations['simulation_id'] = simulation_combinations.index
+    return list(input_params.columns), simulation_params
 
-    # add timestamp_init, timestamp_end state and label columns and initialize them with default values
-    simulation_combinations['timestamp_init'] = ' '
-    simulation_combinations['timestamp_end'] = ' '
-    simulation_combinations['state'] = 'Not executed'
-    simulation_combinations['label'] = 0
+
+def generate_all_simulation_combinations(chunk_size=100000):
+    """ Generates all possible simulation configurations based on the input params file defined by the user. The
+        combinations are generated in chunks of fixed size, so the whole experimentation is never held in memory. Each
+        combination is obtained by mixed-radix decoding of its index, following the same order as itertools.product.
+
+        Args:
+            chunk_size (int): maximum number of simulations per chunk
+
+        Yields:
+            DataFrame: contains a chunk of the generated simulations
+
+    """
+    input_params_columns, simulation_params = get_input_params()
+    input_params_names = sorted(input_params_columns)
+
+    shape = tuple(len(values) for values in simulation_params)
+    n_simulations = int(np.prod(shape))
 
     # sort columns to match the schema of the database
-    sorted_cols = ['simulation_id', 'timestamp_init', 'timestamp_end'] \
-                  + input_params_names \
-                  + ['state', 'label']
+    sorted_cols = ['simulation_id'] + input_params_names + ['label']
 
-    simulation_combinations = simulation_combinations[sorted_cols]
+    for start in range(0, n_simulations, chunk_size):
+        simulation_ids = np.arange(start, min(start + chunk_size, n_simulations), dtype=np.int64)
 
-    return simulation_combinations
+        # generate the combinations of the chunk and add the column "simulation_id"
+        indexes = np.unravel_index(simulation_ids, shape)
+        simulation_combinations = pd.DataFrame({col: values[index] for col, values, index
+                                                in zip(input_params_columns, simulation_params, indexes)})
+        simulation_combinations['simulation_id'] = simulation_ids
 
+        # add the label column and initialize it with its default value
+        add_default_columns(simulation_combinations)
 
-def set_labels(simulations: DataFrame):
-    """ Sets the label to each simulation based on the anomalous params file defined by the user
+        yield simulation_combinations[sorted_cols]
+
+
+def add_default_columns(simulations: DataFrame):
+    """ Adds the label column to the simulations and initializes it with its default value. The timestamp_init,
+        timestamp_end and state columns are not added: they take their default values in the database
 
         Args:
-            simulations (DataFrame): contains all the generated simulations
+            simulations (DataFrame): contains a chunk of simulations
+    """
+    simulations['label'] = np.zeros(len(simulations), dtype=np.int32)
+
+
+def get_parameter_grid():
+    """ Defines the parameter grid of the experimentation based on the input params file defined by the user, without
+        generating its simulations. The simulation with index i is the i-th combination of the grid, following the same
+        order as generate_all_simulation_combinations.
 
         Returns:
-            DataFrame: contains all the generated simulations with it corresponding label
+            dict: contains the names of the input parameters in the order they are combined ('param_names'), their
+                  values ('param_values') and the number of simulations of the grid ('n_simulations')
 
     """
+    input_params_columns, simulation_params = get_input_params()
+
+    return {'param_names': input_params_columns,
+            'param_values': [values.tolist() for values in simulation_params],
+            'n_simulations': int(np.prod([len(values) for values in simulation_params]))}
+
+
+def get_solver_config():
+    """ Reads the solver config file defined by the user
+
+        Returns:
+            dict: contains the value of each option of the solver configuration that is set
+    """
+    with open('data/solver_config.json') as f:
+        solver_config = json.load(f)
+
+    # the file follows the format of the other config files: a list with a single object
+    if isinstance(solver_config, list):
+        solver_config = solver_config[0]
+
+    unknown_options = set(solver_config) - set(solver_config_options)
+    if unknown_options:
+        raise ValueError('Unknown solver options: {0}'.format(', '.join(sorted(unknown_options))))
+
+    return {option: solver_config_options[option](value) for option, value in solver_config.items()
+            if value is not None}
+
+
+def get_stop_conditions():
+    """ Reads the stop conditions file defined by the user. They are validated as the SEAs do before applying them,
+        so invalid conditions are not stored
+
+        Returns:
+            list: contains a dict per stop condition
+
+        Raises:
+            ValueError: a condition is not valid
+    """
+    with open('data/stop_conditions.json') as f:
+        stop_conditions = json.load(f)
+
+    StopConditions(stop_conditions)
+
+    return stop_conditions
+
+
+def get_anomalous_params():
+    """ Reads the anomalous params file defined by the user
+
+        Returns:
+            dict: contains the anomalous values of each input parameter
+    """
     anomalous_params = read_json('data/anomalous_params.json')
 
-    # set label=1 if any of the simulations contains an anomalous value
+    anomalous_values = dict()
     for col in anomalous_params.columns:
         values_col = np.array(anomalous_params[col][0])
-        values_col = values_col[~np.isnan(values_col)]
+        anomalous_values[col] = values_col[~np.isnan(values_col)]
+
+    return anomalous_values
+
+
+def set_labels(simulations: DataFrame, anomalous_params):
+    """ Sets the label to each simulation based on the anomalous params file defined by the user
+
+        Args:
+            simulations (DataFrame): contains a chunk of the generated simulations
+            anomalous_params (dict): contains the anomalous values of each input parameter (see get_anomalous_params)
+
+        Returns:
+            DataFrame: contains the chunk of the generated simulations with it corresponding label
+
+    """
+    # set label=1 if any of the simulations contains an anomalous value
+    for col, values_col in anomalous_params.items():
         simulations.loc[simulations[col].isin(values_col), "label"] = 1
 
     return simulations
 
 
-def get_experimentation_config_from_csv():
+def get_experimentation_config_from_csv(chunk_size=100000):
     """ Defines the experimentation set up based on the configuration file specified by the user. In this case, no
-        simulations are generated as the configuration of each simulation is already given by the user.
+        simulations are generated as the configuration of each simulation is already given by the user. The file is
+        read in chunks of fixed size.
 
-        Returns:
-            DataFrame: contains the experimentation configuration specified by the user
+        Args:
+            chunk_size (int): maximum number of simulations per chunk
+
+        Yields:
+            DataFrame: contains a chunk of the experimentation configuration specified by the user
 
     """
     # TODO: manage the label column. The user may or not set it.
-    experimentation_config = pd.read_csv('data/experimentation_config.csv')
-    input_params_names = sorted(list(experimentation_config.columns))
-
-    # add timestamp_init, timestamp_end state and label columns and initialize them with default values
-    experimentation_config['simulation_id'] = experimentation_config.index
-    experimentation_config['timestamp_init'] = ' '
-    experimentation_config['timestamp_end'] = ' '
-    experimentation_config['state'] = 'Not executed'
-    experimentation_config['label'] = 0
+    first_simulation_id = 0
+    for experimentation_config in pd.read_csv('data/experimentation_config.csv', chunksize=chunk_size):
+        input_params_names = sorted(list(experimentation_config.columns))
 
-    # sort columns to match the schema of the database
-    sorted_cols = ['simulation_id', 'timestamp_init', 'timestamp_end'] \
-                  + input_params_names \
-                  + ['state', 'label']
+        # add simulation_id and label columns and initialize them with default values
+        experimentation_config['simulation_id'] = np.arange(first_simulation_id,
+                                                            first_simulation_id + len(experimentation_config),
+                                                            dtype=np.int64)
+        add_default_columns(experimentation_config)
+        first_simulation_id += len(experimentation_config)
 
-    experimentation_config = experimentation_config[sorted_cols]
+        # sort columns to match the schema of the database
+        sorted_cols = ['simulation_id'] + input_params_names + ['label']
 
-    return experimentation_config
+        yield experimentation_config[sorted_cols]
 
 
 def generate_create_simulations_result_table_sql():
@@ -187,7 +331,7 @@ def generate_create_simulations_result_table_sql():
     output_params = read_json('data/output_params.json')
     output_params = sorted(list(output_params['params'][0]))
 
-    initial_create_table_sql = 'CREATE TABLE simulation_results("simulation_id" integer ' \
+    initial_create_table_sql = 'CREATE TABLE simulation_results("simulation_id" bigint ' \
                                'REFERENCES experimentation_config(simulation_id),' \
                                '"sea_id" text,' \
                                '"execution_time" real,' \
@@ -208,32 +352,249 @@ def generate_create_simulations_failures_registry_table_sql():
             str: SQL statement containing the query to create the table
 
     """
-    create_table_sql = 'CREATE TABLE simulation_failure_registry("simulation_id" integer ' \
+    create_table_sql = 'CREATE TABLE simulation_failure_registry("simulation_id" bigint ' \
                        'REFERENCES experimentation_config(simulation_id),' \
-                       '"failure_timestamp" text,' \
+                       '"failure_timestamp" timestamptz,' \
                        '"sea_id" text,' \
                        '"failure_description" text)'
 
     return create_table_sql
 
 
-def generate_stored_procedure_get_simulation_config():
-    """ Generates an SQL statement to create a stored procedure used to obtain the configuration of the next simulation
-        to be executed. The stored procedure returns the configuration of the first found non executed simulation,
-        if any.
+def generate_create_simulation_timings_table_sql():
+    """ Generates an SQL statement to create a table on the database where the durations (in seconds) of the phases
+        of each simulation are stored by the SEAs, if it does not exist yet. It is not referenced by the other tables,
+        so storing the timings does not slow down the simulations.
+
+        Returns:
+            str: SQL statement containing the query to create the table
+
+    """
+    create_table_sql = 'CREATE TABLE IF NOT EXISTS simulation_timings("simulation_id" bigint,' \
+                       '"sea_id" text,' \
+                       '"host" text,' \
+                       '"claim_time" real,' \
+                       '"setup_time" real,' \
+                       '"initialize_time" real,' \
+                       '"integrate_time" real,' \
+                       '"encode_time" real,' \
+                       '"insert_time" real,' \
+                       '"state_update_time" real,' \
+                       '"recorded_at" timestamptz DEFAULT current_timestamp)'
+
+    return create_table_sql
+
+
+def generate_create_result_cache_table_sql():
+    """ Generates an SQL statement to create the result cache shared by every experimentation of the database, if it
+        does not exist yet. It is stored in the public schema, so experimentations stored in their own schema share
+        it. Each entry is keyed by the SHA-256 of the FMU, the hash of the parameter set and the hash of the solver
+        settings, and keeps the encoded results of every recorded variable together with its number of hits.
+
+        Returns:
+            str: SQL statement containing the query to create the table
+
+    """
+    create_table_sql = 'CREATE TABLE IF NOT EXISTS public.simulation_result_cache("fmu_sha256" text,' \
+                       '"solver_hash" text,' \
+                       '"parameters_hash" text,' \
+                       '"parameters" jsonb,' \
+                       '"output_names" text[],' \
+                       '"outputs" bytea[],' \
+                       '"hits" integer NOT NULL DEFAULT 0,' \
+                       '"created_at" timestamptz DEFAULT current_timestamp,' \
+                       '"last_used_at" timestamptz DEFAULT current_timestamp,' \
+                       'PRIMARY KEY (fmu_sha256, solver_hash, parameters_hash))'
+
+    return create_table_sql
+
+
+def generate_create_simulation_stops_table_sql():
+    """ Generates an SQL statement to create a table on the database where the SEAs record the simulations stopped
+        by a stop condition, if it does not exist yet. Each simulation keeps the name of the condition met and the
+        time at which it was stopped.
+
+        Returns:
+            str: SQL statement containing the query to create the table
+
+    """
+    create_table_sql = 'CREATE TABLE IF NOT EXISTS simulation_stops("simulation_id" bigint PRIMARY KEY,' \
+                       '"stop_reason" text,' \
+                       '"stop_time" double precision,' \
+                       '"sea_id" text,' \
+                       '"recorded_at" timestamptz DEFAULT current_timestamp)'
+
+    return create_table_sql
+
+
+def print_timing_report(db_config_params, by_host=False):
+    """ Prints, for each experimentation of the database, the percentiles of the duration of each phase of its
+        simulations and the share of the time spent in the database, which tells whether the experimentation is bound
+        by the database or by the computation
+
+        Args:
+            db_config_params (dict): contains the connection parameters of the database
+            by_host (bool): whether the share of the database time is also broken down per host
+    """
+    for experiment in get_simulation_timings_report(db_config_params, by_host):
+        print('Experimentation {0}'.format(experiment['experiment']))
+        print('Duration of the phases of the simulations (seconds):')
+        print('\t{0:<14}{1:>10}{2:>10}{3:>10}{4:>10}{5:>10}'.format('phase', 'p50', 'p90', 'p99', 'mean', 'samples'))
+        for stats in experiment['phases']:
+            if not stats['samples']:
+                continue
+            print('\t{0:<14}{1:>10.4f}{2:>10.4f}{3:>10.4f}{4:>10.4f}{5:>10}'.format(
+                stats['phase'], stats['p50'], stats['p90'], stats['p99'], stats['mean'], stats['samples']))
+
+        print('Database vs compute time:')
+        print('\t{0:<24}{1:>12}{2:>14}{3:>14}{4:>10}'.format('host', 'simulations', 'db time', 'compute time',
+                                                                'db share'))
+        for share in experiment['shares']:
+            if share['db_share'] is None:
+                continue
+            print('\t{0:<24}{1:>12}{2:>14.2f}{3:>14.2f}{4:>9.1f}%'.format(
+                share['host'] if share['host'] is not None else 'all', share['simulations'], share['db_time'],
+                share['compute_time'], 100 * share['db_share']))
+
+
+def generate_create_simulation_state_type_sql():
+    """ Generates an SQL statement to create the enumerated type used to store the state of the simulations, if it
+        does not exist yet.
+
+        Returns:
+            str: SQL statement containing the query to create the type
+
+    """
+    sql = r"""
+        DO $$
+        BEGIN
+            IF to_regtype('simulation_state') IS NULL THEN
+                CREATE TYPE simulation_state AS ENUM ('Not executed', 'Executing', 'Executed', 'Failed');
+            END IF;
+        END;
+        $$;
+    """
+    return sql
+
+
+def generate_create_experimentation_config_indexes_sql():
+    """ Generates an SQL statement to create the partial indexes used to find the simulations to be executed or
+        recovered. Only the simulations in the corresponding state are indexed, so the indexes stay small and the cost
+        of claiming a simulation does not grow with the number of executed simulations.
+
+        Returns:
+            str: SQL statement containing the query to create the indexes
+
+    """
+    sql = r"""
+        CREATE INDEX IF NOT EXISTS experimentation_config_pending_idx ON experimentation_config (simulation_id)
+            WHERE state = 'Not executed';
+        CREATE INDEX IF NOT EXISTS experimentation_config_executing_idx ON experimentation_config (timestamp_init)
+            WHERE state = 'Executing';
+        CREATE INDEX IF NOT EXISTS experimentation_config_failed_idx ON experimentation_config (simulation_id)
+            WHERE state = 'Failed';
+        CREATE INDEX IF NOT EXISTS experimentation_config_lease_idx ON experimentation_config (lease_expires_at)
+            WHERE state = 'Executing';
+        CREATE INDEX IF NOT EXISTS experimentation_config_predicted_runtime_idx
+            ON experimentation_config (predicted_runtime DESC NULLS LAST, simulation_id)
+            WHERE state = 'Not executed';
+    """
+    return sql
+
+
+def generate_migrate_experimentation_config_sql():
+    """ Generates an SQL statement to migrate databases created by previous versions of the SGA, where the state was
+        stored as text and the timestamps as 'YYYY/MM/DD HH24:MI:SS' text (' ' when not set). The state is converted to
+        the simulation_state type and the timestamps to timestamptz (NULL when not set). The failure_count column is
+        added and filled from the failure registry, and the lease_expires_at and predicted_runtime columns are added.
+        Databases already migrated are not modified.
+
+        Returns:
+            str: SQL statement containing the query to migrate the database
+
+    """
+    sql = r"""
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name = 'experimentation_config' AND table_schema = current_schema()
+                       AND column_name = 'state' AND data_type = 'text') THEN
+                ALTER TABLE experimentation_config
+                    ALTER COLUMN state TYPE simulation_state USING state::simulation_state,
+                    ALTER COLUMN state SET DEFAULT 'Not executed',
+                    ALTER COLUMN state SET NOT NULL,
+                    ALTER COLUMN timestamp_init TYPE timestamptz
+                        USING to_timestamp(NULLIF(trim(timestamp_init), ''), 'YYYY/MM/DD HH24:MI:SS'),
+                    ALTER COLUMN timestamp_end TYPE timestamptz
+                        USING to_timestamp(NULLIF(trim(timestamp_end), ''), 'YYYY/MM/DD HH24:MI:SS'),
+                    ALTER COLUMN label SET DEFAULT 0;
+            END IF;
+
+            IF to_regclass('experimentation_config') IS NOT NULL
+               AND NOT EXISTS (SELECT 1 FROM information_schema.columns
+                               WHERE table_name = 'experimentation_config' AND table_schema = current_schema()
+                               AND column_name = 'failure_count') THEN
+                ALTER TABLE experimentation_config ADD COLUMN failure_count integer NOT NULL DEFAULT 0;
+
+                IF to_regclass('simulation_failure_registry') IS NOT NULL THEN
+                    UPDATE experimentation_config AS a
+                        SET failure_count = f.n_failures
+                        FROM (SELECT simulation_id, count(*) AS n_failures FROM simulation_failure_registry
+                              GROUP BY simulation_id) AS f
+                        WHERE a.simulation_id = f.simulation_id;
+                END IF;
+            END IF;
+
+            IF to_regclass('experimentation_config') IS NOT NULL THEN
+                ALTER TABLE experimentation_config ADD COLUMN IF NOT EXISTS lease_expires_at timestamptz;
+                ALTER TABLE experimentation_config ADD COLUMN IF NOT EXISTS predicted_runtime real;
+            END IF;
+
+            IF EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name = 'simulation_failure_registry' AND table_schema = current_schema()
+                       AND column_name = 'failure_timestamp' AND data_type = 'text') THEN
+                ALTER TABLE simulation_failure_registry
+                    ALTER COLUMN failure_timestamp TYPE timestamptz
+                        USING to_timestamp(NULLIF(trim(failure_timestamp), ''), 'YYYY/MM/DD HH24:MI:SS');
+            END IF;
+        END;
+        $$;
+    """
+    return sql
+
+
+def generate_stored_procedure_lease_simulation_configs():
+    """ Generates an SQL statement to create a stored procedure used to lease a batch of simulations in a single round
+        trip. Rows already locked by other agents are skipped (SKIP LOCKED), so concurrent agents do not queue up on
+        the same simulation_id. The leased simulations are marked as 'Executing' and returned. The lease expires after
+        lease_duration seconds unless the agent renews it. The simulations with the longest predicted runtime are
+        leased first; those without prediction are leased afterwards in order of their id, which is the order of every
+        simulation when no SEA predicts their runtime.
+
+        Executing simulations whose lease expired, i.e. whose agent stopped renewing it, are leased again together with
+        the pending ones, so they are not left waiting until search_failed_simulations resets them.
 
         Returns:
             str: SQL statement containing the query to create the stored procedure
 
     """
     sql = r"""
-        CREATE OR REPLACE FUNCTION get_next_simulation_config() RETURNS SETOF experimentation_config AS $$ 
-        DECLARE
-            simulation_row experimentation_config%rowtype;
+        DROP FUNCTION IF EXISTS lease_simulation_configs(integer);
+        CREATE OR REPLACE FUNCTION lease_simulation_configs(lease_size integer, lease_duration integer DEFAULT 60) RETURNS SETOF experimentation_config AS $$
         BEGIN
-            SELECT * INTO simulation_row FROM experimentation_config WHERE state = 'Not executed' ORDER BY simulation_id LIMIT 1 FOR UPDATE;
-            UPDATE experimentation_config SET timestamp_init= to_char(current_timestamp, 'YYYY/MM/DD HH24:MI:SS'), state='Executing' where simulation_id = simulation_row.simulation_id; 
-            RETURN QUERY SELECT * FROM experimentation_config WHERE simulation_id = simulation_row.simulation_id; 
+            RETURN QUERY
+            UPDATE experimentation_config AS a
+                SET timestamp_init = current_timestamp,
+                    lease_expires_at = current_timestamp + lease_duration * interval '1 second',
+                    state = 'Executing'
+                FROM (SELECT simulation_id FROM experimentation_config
+                      WHERE state = 'Not executed'
+                      OR (state = 'Executing' AND timestamp_end IS NULL AND lease_expires_at < current_timestamp)
+                      ORDER BY predicted_runtime DESC NULLS LAST, simulation_id
+                      LIMIT lease_size
+                      FOR UPDATE SKIP LOCKED) AS b
+                WHERE a.simulation_id = b.simulation_id
+                RETURNING a.*;
         END;
         $$ LANGUAGE plpgsql;
     """
@@ -243,79 +604,199 @@ def generate_stored_procedure_get_simulation_config():
 def generate_stored_procedure_search_failed_simulations():
     """ Generates an SQL statement to create a stored procedure used to search for failed simulations. If failed
         simulations are found, they are reset provided that they meet the corresponding requirements. It returns
-        True in case any simulation is reset.
+        True in case any simulation is pending to be executed.
+
+        No table lock is taken: the simulations to be reset are locked row by row, skipping those locked by other
+        agents, and at most batch_size simulations of each kind are reset per call. The number of failures of each
+        simulation is read from its failure_count column instead of counting its failure registries.
+
+        Executing simulations are reset when their lease expires, i.e. when the agent executing them stopped renewing
+        it. Simulations leased without expiry (by previous versions of the SEA) are reset after time_out minutes.
 
         Returns:
             str: SQL statement containing the query to create the stored procedure
 
     """
     sql = r"""
-        CREATE OR REPLACE FUNCTION search_failed_simulations(max_failures_in integer, time_out integer) RETURNS boolean AS $$
-        DECLARE
-            timestamp_with_delay text;
-            n_reset_simulations integer;
+        DROP FUNCTION IF EXISTS search_failed_simulations(integer, integer);
+        CREATE OR REPLACE FUNCTION search_failed_simulations(max_failures_in integer, time_out integer,
+                                                             batch_size integer DEFAULT 1000) RETURNS boolean AS $$
         BEGIN
-            LOCK TABLE experimentation_config IN ACCESS EXCLUSIVE MODE;
-            UPDATE experimentation_config as a 
-                SET state='Not executed', timestamp_init = ' '
-                WHERE a.state = 'Failed'
-                AND (select count(simulation_id) from simulation_failure_registry where simulation_id = a.simulation_id) < max_failures_in;
-
-            SELECT to_char(current_timestamp - (time_out * interval '1 minute'), 'YYYY/MM/DD HH24:MI:SS') INTO timestamp_with_delay;
-
-            UPDATE experimentation_config
-                SET state='Not executed', timestamp_init = ' '
-                WHERE state = 'Executing'
-                AND timestamp_end = ' '
-                AND timestamp_init < timestamp_with_delay;
-
-            SELECT COUNT(*) INTO n_reset_simulations FROM experimentation_config WHERE state='Not executed';
-
-            IF n_reset_simulations > 0 THEN
-                RETURN True;
-            ELSE
-                RETURN False;
-            END IF;
+            UPDATE experimentation_config AS a
+                SET state = 'Not executed', timestamp_init = NULL
+                FROM (SELECT simulation_id FROM experimentation_config
+                      WHERE state = 'Failed'
+                      AND failure_count < max_failures_in
+                      ORDER BY simulation_id
+                      LIMIT batch_size
+                      FOR UPDATE SKIP LOCKED) AS b
+                WHERE a.simulation_id = b.simulation_id;
+
+            UPDATE experimentation_config AS a
+                SET state = 'Not executed', timestamp_init = NULL, lease_expires_at = NULL
+                FROM (SELECT simulation_id FROM experimentation_config
+                      WHERE state = 'Executing'
+                      AND timestamp_end IS NULL
+                      AND lease_expires_at < current_timestamp
+                      ORDER BY lease_expires_at
+                      LIMIT batch_size
+                      FOR UPDATE SKIP LOCKED) AS b
+                WHERE a.simulation_id = b.simulation_id;
+
+            UPDATE experimentation_config AS a
+                SET state = 'Not executed', timestamp_init = NULL
+                FROM (SELECT simulation_id FROM experimentation_config
+                      WHERE state = 'Executing'
+                      AND timestamp_end IS NULL
+                      AND lease_expires_at IS NULL
+                      AND timestamp_init < current_timestamp - (time_out * interval '1 minute')
+                      ORDER BY timestamp_init
+                      LIMIT batch_size
+                      FOR UPDATE SKIP LOCKED) AS b
+                WHERE a.simulation_id = b.simulation_id;
+
+            RETURN EXISTS (SELECT 1 FROM experimentation_config WHERE state = 'Not executed');
         END;
         $$ LANGUAGE plpgsql;
     """
     return sql
 
 
+def generate_stored_procedure_claim_grid_simulations():
+    """ Generates an SQL statement to create a stored procedure used to claim a block of consecutive simulations of a
+        parameter grid (implicit mode). The progress of each grid is a single counter, so claiming a block only updates
+        one row. It returns the claimed grid and the range [start, end) of the claimed simulations within the grid, if
+        any simulation is pending.
+
+        Returns:
+            str: SQL statement containing the query to create the stored procedure
+
+    """
+    sql = r"""
+        CREATE OR REPLACE FUNCTION claim_grid_simulations(claim_size integer)
+        RETURNS TABLE(claimed_grid_id integer, claimed_first_simulation_id bigint, claimed_start bigint, claimed_end bigint) AS $$
+        BEGIN
+            RETURN QUERY
+            UPDATE experimentation_grid AS g
+                SET next_offset = LEAST(g.next_offset + claim_size, g.n_simulations)
+                FROM (SELECT e.grid_id, e.next_offset FROM experimentation_grid e
+                      WHERE e.next_offset < e.n_simulations
+                      ORDER BY e.grid_id
+                      LIMIT 1
+                      FOR UPDATE) AS b
+                WHERE g.grid_id = b.grid_id
+                RETURNING g.grid_id, g.first_simulation_id, b.next_offset, g.next_offset;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+    return sql
+
+
+def create_stored_procedures(db_config_params):
+    """ Creates or updates the stored procedures used by the SEAs
+
+        Args:
+            db_config_params (dict): contains the connection parameters of the database
+    """
+    lease_simulation_configs_query = generate_stored_procedure_lease_simulation_configs()
+    search_failed_simulations_query = generate_stored_procedure_search_failed_simulations()
+
+    # apply the stored procedures
+    execute_query(db_config_params, lease_simulation_configs_query)
+    execute_query(db_config_params, search_failed_simulations_query)
+    execute_query(db_config_params, generate_stored_procedure_claim_grid_simulations())
+
+
 def main():
     try:
         # create an argument parser
         parser = get_argument_parser()
 
         # read the arguments
-        url, input_params_file, output_params_file, anomalous_params_file, experimentation_config_file = get_args(
-            parser)
-
-        # download configuration files
-        download_config_files(url, [input_params_file, output_params_file, anomalous_params_file,
-                                    experimentation_config_file])
+        url, input_params_file, output_params_file, anomalous_params_file, experimentation_config_file, \
+            solver_config_file, stop_conditions_file, chunk_size, implicit, migrate, timing_report, \
+            drop_experiment = get_args(parser)
 
         # load environment variables required for the execution
         db_config_params = load_environment_variables()
 
-        # generate the experimentation set up
-        if input_params_file is not None:
+        # schema of the experimentation, if it is not stored in the default one
+        schema = get_experiment_schema()
+
+        if drop_experiment:
+            if schema is None:
+                raise SystemExit('POSTGRESQL_SCHEMA must be set to remove an experimentation')
+            drop_schema(db_config_params, schema)
+            print('Experimentation {0} removed'.format(schema))
+            return
+
+        if timing_report:
+            print_timing_report(db_config_params, timing_report == 'host')
+            return
+
+        if migrate:
+            if schema is not None:
+                create_schema(db_config_params, schema)
+            # migrate the schema of the existing database and update its stored procedures
+            execute_query(db_config_params, generate_create_simulation_state_type_sql())
+            execute_query(db_config_params, generate_migrate_experimentation_config_sql())
+            execute_query(db_config_params, generate_create_experimentation_config_indexes_sql())
+            execute_query(db_config_params, generate_create_simulation_timings_table_sql())
+            execute_query(db_config_params, generate_create_result_cache_table_sql())
+            execute_query(db_config_params, generate_create_simulation_stops_table_sql())
+            create_stored_procedures(db_config_params)
+            if url is not None and (solver_config_file is not None or stop_conditions_file is not None):
+                download_config_files(url, [None, None, None, None, solver_config_file, stop_conditions_file])
+                if solver_config_file is not None:
+                    insert_solver_config(get_solver_config(), db_config_params)
+                if stop_conditions_file is not None:
+                    insert_stop_conditions(get_stop_conditions(), db_config_params)
+            print('The database has been migrated successfully')
+            return
+
+        # download configuration files
+        download_config_files(url, [input_params_file, output_params_file, anomalous_params_file,
+                                    experimentation_config_file, solver_config_file, stop_conditions_file])
+
+        # generate the experimentation set up. The simulations are generated in chunks while they are stored
+        if implicit:
+            # only the definition of the grid is stored
+            parameter_grid = get_parameter_grid()
+            parameter_grid['anomalous_values'] = dict()
+            if anomalous_params_file is not None:
+                parameter_grid['anomalous_values'] = {col: values.tolist()
+                                                      for col, values in get_anomalous_params().items()}
+        elif input_params_file is not None:
             # generate all possible simulation combinations
-            experimentation_config = generate_all_simulation_combinations()
+            experimentation_config = generate_all_simulation_combinations(chunk_size)
             if anomalous_params_file is not None:
-                # set label to the simulations
-                experimentation_config = set_labels(experimentation_config)
+                # set label to the simulations. The anomalous values are read once and shared by every chunk
+                anomalous_params = get_anomalous_params()
+                experimentation_config = (set_labels(chunk, anomalous_params) for chunk in experimentation_config)
         else:
-            experimentation_config = get_experimentation_config_from_csv()
+            experimentation_config = get_experimentation_config_from_csv(chunk_size)
 
-        # create the database
+        # create the database and the schema of the experimentation
         create_database(db_config_params)
+        if schema is not None:
+            create_schema(db_config_params, schema)
+
+        # create the type of the state of the simulations and migrate databases created by previous versions
+        execute_query(db_config_params, generate_create_simulation_state_type_sql())
+        execute_query(db_config_params, generate_migrate_experimentation_config_sql())
 
         # get max simulation id to correctly assign the index to new generated simulations
         max_simulation_id = get_max_simulation_id(db_config_params)
 
-        # insert generated simulations into the database
-        insert_generated_simulations_into_db(experimentation_config, max_simulation_id, db_config_params)
+        if implicit:
+            # store the parameter grid. Its simulations are inserted by the SEAs as they are claimed
+            insert_experimentation_grid(parameter_grid, max_simulation_id, db_config_params)
+        else:
+            # insert generated simulations into the database
+            insert_generated_simulations_into_db(experimentation_config, max_simulation_id, db_config_params)
+
+        # create the indexes used to find the simulations to be executed
+        execute_query(db_config_params, generate_create_experimentation_config_indexes_sql())
 
         # create a SQL table to store simulation results
         create_table_query = generate_create_simulations_result_table_sql()
@@ -325,13 +806,25 @@ def main():
         create_table_query = generate_create_simulations_failures_registry_table_sql()
         execute_query(db_config_params, create_table_query)
 
+        # create a SQL table to store the durations of the phases of the simulations
+        execute_query(db_config_params, generate_create_simulation_timings_table_sql())
+
+        # create the result cache shared by the experimentations
+        execute_query(db_config_params, generate_create_result_cache_table_sql())
+
+        # create a SQL table to record the simulations stopped by a stop condition
+        execute_query(db_config_params, generate_create_simulation_stops_table_sql())
+
         # create stored procedures
-        get_simulation_params_query = generate_stored_procedure_get_simulation_config()
-        search_failed_simulations_query = generate_stored_procedure_search_failed_simulations()
+        create_stored_procedures(db_config_params)
+
+        # store the solver configuration of the simulations, if it is given
+        if solver_config_file is not None:
+            insert_solver_config(get_solver_config(), db_config_params)
 
-        # apply the stored procedures
-        execute_query(db_config_params, get_simulation_params_query)
-        execute_query(db_config_params, search_failed_simulations_query)
+        # store the stop conditions of the simulations, if they are given
+        if stop_conditions_file is not None:
+            insert_stop_conditions(get_stop_conditions(), db_config_params)
     except Exception as error:
         print(error)
     else: